@@ -0,0 +1,251 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Bills are claimed for analysis for this long; workers renew the lease while
+# they work, so only a crashed worker's bills are picked up by others
+QUEUE_LEASE_SECONDS = float(os.environ.get("QUEUE_LEASE_SECONDS", "300"))
+# Failed analyses are retried until they have been attempted this many times
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("QUEUE_MAX_ATTEMPTS", "3"))
+# Longest an idle worker waits before looking for work again
+QUEUE_POLL_SECONDS = float(os.environ.get("QUEUE_POLL_SECONDS", "5"))
+
+# Bill changes that may make work available
+WORK_EVENTS_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+CLAIM_FIELDS = {"_id": 0, "id": 1, "path": 1, "analysis_attempts": 1, "lease_owner": 1}
+
+
+def worker_id() -> str:
+    """Identify this worker process in lease_owner."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class AnalysisQueue:
+    """
+    Work queue of bills waiting for analysis, kept on the bills collection
+    itself so several worker processes can share it.
+
+    A bill is claimed atomically by moving its analysis_status from unset or
+    "pending" to "processing" with a lease_owner and lease_expires_at. When
+    the analysis is saved (oai_client.save_analysis sets analysis_status to
+    "analyzed") the lease is released; failures go back to "pending" until
+    QUEUE_MAX_ATTEMPTS, then to "failed". Bills whose lease expired are
+    claimed again; the worker that lost the lease does not save its analysis
+    (see oai_client.save_analysis). Re-uploads (duplicate_of set) are never
+    queued, they get the analysis of their canonical bill, and neither are
+    bills analyzed before analysis_status existed (analysis or analysis_ref
+    set without it).
+    """
+
+    def __init__(
+        self,
+        collection: Any,
+        owner: Optional[str] = None,
+        lease_seconds: float = QUEUE_LEASE_SECONDS,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        poll_seconds: float = QUEUE_POLL_SECONDS,
+    ):
+        self.collection = collection
+        self.owner = owner or worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._indexes_ready = False
+        self._change_streams = True
+
+    def ensure_indexes(self) -> None:
+        """Index the claimable states, oldest upload first, and expiring leases."""
+        if self._indexes_ready:
+            return
+        self.collection.create_index([("analysis_status", 1), ("uploaded_at", 1)])
+        self.collection.create_index([("analysis_status", 1), ("lease_expires_at", 1)])
+        self._indexes_ready = True
+
+    def _claimable(self, now: datetime) -> Dict[str, Any]:
+        return {
+            "duplicate_of": {"$exists": False},
+            "analysis": {"$exists": False},
+            "analysis_ref": {"$exists": False},
+            "$or": [
+                {"analysis_status": {"$in": [None, "pending"]}},
+                {"analysis_status": "processing", "lease_expires_at": {"$lt": now}},
+            ],
+        }
+
+    def sample(self, size: int) -> List[str]:
+        """Ids of up to size random claimable bills, drawn server-side with $sample."""
+        self.ensure_indexes()
+        pipeline = [
+            {"$match": self._claimable(datetime.now())},
+            {"$sample": {"size": size}},
+            {"$project": {"_id": 0, "id": 1}},
+        ]
+        return [document["id"] for document in self.collection.aggregate(pipeline)]
+
+    def claim(self, bill_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Claim the oldest waiting bill, or the given bill if it is waiting.
+
+        Returns:
+            The claimed bill's id, path and analysis_attempts, or None if
+            there is no work (or someone else holds the bill)
+        """
+        from pymongo import ReturnDocument
+
+        self.ensure_indexes()
+        now = datetime.now()
+        query = self._claimable(now)
+        if bill_id is not None:
+            query["id"] = bill_id
+        return self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "analysis_status": "processing",
+                    "lease_owner": self.owner,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "claimed_at": now,
+                },
+                "$inc": {"analysis_attempts": 1},
+            },
+            projection=CLAIM_FIELDS,
+            sort=[("uploaded_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def renew(self, bill_id: str) -> bool:
+        """Extend this worker's lease on a bill, False if the lease was lost."""
+        result = self.collection.update_one(
+            {"id": bill_id, "lease_owner": self.owner, "analysis_status": "processing"},
+            {"$set": {"lease_expires_at": datetime.now() + timedelta(seconds=self.lease_seconds)}},
+        )
+        return result.matched_count == 1
+
+    def complete(self, bill_id: str) -> None:
+        """Release this worker's lease on a bill whose analysis was saved."""
+        self.collection.update_one(
+            {"id": bill_id, "lease_owner": self.owner},
+            {"$unset": {"lease_owner": "", "lease_expires_at": ""}},
+        )
+
+    def fail(self, bill: Dict[str, Any], error: str) -> str:
+        """
+        Return a claimed bill to the queue after a failed analysis, or mark
+        its analysis failed once it has been attempted max_attempts times.
+
+        Returns:
+            The bill's new analysis_status
+        """
+        status = "failed" if bill.get("analysis_attempts", 1) >= self.max_attempts else "pending"
+        self.collection.update_one(
+            {"id": bill["id"], "lease_owner": self.owner},
+            {
+                "$set": {"analysis_status": status, "analysis_error": error},
+                "$unset": {"lease_owner": "", "lease_expires_at": ""},
+            },
+        )
+        return status
+
+    @contextmanager
+    def lease(self, bill_id: str) -> Iterator[None]:
+        """Keep renewing the lease on a claimed bill while the block runs."""
+        stop = threading.Event()
+
+        def keep_alive():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    if not self.renew(bill_id):
+                        print(f"Warning: Lost the analysis lease on bill {bill_id}")
+                        return
+                except Exception as e:
+                    print(f"Warning: Failed to renew the analysis lease on bill {bill_id}: {str(e)}")
+
+        renewer = threading.Thread(target=keep_alive, name=f"lease-{bill_id}", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+
+    def wait_for_work(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a bill changes or timeout seconds pass.
+
+        Uses a change stream on the bills collection; servers without change
+        streams (standalone MongoDB) are polled every timeout seconds instead.
+
+        Returns:
+            True if a change arrived, False on timeout
+        """
+        from pymongo.errors import PyMongoError
+
+        timeout = self.poll_seconds if timeout is None else timeout
+        if self._change_streams:
+            try:
+                deadline = time.monotonic() + timeout
+                with self.collection.watch(WORK_EVENTS_PIPELINE, max_await_time_ms=int(timeout * 1000)) as stream:
+                    while stream.alive and time.monotonic() < deadline:
+                        if stream.try_next() is not None:
+                            return True
+                return False
+            except PyMongoError as e:
+                print(f"Warning: Change streams unavailable, polling for bills every {timeout:g}s: {str(e)}")
+                self._change_streams = False
+        time.sleep(timeout)
+        return False
+
+
+def run_worker(
+    queue: AnalysisQueue,
+    analyze: Callable[[str], Any],
+    stop: Optional[threading.Event] = None,
+    max_bills: Optional[int] = None,
+) -> int:
+    """
+    Claim and analyze bills until stop is set (or max_bills were processed).
+
+    Args:
+        queue: Queue to claim bills from
+        analyze: Function analyzing a bill by id and saving it only while
+            lease_owner holds its lease, e.g. oai_client.analyze_medical_bill
+        stop: Event ending the loop after the current bill
+        max_bills: Return after this many bills, None to run until stopped
+
+    Returns:
+        Number of bills processed
+    """
+    stop = stop or threading.Event()
+    processed = 0
+    while not stop.is_set() and (max_bills is None or processed < max_bills):
+        bill = queue.claim()
+        if bill is None:
+            queue.wait_for_work()
+            continue
+        try:
+            with queue.lease(bill["id"]):
+                analyze(bill["id"], lease_owner=queue.owner)
+        except Exception as e:
+            status = queue.fail(bill, str(e))
+            print(f"Warning: Failed to analyze bill {bill['id']} ({status}): {str(e)}")
+        else:
+            queue.complete(bill["id"])
+        processed += 1
+    return processed
+
+
+if __name__ == "__main__":
+    from database import LazyCollection
+    from oai_client import analyze_medical_bill
+
+    worker_queue = AnalysisQueue(LazyCollection("bills"))
+    print(f"Analysis worker {worker_queue.owner} waiting for bills")
+    try:
+        run_worker(worker_queue, analyze_medical_bill)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,120 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# Background summarization pool. Lives in its own module so it survives
+# Streamlit re-running the app script on every interaction.
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "4"))
+SUMMARY_QUEUE_SIZE = int(os.environ.get("SUMMARY_QUEUE_SIZE", "64"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Caps running + queued jobs so a burst of uploads cannot grow memory unbounded
+_slots = threading.BoundedSemaphore(SUMMARY_WORKERS + SUMMARY_QUEUE_SIZE)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared summarization pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=SUMMARY_WORKERS, thread_name_prefix="bill-summary"
+                )
+    return _executor
+
+
+def run_summary_job(
+    bill_id: str,
+    file_path: Path,
+    collection: Any,
+    summarize: Callable[[Path], Dict[str, Any]],
+) -> None:
+    """
+    Summarize one bill and record its progress on the bill document.
+
+    Moves the document through processing -> completed/failed, matching the
+    status enum in api/openapi.yaml. Re-uploads of the same file (documents
+    with duplicate_of set to this bill) are updated along with it.
+
+    Args:
+        bill_id: UUID of the bill to summarize
+        file_path: Path to the stored PDF
+        collection: MongoDB collection holding the bill document
+        summarize: Function returning the fields to store for a PDF path,
+            e.g. "summary_ref" (and optionally "render_stats")
+    """
+    bill_filter = {"$or": [{"id": bill_id}, {"duplicate_of": bill_id}]}
+    collection.update_many(
+        bill_filter,
+        {"$set": {"status": "processing", "started_at": datetime.now()}},
+    )
+    try:
+        result = summarize(file_path)
+    except Exception as e:
+        print(f"Warning: Failed to summarize bill {bill_id}: {str(e)}")
+        collection.update_many(
+            bill_filter,
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": str(e),
+                    "processed_at": datetime.now(),
+                }
+            },
+        )
+        return
+
+    collection.update_many(
+        bill_filter,
+        {
+            "$set": {
+                **result,
+                "status": "completed",
+                "processed_at": datetime.now(),
+            }
+        },
+    )
+
+
+def submit_summary_job(
+    bill_id: str,
+    file_path: Path,
+    collection: Any,
+    summarize: Callable[[Path], Dict[str, Any]],
+) -> Optional[Future]:
+    """
+    Queue a bill for background summarization.
+
+    Returns:
+        The job's Future, or None if the queue is full. A rejected bill is
+        marked failed with a queue-full error, so the page stops waiting for
+        it; uploading the same file again retries it.
+    """
+    if not _slots.acquire(blocking=False):
+        print(f"Warning: Summary queue full, bill {bill_id} marked failed")
+        collection.update_many(
+            {"$or": [{"id": bill_id}, {"duplicate_of": bill_id}]},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Summary queue is full, please upload the bill again later",
+                    "processed_at": datetime.now(),
+                }
+            },
+        )
+        return None
+
+    try:
+        future = get_executor().submit(
+            run_summary_job, bill_id, file_path, collection, summarize
+        )
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
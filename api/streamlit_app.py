@@ -1,60 +1,122 @@
 import base64
 import os
+import sys
+import time
 import uuid
 from datetime import datetime
+from functools import partial
 from io import BytesIO
 from pathlib import Path
-from typing import Dict, Union
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from bill_jobs import submit_summary_job
+from uploads import (
+    MAX_UPLOAD_BYTES,
+    UploadTooLargeError,
+    commit_upload,
+    stream_to_temp_file,
+)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
-import streamlit as st
-from openai import OpenAI
-from pdf2image import convert_from_path
-from pymongo import MongoClient
+from bill_content import load_screen, load_text, store_screen, store_text
+from cache_stats import all_stats, get_counter
+from database import LazyCollection
+from oai_client import get_openai_client
+from page_render import MIME_TYPES, RENDER_FORMAT, render_pages, render_stats
+from pdf_text import extract_pdf_pages
 
-# MongoDB connection setup
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
-MONGO_DB = os.environ.get("MONGO_DB", "app_database")
+# Seconds between status checks while a bill is being summarized
+STATUS_POLL_INTERVAL = float(os.environ.get("STATUS_POLL_INTERVAL", "2"))
 
-# OpenAI client setup
+# Summaries are skipped without an OpenAI key; the client is created on first use
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
-# Initialize MongoDB client and get bills collection
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[MONGO_DB]
-bills_collection = db["bills"]
+# MongoDB collections, connected through the shared client on first use
+bills_collection = LazyCollection("bills")
+# Parsed line items, shared with the analysis in oai_client
+line_items_collection = LazyCollection("bill_line_items")
+# Summaries and screens, referenced from the bills (see bill_content)
+content_collection = LazyCollection("bill_content")
+
+# Bills analyzed before analysis_status existed were marked with this status
+# instead of completed; the upload page only knows the api/openapi.yaml enum
+LEGACY_STATUSES = {"analyzed": "completed"}
+
+# Fields a re-upload shares with its canonical bill
+SHARED_BILL_FIELDS = (
+    "summary_ref",
+    "analysis_ref",
+    "analysis_status",
+    "overcharge_screen_ref",
+    "duplicate_screen_ref",
+    "processed_at",
+)
+# Results stored on the bill document itself before they moved to the
+# content collection; copied to re-uploads only where a bill still has them
+LEGACY_INLINE_FIELDS = ("summary", "overcharge_screen", "duplicate_screen")
+
+# Hits are re-uploads of a PDF we already stored and summarized
+dedup_counter = get_counter("bill_dedup")
+_indexes_ready = False
 
 
-def summarize_bill_with_vision(file_path: Path) -> str:
+def ensure_bill_indexes() -> None:
+    """Create the unique content hash index used for upload deduplication."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    # Only the first (canonical) upload of a file carries content_hash;
+    # re-uploads point at it through duplicate_of instead
+    bills_collection.create_index("content_hash", unique=True, sparse=True)
+    _indexes_ready = True
+
+
+def summarize_bill_pages(file_path: Path) -> Dict[str, Any]:
     """
-    Analyze a PDF bill using OpenAI Vision API and return a summary.
+    Analyze a PDF bill using OpenAI Vision API and return a summary together
+    with rendering statistics.
+
+    Every page (up to RENDER_MAX_PAGES) is rendered in parallel, downscaled
+    and compressed, and all pages are sent in a single vision request.
 
     Args:
         file_path: Path to the PDF file to analyze
 
     Returns:
-        String summary of the bill content
+        Dictionary with the "summary" text and "render_stats" (per-page bytes
+        and render time)
 
     Raises:
         Exception: If OpenAI client is not configured or if analysis fails
     """
-    if not openai_client:
+    if not OPENAI_API_KEY:
         raise Exception("OpenAI API key not configured")
 
     try:
-        # Convert PDF to images (only first page for efficiency)
-        images = convert_from_path(file_path, first_page=1, last_page=1)
-
-        if not images:
-            raise Exception("Failed to convert PDF to images")
-
-        # Convert first page to base64
-        buffered = BytesIO()
-        images[0].save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        # Render all pages concurrently as compact JPEG/grayscale images
+        pages = render_pages(file_path)
+        stats = render_stats(pages)
+
+        mime_type = MIME_TYPES.get(RENDER_FORMAT, "image/jpeg")
+        content: List[Dict[str, Any]] = [
+            {
+                "type": "text",
+                "text": "Please analyze this bill and provide a summary with the following details: vendor name, total amount, date, contact information, and main items/services.",
+            }
+        ]
+        for page in pages:
+            img_base64 = base64.b64encode(page["image"]).decode("utf-8")
+            content.append(
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{mime_type};base64,{img_base64}"},
+                }
+            )
 
         # Call OpenAI Vision API
-        response = openai_client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -63,18 +125,7 @@ def summarize_bill_with_vision(file_path: Path) -> str:
                 },
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please analyze this bill and provide a summary with the following details: vendor name, total amount, date, contact information, and main items/services.",
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{img_base64}"
-                            },
-                        },
-                    ],
+                    "content": content,
                 },
             ],
             max_tokens=500,
@@ -82,30 +133,226 @@ def summarize_bill_with_vision(file_path: Path) -> str:
 
         res = response.choices[0].message.content
         if res is None or res == "":
-            return "No summary available"
-        return res
+            res = "No summary available"
+        return {"summary": res, "render_stats": stats}
+    except Exception as e:
+        raise Exception(f"Failed to summarize bill: {str(e)}")
+
+
+def summarize_bill_with_vision(file_path: Path) -> str:
+    """
+    Analyze a PDF bill using OpenAI Vision API and return a summary.
+
+    Args:
+        file_path: Path to the PDF file to analyze
+
+    Returns:
+        String summary of the bill content
+
+    Raises:
+        Exception: If OpenAI client is not configured or if analysis fails
+    """
+    return summarize_bill_pages(file_path)["summary"]
+
+
+def screen_bill_file(file_path: Path, bill_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Screen the line items in a bill's text layer against chargemaster
+    reference prices and for duplicate charges.
+
+    Runs without OCR or OpenAI requests so it is cheap enough for every
+    upload; the full analysis screens OCR'd text again later. When bill_id
+    is given the line items are stored, so later uploads for the same
+    patient are checked against this bill.
+
+    Returns:
+        Dictionary with "overcharge_screen" (unless the chargemaster cache
+        is not built) and "duplicate_screen", empty if the bill has no line
+        items
+    """
+    # Screening loads NumPy and the chargemaster; import it in the background job
+    from bill_screening import extract_line_items, reference_price_index, screen_duplicates, screen_overcharges
+    from line_items import parse_line_items
+
+    try:
+        extraction = extract_pdf_pages(file_path)
+        if bill_id:
+            line_items = extract_line_items(line_items_collection, bill_id, extraction)
+        else:
+            line_items = parse_line_items("\n".join(extraction["pages"]))
     except Exception as e:
-        print(f"Failed to summarize bill: {str(e)}")
-        return f"Failed to summarize bill: {str(e)}"
+        print(f"Warning: Line item extraction failed for {file_path}: {str(e)}")
+        return {}
+
+    screens: Dict[str, Any] = {}
+    if bill_id:
+        screens["duplicate_screen"] = screen_duplicates(line_items_collection, bill_id, extraction, line_items)
+    screens["overcharge_screen"] = screen_overcharges(reference_price_index(), line_items)
+    return {name: screen for name, screen in screens.items() if screen is not None}
+
+
+def process_uploaded_bill(file_path: Path, bill_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Background job for a new upload: screen its line items for overcharges
+    and duplicate charges, and summarize it with the vision model.
+
+    The summary and screens are stored in the content collection, so the
+    bill only keeps references to them and their counts.
+
+    Returns:
+        The fields to store on the bill: "summary_ref", "render_stats" and,
+        when available, "overcharge_screen_ref" and "duplicate_screen_ref"
+    """
+    screens = screen_bill_file(file_path, bill_id)
+    result = summarize_bill_pages(file_path)
+    fields = {
+        "summary_ref": store_text(content_collection, result["summary"]),
+        "render_stats": result["render_stats"],
+    }
+    for name, screen in screens.items():
+        fields[f"{name}_ref"] = store_screen(content_collection, screen)
+    return fields
+
+
+def load_bill_summary(document: Dict[str, Any]) -> Optional[str]:
+    """Load the summary a bill document references, or its inline summary if it predates summary_ref."""
+    if document.get("summary_ref"):
+        return load_text(content_collection, document["summary_ref"])
+    return document.get("summary")
+
+
+def load_bill_screen(document: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+    """Load the named screen ("overcharge_screen" or "duplicate_screen") of a bill document."""
+    if document.get(f"{name}_ref"):
+        return load_screen(content_collection, document[f"{name}_ref"])
+    return document.get(name)
+
+
+def save_duplicate_bill(canonical: Dict) -> Dict[str, Union[str, None]]:
+    """
+    Record a re-upload of an already stored file as a new bill that reuses
+    the canonical bill's file, summary and analysis.
+
+    Args:
+        canonical: MongoDB document of the first upload with the same content
+
+    Returns:
+        Dictionary containing the UUID, status, and summary of the new bill
+    """
+    bill_uuid = str(uuid.uuid4())
+    status = canonical.get("status", "pending")
+    status = LEGACY_STATUSES.get(status, status)
+
+    # A failed summary is retried once on the canonical bill; the new bill
+    # picks up the result through duplicate_of
+    if status == "failed":
+        status = "pending"
+        bills_collection.update_one(
+            {"id": canonical["id"]}, {"$set": {"status": status}}
+        )
+        submit_summary_job(
+            canonical["id"],
+            Path(canonical["path"]),
+            bills_collection,
+            partial(process_uploaded_bill, bill_id=canonical["id"]),
+        )
+
+    document = {
+        "id": bill_uuid,
+        "path": canonical["path"],
+        "duplicate_of": canonical["id"],
+        "status": status,
+        **{field: canonical.get(field) for field in SHARED_BILL_FIELDS},
+        **{field: canonical[field] for field in LEGACY_INLINE_FIELDS if field in canonical},
+        "uploaded_at": datetime.now(),
+    }
+    bills_collection.insert_one(document)
+
+    # The canonical bill's job updates its duplicates when it finishes; if it
+    # finished between reading the canonical bill and the insert, this bill
+    # missed that update, so copy the final state now
+    if status in ("pending", "processing"):
+        current = bills_collection.find_one(
+            {"id": canonical["id"]}, {"status": 1, **{field: 1 for field in SHARED_BILL_FIELDS}}
+        )
+        current_status = LEGACY_STATUSES.get(current.get("status"), current.get("status")) if current else status
+        if current and current_status != status:
+            status = current_status
+            shared = {field: current.get(field) for field in SHARED_BILL_FIELDS}
+            document.update(shared)
+            bills_collection.update_one({"id": bill_uuid}, {"$set": {"status": status, **shared}})
+
+    return {"id": bill_uuid, "status": status, "summary": load_bill_summary(document)}
+
+
+def find_canonical_bill(content_hash: str) -> Union[Dict, None]:
+    """Return the first uploaded bill with the given content hash, if any."""
+    return bills_collection.find_one(
+        {"content_hash": content_hash},
+        {
+            "id": 1,
+            "path": 1,
+            "status": 1,
+            **{field: 1 for field in SHARED_BILL_FIELDS},
+            **{field: 1 for field in LEGACY_INLINE_FIELDS},
+        },
+    )
 
 
 def save_uploaded_bill(
-    file_content: bytes, bills_dir: Path
+    file_content: Union[bytes, BinaryIO],
+    bills_dir: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
 ) -> Dict[str, Union[str, None]]:
     """
     Save an uploaded bill file to the bills directory with a UUID filename.
-    Also creates a MongoDB document with the file metadata and AI-generated summary.
+    Also creates a MongoDB document with status "pending" and queues the
+    AI-generated summary on the background worker pool.
+
+    The upload is streamed in chunks to a temporary file, hashed and
+    size-checked as it is written, then renamed into place atomically, so
+    memory use does not grow with file size.
+
+    Files are deduplicated by SHA-256: re-uploading identical content creates
+    a new bill that points at the stored file and reuses its summary and
+    analysis without another OpenAI request.
 
     Args:
-        file_content: The binary content of the file to save
+        file_content: The binary content of the file, or a binary file-like
+            object to stream it from
         bills_dir: Path to the directory where bills should be saved
+        max_bytes: Maximum accepted upload size in bytes
 
     Returns:
-        Dictionary containing the UUID, status, and summary (if successful)
+        Dictionary containing the UUID, status, and summary (None until the
+        background job completes)
 
     Raises:
+        UploadTooLargeError: If the upload is larger than max_bytes
         Exception: If file save or MongoDB insertion fails
     """
+    from pymongo.errors import DuplicateKeyError
+
+    if isinstance(file_content, (bytes, bytearray, memoryview)):
+        file_content = BytesIO(file_content)
+
+    temp_path, content_hash, _ = stream_to_temp_file(
+        file_content, bills_dir, max_bytes=max_bytes
+    )
+
+    try:
+        ensure_bill_indexes()
+        canonical = find_canonical_bill(content_hash)
+        if canonical:
+            temp_path.unlink()
+            dedup_counter.hit()
+            return save_duplicate_bill(canonical)
+    except Exception as e:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise Exception(f"Failed to save bill: {str(e)}")
+    dedup_counter.miss()
+
     # Generate UUID
     bill_uuid = uuid.uuid4()
 
@@ -113,95 +360,222 @@ def save_uploaded_bill(
     file_path = bills_dir / f"{bill_uuid}.pdf"
 
     try:
-        # Write the file to disk
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # Atomically move the finished upload into place
+        commit_upload(temp_path, file_path)
 
-        # Try to summarize the bill using OpenAI Vision API
-        summary = None
-        status = "pending"
-        processed_at = None
-
-        try:
-            summary = summarize_bill_with_vision(file_path)
-            status = "processed"
-            processed_at = datetime.now()
-        except Exception as e:
-            # If summarization fails, log the error but continue with upload
-            print(f"Warning: Failed to summarize bill: {str(e)}")
-            status = "pending"
-
-        # Create MongoDB document
+        # Create MongoDB document; summarization fills in the rest later
         document = {
             "id": str(bill_uuid),
             "path": f"./bills/{bill_uuid}.pdf",
-            "status": status,
-            "summary": summary,
+            "content_hash": content_hash,
+            "status": "pending",
+            "summary_ref": None,
             "uploaded_at": datetime.now(),
-            "processed_at": processed_at,
+            "processed_at": None,
         }
 
         # Insert document into MongoDB
         bills_collection.insert_one(document)
-
-        return {"id": str(bill_uuid), "status": status, "summary": summary}
+    except DuplicateKeyError:
+        # A concurrent upload of the same content won the race; link to it
+        file_path.unlink()
+        canonical = find_canonical_bill(content_hash)
+        if not canonical:
+            raise Exception("Failed to save bill: duplicate content not found")
+        return save_duplicate_bill(canonical)
     except Exception as e:
         # If MongoDB insertion fails, clean up the saved file
-        if file_path.exists():
-            file_path.unlink()
+        for path in (temp_path, file_path):
+            if path.exists():
+                path.unlink()
         raise Exception(f"Failed to save bill: {str(e)}")
 
+    # Hand summarization to the worker pool so the upload returns immediately
+    submit_summary_job(
+        str(bill_uuid),
+        file_path,
+        bills_collection,
+        partial(process_uploaded_bill, bill_id=str(bill_uuid)),
+    )
 
-# Page configuration
-st.set_page_config(page_title="Bill Upload", page_icon="📄", layout="centered")
-
-st.title("📄 Bill Submission")
-st.write("Upload your bill document for processing")
+    return {"id": str(bill_uuid), "status": "pending", "summary": None}
 
-# Create bills directory if it doesn't exist
-bills_dir = Path("./bills")
-bills_dir.mkdir(exist_ok=True)
 
-# File uploader
-uploaded_file = st.file_uploader(
-    "Choose a PDF file", type=["pdf"], help="Only PDF files are supported"
-)
-
-if uploaded_file is not None:
-    # Check if file is PDF
-    if not uploaded_file.name.lower().endswith(".pdf"):
-        st.error("❌ File not supported - Only PDF files are accepted")
-    else:
-        try:
-            # Show processing message
-            with st.spinner("📄 Uploading and analyzing bill..."):
-                # Save the uploaded file using the extracted function
-                response_data = save_uploaded_bill(
-                    uploaded_file.getbuffer(), bills_dir
-                )
+def get_bill_status(bill_id: str) -> Dict[str, Union[str, None]]:
+    """
+    Fetch the current status and summary of a bill.
 
-            # Display success message with response data
-            st.success("✅ Bill submitted successfully!")
+    The summary and screens are loaded from the content collection only once
+    the bill references them, so polling a pending bill reads one small
+    document.
 
-            # Display response in JSON format matching the API spec
-            st.subheader("Response")
-            st.json(
-                {"id": response_data["id"], "status": response_data["status"]}
-            )
+    Args:
+        bill_id: UUID of the bill
 
-            # Additional info
-            file_path = bills_dir / f"{response_data['id']}.pdf"
-            st.info(f"📁 File saved to: `{file_path}`")
-
-            # Display AI-generated summary if available
-            if response_data.get("summary"):
-                st.subheader("📝 AI-Generated Summary")
-                with st.expander("View Bill Summary", expanded=True):
-                    st.markdown(response_data["summary"])
-            elif response_data["status"] == "pending":
-                st.warning(
-                    "⚠️ AI summarization failed or is pending. Bill uploaded successfully but without analysis."
+    Returns:
+        Dictionary containing the UUID, status, summary, error (if any) and
+        overcharge and duplicate charge screens (if any)
+    """
+    document = bills_collection.find_one(
+        {"id": bill_id},
+        {
+            "status": 1,
+            "error": 1,
+            "summary_ref": 1,
+            "overcharge_screen_ref": 1,
+            "duplicate_screen_ref": 1,
+            **{field: 1 for field in LEGACY_INLINE_FIELDS},
+        },
+    )
+    if not document:
+        return {
+            "id": bill_id,
+            "status": "failed",
+            "summary": None,
+            "error": "Bill not found",
+        }
+    return {
+        "id": bill_id,
+        "status": LEGACY_STATUSES.get(document.get("status"), document.get("status")),
+        "summary": load_bill_summary(document),
+        "error": document.get("error"),
+        "overcharge_screen": load_bill_screen(document, "overcharge_screen"),
+        "duplicate_screen": load_bill_screen(document, "duplicate_screen"),
+    }
+
+
+def main() -> None:
+    """Render the upload page; Streamlit re-runs this on every interaction."""
+    import streamlit as st
+
+    # Page configuration
+    st.set_page_config(page_title="Bill Upload", page_icon="📄", layout="centered")
+
+    st.title("📄 Bill Submission")
+    st.write("Upload your bill document for processing")
+
+    # Create bills directory if it doesn't exist
+    bills_dir = Path("./bills")
+    bills_dir.mkdir(exist_ok=True)
+
+    # Upload deduplication savings for this process
+    with st.sidebar:
+        st.caption("Cache statistics")
+        st.json(all_stats())
+
+    # File uploader
+    uploaded_file = st.file_uploader(
+        "Choose a PDF file", type=["pdf"], help="Only PDF files are supported"
+    )
+
+    if uploaded_file is not None:
+        # Check if file is PDF
+        if not uploaded_file.name.lower().endswith(".pdf"):
+            st.error("❌ File not supported - Only PDF files are accepted")
+        else:
+            try:
+                # Streamlit re-runs this script while polling, so only save each
+                # uploaded file once
+                if st.session_state.get("uploaded_file_id") != uploaded_file.file_id:
+                    with st.spinner("📄 Uploading bill..."):
+                        # Stream from the upload object instead of materializing
+                        # another in-memory copy with getbuffer()
+                        uploaded_file.seek(0)
+                        response_data = save_uploaded_bill(uploaded_file, bills_dir)
+                    st.session_state["uploaded_file_id"] = uploaded_file.file_id
+                    st.session_state["bill_id"] = response_data["id"]
+
+                bill_id = st.session_state["bill_id"]
+                response_data = get_bill_status(bill_id)
+
+                # Display success message with response data
+                st.success("✅ Bill submitted successfully!")
+
+                # Display response in JSON format matching the API spec
+                st.subheader("Response")
+                st.json({"id": response_data["id"], "status": response_data["status"]})
+
+                # Additional info
+                file_path = bills_dir / f"{response_data['id']}.pdf"
+                st.info(f"📁 File saved to: `{file_path}`")
+
+                # Display AI-generated summary once the background job is done
+                if response_data["status"] == "completed" and response_data.get("summary"):
+                    st.subheader("📝 AI-Generated Summary")
+                    with st.expander("View Bill Summary", expanded=True):
+                        st.markdown(response_data["summary"])
+
+                    # Line items priced above the chargemaster reference range
+                    screen = response_data.get("overcharge_screen")
+                    if screen and screen.get("flagged"):
+                        st.subheader("💲 Price Check")
+                        st.warning(
+                            f"{screen['flagged']} of {screen['priced']} priced line items are above "
+                            f"the {screen['percentile']:g}th percentile of published hospital prices "
+                            f"(${screen['excess_cents'] / 100:,.2f} above the median)."
+                        )
+                        st.table(
+                            [
+                                {
+                                    "Code": item["code"],
+                                    "Description": item["description"],
+                                    "Charged": f"${item['unit_charge_cents'] / 100:,.2f}",
+                                    "Median": f"${item['median_cents'] / 100:,.2f}",
+                                    "Percentile": item["percentile"],
+                                }
+                                for item in screen["items"]
+                            ]
+                        )
+
+                    # Charges repeated within this bill or on the patient's other bills
+                    duplicates = response_data.get("duplicate_screen")
+                    if duplicates and duplicates.get("groups"):
+                        st.subheader("🔁 Duplicate Charges")
+                        st.warning(
+                            f"{duplicates['exact']} exact and {duplicates['near']} near-duplicate "
+                            "charge groups share a code, date of service and provider."
+                        )
+                        st.table(
+                            [
+                                {
+                                    "Type": group["kind"],
+                                    "Code": group["items"][0]["code"],
+                                    "Description": group["items"][0]["description"],
+                                    "Date": group["items"][0]["service_date"],
+                                    "Amounts": ", ".join(
+                                        f"${item['amount_cents'] / 100:,.2f}" for item in group["items"]
+                                    ),
+                                    "Other bills": len(
+                                        {item["bill_id"] for item in group["items"]} - {bill_id}
+                                    ),
+                                }
+                                for group in duplicates["groups"]
+                            ]
+                        )
+
+                    # Stream the legal analysis so it renders as it is generated
+                    if st.button("⚖️ Analyze for billing issues"):
+                        from oai_client import analyze_medical_bill_stream
+
+                        st.subheader("⚖️ Billing Analysis")
+                        st.write_stream(analyze_medical_bill_stream(bill_id))
+                elif response_data["status"] == "failed":
+                    st.warning(
+                        f"⚠️ AI summarization failed: {response_data.get('error')}. "
+                        "Bill uploaded successfully but without analysis."
+                    )
+                else:
+                    st.info("⏳ Analyzing bill... this page updates automatically.")
+                    time.sleep(STATUS_POLL_INTERVAL)
+                    st.rerun()
+
+            except UploadTooLargeError:
+                st.error(
+                    f"❌ File too large - the maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
                 )
+            except Exception as e:
+                st.error(f"❌ Failed to process bill: {str(e)}")
+
 
-        except Exception as e:
-            st.error(f"❌ Failed to process bill: {str(e)}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Tuple
+
+# Uploads are copied in fixed-size chunks so memory per upload stays constant
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+def stream_to_temp_file(
+    source: BinaryIO,
+    dest_dir: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Tuple[Path, str, int]:
+    """
+    Copy an upload to a temporary file in dest_dir, hashing and size-checking
+    each chunk as it is written.
+
+    The temporary file lives in the destination directory so it can later be
+    renamed into place atomically with commit_upload.
+
+    Args:
+        source: Binary file-like object to read the upload from
+        dest_dir: Directory the upload will finally be stored in
+        max_bytes: Maximum accepted upload size in bytes
+        chunk_size: Number of bytes read and written per chunk
+
+    Returns:
+        Tuple of (temporary file path, SHA-256 hex digest, size in bytes)
+
+    Raises:
+        UploadTooLargeError: If the upload is larger than max_bytes
+    """
+    fd, temp_name = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"Bill exceeds the maximum upload size of {max_bytes} bytes"
+                    )
+                digest.update(chunk)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+    return Path(temp_name), digest.hexdigest(), size
+
+
+def commit_upload(temp_path: Path, final_path: Path) -> None:
+    """Atomically move a finished upload into its final location."""
+    os.replace(temp_path, final_path)
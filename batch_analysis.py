@@ -0,0 +1,328 @@
+import asyncio
+import os
+import random
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from bill_content import delete_checkpoints
+from oai_client import (
+    OPENAI_API_KEY,
+    bills_collection,
+    content_collection,
+    prepare_bill_analysis,
+    reuse_canonical_analysis,
+    run_bill_analysis,
+)
+
+# Account quotas the batch is throttled to
+OPENAI_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", "40000"))
+# Completion tokens reserved per request when budgeting against the TPM quota
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get("EXPECTED_OUTPUT_TOKENS", "1000"))
+
+# Finished analyses written to bills_collection per bulk write
+BULK_WRITE_SIZE = int(os.environ.get("BULK_WRITE_SIZE", "50"))
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# The OpenAI SDK is imported when the first request is made
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+_async_client: Optional["AsyncOpenAI"] = None
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """
+    Return the shared async OpenAI client, creating it on first use.
+
+    The SDK's own retries are disabled; call_with_retries retries each
+    request under the rate limiter instead.
+    """
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
+
+        _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _async_client
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at rate_per_minute, holding at
+    most one minute of capacity.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Wait until amount tokens are available and take them."""
+        # A single request larger than the bucket can only wait for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate_per_second
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """Throttles requests against both the requests- and tokens-per-minute quotas."""
+
+    def __init__(
+        self,
+        requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens: int, requests: int = 1) -> None:
+        await self.requests.acquire(requests)
+        await self.tokens.acquire(tokens)
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Roughly estimate prompt plus completion tokens (about 4 characters per token)."""
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // 4 + EXPECTED_OUTPUT_TOKENS
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and connection problems are worth retrying."""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """Full-jitter exponential backoff, honoring a Retry-After header if sent."""
+    from openai import APIStatusError
+
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+async def call_with_retries(
+    limiter: RateLimiter,
+    tokens: int,
+    call: Callable[[], Awaitable[Any]],
+    requests: int = 1,
+    max_retries: int = MAX_RETRIES,
+) -> Any:
+    """
+    Await call() under the rate limiter, retrying 429/5xx and connection
+    errors with jittered exponential backoff.
+    """
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(tokens, requests)
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+            print(f"Warning: OpenAI request failed ({str(e)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+class RateLimitedClient:
+    """
+    Synchronous stand-in for the OpenAI client, passed to the shared
+    analysis code (oai_client.run_bill_analysis) running in worker threads.
+
+    Each chat completion is sent on the async client in the batch's event
+    loop, under the rate limiter and with per-request retries (see
+    call_with_retries). Responses served from the LLM cache never reach the
+    client, so they are not counted against the quotas, and a failed
+    request is retried alone rather than re-running the whole analysis.
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        loop: asyncio.AbstractEventLoop,
+        client: Optional["AsyncOpenAI"] = None,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.limiter = limiter
+        self.loop = loop
+        self.client = client or get_async_client()
+        self.max_retries = max_retries
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create_async(self, **params: Any) -> Any:
+        """Send one chat completion under the rate limiter with retries."""
+        return await call_with_retries(
+            self.limiter,
+            estimate_tokens(params["messages"]),
+            lambda: self.client.chat.completions.create(**params),
+            max_retries=self.max_retries,
+        )
+
+    def create(self, **params: Any) -> Any:
+        """Send one chat completion from a worker thread and wait for it."""
+        return asyncio.run_coroutine_threadsafe(self.create_async(**params), self.loop).result()
+
+
+async def analyze_bill_document(
+    bill_doc: Dict[str, Any],
+    limiter: RateLimiter,
+    use_cache: bool = True,
+    save: bool = True,
+    lease_owner: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Analyze one bill, sending its requests on the async client under the
+    rate limiter.
+
+    Args:
+        bill_doc: Bill document with at least "id" and "path" (and
+            "duplicate_of" for re-uploads)
+        limiter: Rate limiter the analysis' requests are counted against
+        use_cache: Set to False to bypass the LLM response cache
+        save: Set to False to return the bill update as "update" (see
+            oai_client.analysis_update) instead of writing it
+        lease_owner: Queue worker that claimed the bill; the analysis is
+            only saved while it holds the lease (see oai_client.save_analysis)
+
+    Returns:
+        {"bill_id", "status": "analyzed", "analysis"} and, unless the
+        analysis of an earlier upload of the file was reused, its
+        "analysis_stats"
+    """
+    bill_id = bill_doc["id"]
+
+    # The analysis itself is the same as analyze_medical_bill (prompts, map-
+    # reduce, screens, cache keys, stored fields); it runs in worker threads
+    # and only its requests go through the event loop
+    reused = await asyncio.to_thread(reuse_canonical_analysis, bill_id, bill_doc)
+    if reused is not None:
+        return {"bill_id": bill_id, "status": "analyzed", "analysis": reused}
+
+    client = RateLimitedClient(limiter, asyncio.get_running_loop())
+    prepared = await asyncio.to_thread(prepare_bill_analysis, bill_id, bill_doc)
+    result = await asyncio.to_thread(
+        run_bill_analysis, bill_id, prepared, use_cache, False, client, save, lease_owner
+    )
+    analyzed = {
+        "bill_id": bill_id,
+        "status": "analyzed",
+        "analysis": result["analysis"],
+        "analysis_stats": result["analysis_stats"],
+    }
+    if "update" in result:
+        analyzed["update"] = result["update"]
+    return analyzed
+
+
+async def analyze_bills(
+    bill_ids: List[str],
+    max_concurrency: int = 8,
+    limiter: Optional[RateLimiter] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyze many bills concurrently, yielding each result as it finishes.
+
+    Each bill is analyzed exactly as analyze_medical_bill does it, including
+    map-reduce for long bills and the overcharge and duplicate screens.
+    Requests are sent on the async OpenAI client, throttled to the account's
+    requests- and tokens-per-minute quotas, so throughput scales with quota
+    rather than round-trip latency. Finished analyses are written back to
+    bills_collection in bulk writes of BULK_WRITE_SIZE bills.
+
+    Args:
+        bill_ids: UUIDs of the bills to analyze
+        max_concurrency: Maximum number of bills analyzed at once
+        limiter: Rate limiter shared across batches (defaults to the quotas
+            configured in the environment)
+        use_cache: Set to False to bypass the LLM response cache
+
+    Yields:
+        {"bill_id", "status": "analyzed", "analysis"} for each success, or
+        {"bill_id", "status": "failed", "error"} for each failure
+    """
+    from pymongo import UpdateMany
+
+    limiter = limiter or RateLimiter()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pending_writes: List[Any] = []
+    pending_ids: List[str] = []
+
+    async def flush_writes() -> None:
+        if not pending_writes:
+            return
+        writes, bill_ids_written = list(pending_writes), list(pending_ids)
+        pending_writes.clear()
+        pending_ids.clear()
+        try:
+            await asyncio.to_thread(bills_collection.bulk_write, writes, ordered=False)
+            await asyncio.to_thread(delete_checkpoints, content_collection, bill_ids_written)
+        except Exception as e:
+            print(f"Warning: Failed to store {len(writes)} analyses: {str(e)}")
+
+    bill_docs = await asyncio.to_thread(
+        lambda: {
+            doc["id"]: doc
+            for doc in bills_collection.find({"id": {"$in": list(bill_ids)}}, {"id": 1, "path": 1, "duplicate_of": 1})
+        }
+    )
+
+    async def run(bill_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                if bill_id not in bill_docs:
+                    raise Exception(f"Bill with ID {bill_id} not found")
+                return await analyze_bill_document(bill_docs[bill_id], limiter, use_cache, save=False)
+            except Exception as e:
+                return {"bill_id": bill_id, "status": "failed", "error": str(e)}
+
+    tasks = [asyncio.create_task(run(bill_id)) for bill_id in bill_ids]
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            update = result.pop("update", None)
+            if update is not None:
+                pending_writes.append(UpdateMany(*update))
+                pending_ids.append(result["bill_id"])
+                if len(pending_writes) >= BULK_WRITE_SIZE:
+                    await flush_writes()
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await flush_writes()
+
+
+def run_batch_analysis(bill_ids: List[str], **kwargs: Any) -> List[Dict[str, Any]]:
+    """Synchronously analyze a batch of bills and return all results."""
+
+    async def collect() -> List[Dict[str, Any]]:
+        return [result async for result in analyze_bills(bill_ids, **kwargs)]
+
+    return asyncio.run(collect())
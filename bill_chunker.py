@@ -0,0 +1,97 @@
+import os
+from functools import lru_cache
+from typing import Any, List, Optional
+
+# Token budgets for analysis prompts (GPT-4 has an 8k context window)
+ANALYSIS_TOKEN_BUDGET = int(os.environ.get("ANALYSIS_TOKEN_BUDGET", "6000"))
+CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", "3000"))
+
+# Used when tiktoken or its encoding files are unavailable
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str) -> Optional[Any]:
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"Warning: tiktoken unavailable for {model}, estimating tokens: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Count tokens with the model's tokenizer, or estimate from length."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text))
+
+
+def _split_oversized_line(line: str, max_tokens: int, model: str) -> List[str]:
+    # A single line longer than the budget is cut on word boundaries
+    pieces: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for word in line.split(" "):
+        word_tokens = count_tokens(word + " ", model)
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_bill_text(
+    pages: List[str],
+    max_tokens: int = CHUNK_TOKEN_BUDGET,
+    model: str = "gpt-4",
+) -> List[str]:
+    """
+    Split bill text into chunks of at most max_tokens tokens.
+
+    Whole pages are packed together where they fit. Pages larger than the
+    budget are split between lines, so a line item is never cut in half
+    unless the line alone exceeds the budget.
+
+    Args:
+        pages: Text of each page of the bill
+        max_tokens: Token budget per chunk
+        model: Model whose tokenizer is used for counting
+
+    Returns:
+        List of chunk texts in document order
+    """
+    units: List[str] = []
+    for page in pages:
+        page = page.strip()
+        if not page:
+            continue
+        if count_tokens(page, model) <= max_tokens:
+            units.append(page)
+            continue
+        for line in page.splitlines():
+            if not line.strip():
+                continue
+            if count_tokens(line, model) <= max_tokens:
+                units.append(line)
+            else:
+                units.extend(_split_oversized_line(line, max_tokens, model))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = count_tokens(unit + "\n", model)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
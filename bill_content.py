@@ -0,0 +1,100 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Large results produced for a bill (its summary, analysis, overcharge and
+# duplicate charge screens, and the checkpoints of a streaming analysis) are
+# stored in a content collection instead of on the bill document, so status
+# checks and listings only move small documents. Results are keyed by their
+# SHA-256, so re-uploads sharing them share one copy; checkpoints are keyed
+# by bill.
+CHECKPOINT_PREFIX = "checkpoint:"
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 hex digest of a text, its id in the content collection."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def store_text(collection: Any, text: str) -> Dict[str, Any]:
+    """
+    Store a text in the content collection unless it is already there.
+
+    Returns:
+        Reference to keep on the bill document: {"content_id", "bytes"}
+    """
+    content_id = text_hash(text)
+    size = len(text.encode("utf-8"))
+    collection.update_one(
+        {"_id": content_id},
+        {"$setOnInsert": {"text": text, "bytes": size, "created_at": datetime.now()}},
+        upsert=True,
+    )
+    return {"content_id": content_id, "bytes": size}
+
+
+def load_text(collection: Any, reference: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Load the text a reference from store_text points at, None if it is missing."""
+    if not reference:
+        return None
+    document = collection.find_one({"_id": reference["content_id"]}, {"text": 1})
+    return document["text"] if document else None
+
+
+def store_screen(collection: Any, screen: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store a line item screen (overcharges or duplicate charges) in the
+    content collection unless it is already there.
+
+    Returns:
+        Reference to keep on the bill document: {"content_id", "bytes"} and
+        the screen's top-level counts, so listings need not load it
+    """
+    payload = json.dumps(screen, sort_keys=True, default=str)
+    content_id = text_hash(payload)
+    size = len(payload.encode("utf-8"))
+    collection.update_one(
+        {"_id": content_id},
+        {"$setOnInsert": {"screen": screen, "bytes": size, "created_at": datetime.now()}},
+        upsert=True,
+    )
+    counts = {
+        name: value
+        for name, value in screen.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    return {"content_id": content_id, "bytes": size, **counts}
+
+
+def load_screen(collection: Any, reference: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Load the screen a reference from store_screen points at, None if it is missing."""
+    if not reference:
+        return None
+    document = collection.find_one({"_id": reference["content_id"]}, {"screen": 1})
+    return document["screen"] if document else None
+
+
+def save_checkpoint(collection: Any, bill_id: str, key: str, text: str) -> None:
+    """Store the partial text of a streaming analysis of the prompt with the given cache key."""
+    collection.update_one(
+        {"_id": f"{CHECKPOINT_PREFIX}{bill_id}"},
+        {"$set": {"key": key, "text": text, "updated_at": datetime.now()}},
+        upsert=True,
+    )
+
+
+def load_checkpoint(collection: Any, bill_id: str, key: str) -> Optional[str]:
+    """Return the checkpointed partial analysis of a bill if it was streamed for the same prompt."""
+    document = collection.find_one({"_id": f"{CHECKPOINT_PREFIX}{bill_id}", "key": key}, {"text": 1})
+    return document["text"] if document else None
+
+
+def delete_checkpoint(collection: Any, bill_id: str) -> None:
+    """Remove a bill's streaming checkpoint once its analysis is saved."""
+    collection.delete_one({"_id": f"{CHECKPOINT_PREFIX}{bill_id}"})
+
+
+def delete_checkpoints(collection: Any, bill_ids: List[str]) -> None:
+    """Remove the streaming checkpoints of several bills in one request."""
+    collection.delete_many({"_id": {"$in": [f"{CHECKPOINT_PREFIX}{bill_id}" for bill_id in bill_ids]}})
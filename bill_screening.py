@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+from description_index import get_description_index
+from duplicate_charges import ensure_charge_key_indexes, extract_bill_identity, screen_duplicate_charges
+from line_items import parse_line_items, save_line_items
+from overcharge import screen_line_items
+from price_index import PriceIndex, get_price_index
+
+# Checks run on a bill's line items before it is analyzed, shared by the
+# upload job (api/streamlit_app.py) and the analysis (oai_client.py)
+
+_indexed_collections = set()
+_price_index: Optional[PriceIndex] = None
+_price_index_checked = False
+_price_index_lock = threading.Lock()
+
+
+def _ensure_line_item_indexes(collection: Any) -> None:
+    if collection.full_name in _indexed_collections:
+        return
+    collection.create_index("bill_id", unique=True)
+    collection.create_index("codes")
+    ensure_charge_key_indexes(collection)
+    _indexed_collections.add(collection.full_name)
+
+
+def extract_line_items(collection: Any, bill_id: str, extraction: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """
+    Parse line items from extracted bill text (see pdf_text.extract_pdf_pages)
+    and store them as columns.
+    """
+    columns = parse_line_items("\n".join(extraction["pages"]))
+    source = "ocr" if "ocr" in extraction["methods"] else "text"
+    try:
+        _ensure_line_item_indexes(collection)
+        save_line_items(collection, bill_id, columns, extraction["content_hash"], source)
+    except Exception as e:
+        print(f"Warning: Failed to store line items for bill {bill_id}: {str(e)}")
+    return columns
+
+
+def reference_price_index() -> Optional[PriceIndex]:
+    """Return the chargemaster price index, or None if it is not built (checked once per process)."""
+    global _price_index, _price_index_checked
+    if not _price_index_checked:
+        with _price_index_lock:
+            if not _price_index_checked:
+                try:
+                    _price_index = get_price_index()
+                except Exception as e:
+                    print(f"Warning: Reference prices unavailable: {str(e)}")
+                _price_index_checked = True
+    return _price_index
+
+
+def screen_overcharges(index: Optional[PriceIndex], line_items: Dict[str, List[Any]]) -> Optional[Dict[str, Any]]:
+    """Screen a bill's line items against chargemaster reference prices, None if that is not possible."""
+    if index is None or not line_items["codes"]:
+        return None
+    try:
+        return screen_line_items(index, line_items, description_index=get_description_index())
+    except Exception as e:
+        print(f"Warning: Overcharge screen failed: {str(e)}")
+        return None
+
+
+def screen_duplicates(
+    collection: Any,
+    bill_id: str,
+    extraction: Dict[str, Any],
+    line_items: Dict[str, List[Any]],
+) -> Optional[Dict[str, Any]]:
+    """Screen a bill's line items for duplicate charges within it and across the patient's bills."""
+    if not line_items["codes"]:
+        return None
+    try:
+        _ensure_line_item_indexes(collection)
+        identity = extract_bill_identity("\n".join(extraction["pages"]))
+        return screen_duplicate_charges(bill_id, line_items, identity, collection, extraction["content_hash"])
+    except Exception as e:
+        print(f"Warning: Duplicate charge screen failed for bill {bill_id}: {str(e)}")
+        return None
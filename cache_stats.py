@@ -0,0 +1,50 @@
+import threading
+from typing import Dict
+
+# Process-wide registry so counters survive Streamlit re-running the app script
+_counters: Dict[str, "HitCounter"] = {}
+_registry_lock = threading.Lock()
+
+
+class HitCounter:
+    """Thread-safe hit/miss counter for one cache."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return current hits, misses and hit rate."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+def get_counter(name: str) -> HitCounter:
+    """Return the named counter, creating it on first use."""
+    with _registry_lock:
+        if name not in _counters:
+            _counters[name] = HitCounter(name)
+        return _counters[name]
+
+
+def all_stats() -> Dict[str, Dict[str, float]]:
+    """Return a snapshot of every registered counter."""
+    with _registry_lock:
+        counters = list(_counters.values())
+    return {counter.name: counter.snapshot() for counter in counters}
@@ -0,0 +1,573 @@
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from page_cache import file_content_hash
+
+# Hospital chargemaster (CDM) workbooks published through HCAI
+CHARGEMASTER_DIR = Path(os.environ.get("CHARGEMASTER_DIR", "./data/Chargemaster Data"))
+# Compiled, memory-mappable copy of every CDM
+CHARGEMASTER_CACHE_DIR = Path(os.environ.get("CHARGEMASTER_CACHE_DIR", "./cache/chargemaster"))
+# Number of previous builds kept for readers that still have them mapped
+CHARGEMASTER_KEEP_BUILDS = 2
+# Workbooks parsed in parallel, one process per changed file
+CHARGEMASTER_WORKERS = int(os.environ.get("CHARGEMASTER_WORKERS", str(os.cpu_count() or 2)))
+
+# OSHPD/HCAI facility numbers are 9 digits starting with 106
+HOSPITAL_ID_PATTERN = re.compile(r"(?<!\d)(106\d{6})(?!\d)")
+FACILITY_NO_PATTERN = re.compile(r"Facility No:?\s*(106)-?(\d{6})", re.IGNORECASE)
+
+# Normalized header names of each column role, in order of preference
+CODE_HEADERS = ["cdm code", "cdm", "procedure", "internal id", "erx id", "supply"]
+CPT_HEADERS = ["cpt", "cpt-4", "hcpc"]
+DESCRIPTION_HEADERS = ["description", "cdm description", "bill description", "supply description", "medication"]
+# Outpatient prices are preferred since uploaded bills are mostly outpatient
+PRICE_HEADERS = ["op price", "price", "charge", "std chg", "ip price"]
+# Rows scanned for a header before a sheet is treated as a form or notes;
+# AB 1045 "Common 25" sheets put theirs on row 6, below the facility details
+HEADER_SCAN_ROWS = 20
+# CPT (5 digits), CPT Category II/III and HCPCS Level II codes, optionally
+# followed by a modifier; CPT columns also carry internal codes and notes
+CPT_CODE_PATTERN = re.compile(r"([A-V]\d{4}|\d{4}[FT]|\d{5})(?![0-9A-Z])")
+# Parsed workbooks are stored under this directory of the cache; renamed
+# whenever parsing changes so older segments are rebuilt
+SEGMENTS_DIR = "segments-v3"
+
+CHARGEMASTER_COLUMNS = ["codes", "cpt_codes", "descriptions", "price_cents"]
+
+
+def hospital_id_from_filename(file_path: Path) -> Optional[str]:
+    """Return the OSHPD-style facility number in a workbook's file name, if any."""
+    match = HOSPITAL_ID_PATTERN.search(Path(file_path).stem)
+    return match.group(1) if match else None
+
+
+def _normalize_header(value: Any) -> str:
+    return " ".join(str(value).split()).lower() if value is not None else ""
+
+
+def find_price_columns(header: Tuple[Any, ...]) -> Optional[Dict[str, int]]:
+    """
+    Map column roles (code, cpt, description, price) to positions in a header row.
+
+    Returns:
+        Dictionary of role to column index, or None if the row lacks a
+        description or price column
+    """
+    names = [_normalize_header(value) for value in header]
+
+    def find(candidates: List[str]) -> Optional[int]:
+        for candidate in candidates:
+            if candidate in names:
+                return names.index(candidate)
+        return None
+
+    columns = {
+        "code": find(CODE_HEADERS),
+        "cpt": find(CPT_HEADERS),
+        "description": find(DESCRIPTION_HEADERS),
+        "price": find(PRICE_HEADERS),
+    }
+    if columns["description"] is None or columns["price"] is None:
+        return None
+    return columns
+
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return " ".join(str(value).split())
+
+
+def cpt_code(value: Any) -> str:
+    """Return the CPT/HCPCS code in a CPT column cell, or "" if it holds none."""
+    match = CPT_CODE_PATTERN.match(_cell_text(value).upper())
+    return match.group(1) if match else ""
+
+
+def _price_cents(value: Any) -> Optional[int]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value * 100))
+    text = str(value).replace("$", "").replace(",", "").strip()
+    try:
+        return int(round(float(text) * 100))
+    except ValueError:
+        return None
+
+
+def _facility_id_from_sheet(rows: List[Tuple[Any, ...]]) -> Optional[str]:
+    for row in rows:
+        for value in row:
+            if not isinstance(value, str):
+                continue
+            match = FACILITY_NO_PATTERN.search(value)
+            if match:
+                return match.group(1) + match.group(2)
+    return None
+
+
+def parse_workbook(file_path: Path) -> Dict[str, Any]:
+    """
+    Parse every price sheet of a chargemaster workbook into columns.
+
+    Sheets are recognized by their header row (see find_price_columns), so
+    forms, notes and price-change reports are skipped. Rows without a price
+    are dropped.
+
+    Returns:
+        Dictionary with "hospital_id" (from the file name, else from a
+        "Facility No" cell, else None), "sheets" (names of the parsed
+        sheets) and the CHARGEMASTER_COLUMNS as lists, prices in cents
+    """
+    import openpyxl
+
+    result: Dict[str, Any] = {name: [] for name in CHARGEMASTER_COLUMNS}
+    result["hospital_id"] = hospital_id_from_filename(file_path)
+    result["sheets"] = []
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            head: List[Tuple[Any, ...]] = []
+            columns = None
+            for row in rows:
+                head.append(row)
+                columns = find_price_columns(row)
+                if columns or len(head) >= HEADER_SCAN_ROWS:
+                    break
+
+            if not columns:
+                if result["hospital_id"] is None:
+                    result["hospital_id"] = _facility_id_from_sheet(head)
+                continue
+
+            result["sheets"].append(sheet.title)
+            width = max(columns[role] for role in columns if columns[role] is not None) + 1
+            for row in rows:
+                if len(row) < width:
+                    continue
+                price = _price_cents(row[columns["price"]])
+                if price is None:
+                    continue
+                code = _cell_text(row[columns["code"]]) if columns["code"] is not None else ""
+                description = _cell_text(row[columns["description"]])
+                if not code and not description:
+                    continue
+                result["codes"].append(code)
+                result["cpt_codes"].append(cpt_code(row[columns["cpt"]]) if columns["cpt"] is not None else "")
+                result["descriptions"].append(description)
+                result["price_cents"].append(price)
+    finally:
+        workbook.close()
+
+    return result
+
+
+def write_string_table(directory: Path, name: str, values: List[str]) -> None:
+    """
+    Store variable-length strings as a UTF-8 blob plus an offsets array, so
+    they can be memory-mapped like the fixed-width columns.
+    """
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(directory / f"{name}.offsets.npy", offsets)
+    np.save(directory / f"{name}.blob.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+
+class StringTable:
+    """Read-only, memory-mapped column of strings written by write_string_table."""
+
+    def __init__(self, directory: Path, name: str):
+        self.offsets = np.load(directory / f"{name}.offsets.npy", mmap_mode="r")
+        self.blob = np.load(directory / f"{name}.blob.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_list(self) -> List[str]:
+        """Decode every string at once, much faster than iterating."""
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+
+def _fixed_width(values: List[str]) -> np.ndarray:
+    width = max([len(value) for value in values] + [1])
+    return np.array(values, dtype=f"U{width}")
+
+
+def _write_segment(file_path: Path, segments_dir: Path, content_hash: str) -> Dict[str, Any]:
+    # Runs in a worker process: parse one workbook and store its columns
+    # under its content hash, renaming the directory into place when complete
+    parsed = parse_workbook(file_path)
+    temp_dir = segments_dir / f".tmp-{content_hash}-{uuid.uuid4().hex[:8]}"
+    temp_dir.mkdir(parents=True)
+    try:
+        np.save(temp_dir / "codes.npy", _fixed_width(parsed["codes"]))
+        np.save(temp_dir / "cpt_codes.npy", _fixed_width(parsed["cpt_codes"]))
+        np.save(temp_dir / "price_cents.npy", np.array(parsed["price_cents"], dtype=np.int64))
+        write_string_table(temp_dir, "descriptions", parsed["descriptions"])
+        segment = {
+            "content_hash": content_hash,
+            "hospital_id": parsed["hospital_id"],
+            "sheets": parsed["sheets"],
+            "rows": len(parsed["price_cents"]),
+        }
+        (temp_dir / "segment.json").write_text(json.dumps(segment))
+        try:
+            os.rename(temp_dir, segments_dir / content_hash)
+        except OSError:
+            # Another build stored the same content first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return segment
+
+
+def _load_manifest(cache_dir: Path) -> Dict[str, Any]:
+    try:
+        return json.loads((cache_dir / "manifest.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return {"files": {}, "sources": None}
+
+
+def _save_manifest(cache_dir: Path, manifest: Dict[str, Any]) -> None:
+    temp_path = cache_dir / f".manifest-{uuid.uuid4().hex[:8]}"
+    temp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(temp_path, cache_dir / "manifest.json")
+
+
+def scan_workbooks(source_dir: Path, manifest: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Stat every workbook in source_dir, hashing only files whose size or
+    mtime differs from the manifest.
+
+    Returns:
+        Dictionary of file name to {"size", "mtime_ns", "content_hash",
+        "hashed"}, where hashed tells whether the file had to be read
+    """
+    files = {}
+    for file_path in sorted(Path(source_dir).glob("*.xlsx")):
+        stat = file_path.stat()
+        known = manifest["files"].get(file_path.name)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            content_hash, hashed = known["content_hash"], False
+        else:
+            content_hash, hashed = file_content_hash(file_path), True
+        files[file_path.name] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "content_hash": content_hash,
+            "hashed": hashed,
+        }
+    return files
+
+
+def _link_build(cache_dir: Path, sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Concatenate the segments of one build into a fresh build directory
+    build_name = f"build-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    build_dir = cache_dir / build_name
+    build_dir.mkdir(parents=True)
+    try:
+        arrays: Dict[str, List[np.ndarray]] = {name: [] for name in ["codes", "cpt_codes", "price_cents"]}
+        offsets: List[np.ndarray] = []
+        blobs: List[np.ndarray] = []
+        blob_size = 0
+        for source in sources:
+            segment_dir = cache_dir / SEGMENTS_DIR / source["content_hash"]
+            for name in arrays:
+                arrays[name].append(np.load(segment_dir / f"{name}.npy", mmap_mode="r"))
+            table = StringTable(segment_dir, "descriptions")
+            offsets.append(table.offsets[:-1] + blob_size)
+            blobs.append(table.blob)
+            blob_size += int(table.offsets[-1])
+
+        for name, parts in arrays.items():
+            empty = np.zeros(0, dtype=np.int64 if name == "price_cents" else "U1")
+            np.save(build_dir / f"{name}.npy", np.concatenate(parts) if parts else empty)
+        np.save(build_dir / "descriptions.offsets.npy", np.concatenate(offsets + [np.array([blob_size])]).astype(np.int64))
+        np.save(build_dir / "descriptions.blob.npy", np.concatenate(blobs) if blobs else np.zeros(0, dtype=np.uint8))
+        source_index = np.zeros(sum(source["stop"] - source["start"] for source in sources), dtype=np.int32)
+        for index, source in enumerate(sources):
+            source_index[source["start"]:source["stop"]] = index
+        np.save(build_dir / "source_index.npy", source_index)
+
+        meta = {"build": build_name, "rows": len(source_index), "sources": sources}
+        (build_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    pointer = cache_dir / f".CURRENT-{uuid.uuid4().hex[:8]}"
+    pointer.write_text(build_name)
+    os.replace(pointer, cache_dir / "CURRENT")
+    _prune_builds(cache_dir, build_name)
+    return meta
+
+
+def build_chargemaster_cache(
+    source_dir: Path = CHARGEMASTER_DIR,
+    cache_dir: Path = CHARGEMASTER_CACHE_DIR,
+    workers: int = CHARGEMASTER_WORKERS,
+) -> Dict[str, Any]:
+    """
+    Incrementally compile the chargemaster workbooks in source_dir into a
+    columnar cache.
+
+    A manifest records each workbook's size, mtime and content hash.
+    Unchanged files are not even read, byte-identical files are parsed and
+    stored once as a segment shared by all their aliases, and only new or
+    changed content is parsed, one worker process per workbook. When the
+    set of segments changes, they are linked into a new build published by
+    atomically replacing the CURRENT pointer, so processes reading the
+    previous build are never disturbed.
+
+    Workbooks that fail to parse or contain no priced rows are left out of
+    the build and listed in the manifest under "skipped", with a warning
+    when they are first seen.
+
+    Returns:
+        The build metadata: "build", "rows" and "sources" (one entry per
+        distinct workbook content with its content_hash, files,
+        hospital_ids, sheets and the [start, stop) row range it occupies),
+        plus the "parsed" files, the "skipped" files ({"file", "reason"}),
+        "changed" (whether a new build was published) and "seconds"
+    """
+    start = time.perf_counter()
+    cache_dir = Path(cache_dir)
+    segments_dir = cache_dir / SEGMENTS_DIR
+    segments_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = _load_manifest(cache_dir)
+    files = scan_workbooks(source_dir, manifest)
+
+    aliases: Dict[str, List[str]] = {}
+    for name, entry in files.items():
+        aliases.setdefault(entry["content_hash"], []).append(name)
+
+    missing = {
+        content_hash: names[0]
+        for content_hash, names in aliases.items()
+        if not (segments_dir / content_hash / "segment.json").exists()
+    }
+    segments: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    if missing:
+        pool_size = max(1, min(workers, len(missing)))
+        with ProcessPoolExecutor(max_workers=pool_size) as pool:
+            futures = {
+                content_hash: pool.submit(_write_segment, Path(source_dir) / name, segments_dir, content_hash)
+                for content_hash, name in missing.items()
+            }
+            for content_hash, future in futures.items():
+                try:
+                    segments[content_hash] = future.result()
+                except Exception as e:
+                    errors[content_hash] = f"failed to parse: {str(e)}"
+
+    sources: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, str]] = []
+    row_start = 0
+    for content_hash, names in sorted(aliases.items(), key=lambda item: item[1][0]):
+        segment = segments.get(content_hash)
+        if segment is None and content_hash not in errors:
+            try:
+                segment = json.loads((segments_dir / content_hash / "segment.json").read_text())
+            except FileNotFoundError:
+                errors[content_hash] = "parsed segment is missing"
+        if segment is None or not segment["rows"]:
+            if segment is None:
+                reason = errors[content_hash]
+            elif segment["sheets"]:
+                reason = "no priced rows"
+            else:
+                reason = f"no price sheet header in the first {HEADER_SCAN_ROWS} rows of any sheet"
+            for name in names:
+                skipped.append({"file": name, "reason": reason})
+                if content_hash in missing:
+                    print(f"Warning: Skipped chargemaster {name}: {reason}")
+            continue
+        hospital_ids = [hospital_id_from_filename(Path(name)) for name in names]
+        hospital_ids = sorted({hospital_id for hospital_id in hospital_ids if hospital_id})
+        if not hospital_ids:
+            hospital_ids = [segment["hospital_id"] or Path(names[0]).stem]
+        sources.append({
+            "content_hash": content_hash,
+            "files": names,
+            "hospital_ids": hospital_ids,
+            "sheets": segment["sheets"],
+            "start": row_start,
+            "stop": row_start + segment["rows"],
+        })
+        row_start += segment["rows"]
+
+    changed = (
+        sources != manifest.get("sources")
+        or manifest.get("segments") != SEGMENTS_DIR
+        or not (cache_dir / "CURRENT").exists()
+    )
+    if changed:
+        meta = _link_build(cache_dir, sources)
+    else:
+        meta = json.loads((current_build_dir(cache_dir) / "meta.json").read_text())
+
+    manifest = {
+        "files": {
+            name: {key: entry[key] for key in ("size", "mtime_ns", "content_hash")}
+            for name, entry in files.items()
+        },
+        "sources": sources,
+        "skipped": skipped,
+        "segments": SEGMENTS_DIR,
+    }
+    _save_manifest(cache_dir, manifest)
+    for path in segments_dir.iterdir():
+        if path.name not in aliases and not path.name.startswith(".tmp-"):
+            shutil.rmtree(path, ignore_errors=True)
+    for path in cache_dir.glob("segments*"):
+        if path.name != SEGMENTS_DIR:
+            shutil.rmtree(path, ignore_errors=True)
+
+    return {
+        **meta,
+        "parsed": [missing[content_hash] for content_hash in segments],
+        "skipped": skipped,
+        "changed": changed,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _prune_builds(cache_dir: Path, current: str) -> None:
+    builds = sorted(path for path in cache_dir.glob("build-*") if path.is_dir() and path.name != current)
+    for path in builds[: max(0, len(builds) - (CHARGEMASTER_KEEP_BUILDS - 1))]:
+        # Unlinking files other processes still have mapped is safe on POSIX
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class Chargemaster:
+    """
+    Memory-mapped view of a compiled chargemaster build.
+
+    Columns are opened with np.load(mmap_mode="r"), so loading is near
+    instant and every process mapping the same build shares one copy of
+    the data through the OS page cache.
+
+    Attributes:
+        codes: Hospital charge codes (fixed-width str array)
+        cpt_codes: CPT/HCPCS codes, empty where the CDM has none
+        descriptions: StringTable of charge descriptions
+        price_cents: Prices in cents (int64)
+        source_index: Index into sources for every row (int32)
+        sources: Per-content workbook metadata, see build_chargemaster_cache
+    """
+
+    def __init__(self, build_dir: Path):
+        self.build_dir = Path(build_dir)
+        self.meta = json.loads((self.build_dir / "meta.json").read_text())
+        self.sources: List[Dict[str, Any]] = self.meta["sources"]
+        self.codes = np.load(self.build_dir / "codes.npy", mmap_mode="r")
+        self.cpt_codes = np.load(self.build_dir / "cpt_codes.npy", mmap_mode="r")
+        self.price_cents = np.load(self.build_dir / "price_cents.npy", mmap_mode="r")
+        self.source_index = np.load(self.build_dir / "source_index.npy", mmap_mode="r")
+        self.descriptions = StringTable(self.build_dir, "descriptions")
+
+    def __len__(self) -> int:
+        return len(self.price_cents)
+
+    @property
+    def hospital_ids(self) -> List[str]:
+        return sorted({hospital_id for source in self.sources for hospital_id in source["hospital_ids"]})
+
+    def hospital_rows(self, hospital_id: str) -> List[slice]:
+        """Return the row ranges holding a hospital's charges."""
+        return [
+            slice(source["start"], source["stop"])
+            for source in self.sources
+            if hospital_id in source["hospital_ids"]
+        ]
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Return one charge as a dictionary."""
+        return {
+            "hospital_ids": self.sources[int(self.source_index[index])]["hospital_ids"],
+            "code": str(self.codes[index]),
+            "cpt_code": str(self.cpt_codes[index]),
+            "description": self.descriptions[index],
+            "price_cents": int(self.price_cents[index]),
+        }
+
+
+_chargemaster: Optional[Chargemaster] = None
+_chargemaster_lock = threading.Lock()
+
+
+def current_build_dir(cache_dir: Path = CHARGEMASTER_CACHE_DIR) -> Path:
+    """Return the directory of the published build."""
+    pointer = Path(cache_dir) / "CURRENT"
+    if not pointer.exists():
+        raise Exception(
+            f"No chargemaster cache in {cache_dir}, build it with: python chargemaster.py build"
+        )
+    return Path(cache_dir) / pointer.read_text().strip()
+
+
+def load_chargemaster(cache_dir: Path = CHARGEMASTER_CACHE_DIR) -> Chargemaster:
+    """Map the published chargemaster build."""
+    return Chargemaster(current_build_dir(cache_dir))
+
+
+def get_chargemaster() -> Chargemaster:
+    """Return the shared chargemaster, mapping it on first use."""
+    global _chargemaster
+    if _chargemaster is None:
+        with _chargemaster_lock:
+            if _chargemaster is None:
+                _chargemaster = load_chargemaster()
+    return _chargemaster
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["build"]:
+        from description_index import get_description_index
+
+        meta = build_chargemaster_cache()
+        status = "Built" if meta["changed"] else "Unchanged"
+        print(f"{status} {meta['build']}: {meta['rows']} charges from {len(meta['sources'])} workbooks, "
+              f"parsed {len(meta['parsed'])} in {meta['seconds']}s")
+        for source in meta["sources"]:
+            print(f"  {', '.join(source['hospital_ids'])}: {source['stop'] - source['start']} charges "
+                  f"from {', '.join(source['files'])}")
+        for entry in meta["skipped"]:
+            print(f"  Skipped {entry['file']}: {entry['reason']}")
+        # Prebuild the description search index next to the new build
+        print(f"Description index: {len(get_description_index())} descriptions")
+    else:
+        start = time.perf_counter()
+        chargemaster = get_chargemaster()
+        print(f"Loaded {len(chargemaster)} charges for {len(chargemaster.hospital_ids)} hospitals "
+              f"in {(time.perf_counter() - start) * 1000:.1f}ms")
@@ -0,0 +1,97 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from pymongo.collection import Collection
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.environ.get("MONGO_DB", "app_database")
+# Connection pool shared by the upload page, summary workers and analyses
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(os.environ.get("MONGO_MAX_IDLE_MS", "60000"))
+# Fail fast instead of blocking a request for pymongo's default 30 seconds
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Indexes each collection needs, created once per process on first use
+COLLECTION_INDEXES: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {
+    "bills": [
+        ("id", {"unique": True}),
+        ("status", {}),
+        ("uploaded_at", {}),
+        # Re-uploads are updated together with their canonical bill
+        ("duplicate_of", {"sparse": True}),
+    ],
+}
+
+_client: Optional["MongoClient"] = None
+_client_lock = threading.Lock()
+_collections: Dict[str, "Collection"] = {}
+_collections_lock = threading.Lock()
+
+
+def get_mongo_client() -> "MongoClient":
+    """Return the shared MongoDB client, creating it (and importing pymongo) on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from pymongo import MongoClient
+
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                )
+    return _client
+
+
+def ensure_indexes(collection: Any, name: str) -> None:
+    """Create the indexes COLLECTION_INDEXES declares for a collection."""
+    from pymongo import ASCENDING
+
+    for field, options in COLLECTION_INDEXES.get(name, []):
+        collection.create_index([(field, ASCENDING)], **options)
+
+
+def get_collection(name: str) -> "Collection":
+    """
+    Return a collection of the application database, ensuring its indexes
+    the first time it is used in this process.
+    """
+    collection = _collections.get(name)
+    if collection is None:
+        with _collections_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = get_mongo_client()[MONGO_DB][name]
+                try:
+                    ensure_indexes(collection, name)
+                except Exception as e:
+                    print(f"Warning: Failed to create indexes on {name}: {str(e)}")
+                _collections[name] = collection
+    return collection
+
+
+class LazyCollection:
+    """
+    Stand-in for a collection that connects on first use, so importing a
+    module that declares its collections does not open a MongoDB client.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Introspection (mock.patch, copy, pickle) probes private names; answer
+        # without connecting
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        return getattr(get_collection(self.name), attribute)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self.name!r})"
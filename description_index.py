@@ -0,0 +1,389 @@
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from chargemaster import Chargemaster, StringTable, get_chargemaster, write_string_table
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Character trigrams of query words missing from the vocabulary catch
+# misspellings and truncations, but count less than whole words
+TRIGRAM_WEIGHT = 0.3
+# Trigrams in more than this fraction of descriptions carry no signal and are skipped at query time
+MAX_TRIGRAM_DOC_FRACTION = 0.02
+# Versioned so indexes written in an older layout are rebuilt
+INDEX_DIR_NAME = "description_index-v3"
+
+# The best match is only used as a reference code if it covers about two of
+# every three words of the line item description, and the line item covers
+# as many of its words, so "SUPPLIES" does not take the code of "SUPPLIES
+# FOR SPINAL"
+MIN_MATCH_COVERAGE = 0.65
+
+# Common chargemaster and bill abbreviations, mapped to one spelling
+ABBREVIATIONS = {
+    "W/O": "WITHOUT",
+    "WO": "WITHOUT",
+    "W/": "WITH",
+    "W": "WITH",
+    # "With and without" is its own service, e.g. CT with and without contrast
+    "WWO": "WITHWITHOUT",
+    "W/WO": "WITHWITHOUT",
+    "XR": "XRAY",
+    "X-RAY": "XRAY",
+    "RAD": "XRAY",
+    "CNTRST": "CONTRAST",
+    "CONTR": "CONTRAST",
+    "HD": "HEAD",
+    "ABD": "ABDOMEN",
+    "PELV": "PELVIS",
+    "CHST": "CHEST",
+    "INJ": "INJECTION",
+    "INJX": "INJECTION",
+    "IV": "INTRAVENOUS",
+    "IM": "INTRAMUSCULAR",
+    "EVAL": "EVALUATION",
+    "ED": "EMERGENCY",
+    "ER": "EMERGENCY",
+    "EMERG": "EMERGENCY",
+    "VST": "VISIT",
+    "LVL": "LEVEL",
+    "LT": "LEFT",
+    "RT": "RIGHT",
+    "BILAT": "BILATERAL",
+    "BIL": "BILATERAL",
+    "LTD": "LIMITED",
+    "COMPL": "COMPLETE",
+    "CMPL": "COMPLETE",
+    "PNL": "PANEL",
+    "CBC": "BLOOD COUNT",
+    "CMP": "METABOLIC PANEL COMPREHENSIVE",
+    "BMP": "METABOLIC PANEL BASIC",
+    "US": "ULTRASOUND",
+    "ECHO": "ECHOCARDIOGRAM",
+    "EKG": "ELECTROCARDIOGRAM",
+    "ECG": "ELECTROCARDIOGRAM",
+    "TAB": "TABLET",
+    "CAP": "CAPSULE",
+    "SOLN": "SOLUTION",
+    "SOL": "SOLUTION",
+    "SUPP": "SUPPOSITORY",
+    "HR": "HOUR",
+    "HRS": "HOUR",
+    "MIN": "MINUTES",
+    "V": "VIEW",
+    "VW": "VIEW",
+    "VIEWS": "VIEW",
+    "PROC": "PROCEDURE",
+    "SURG": "SURGERY",
+    "ANES": "ANESTHESIA",
+    "ANESTH": "ANESTHESIA",
+    "RM": "ROOM",
+    "PVT": "PRIVATE",
+    "THER": "THERAPY",
+    "ADDL": "ADDITIONAL",
+}
+# Billing-system prefixes and filler words that do not describe the service
+STOP_WORDS = {"HB", "HCHG", "PR", "RF", "OF", "THE", "AND", "FOR", "PER", "EA", "EACH"}
+# Roman numerals after these words are levels ("ED VISIT LVL III" is "LEVEL
+# 3"); elsewhere "V" and "IV" stay abbreviations of VIEW and INTRAVENOUS
+NUMBERED_WORDS = {"LEVEL", "TYPE"}
+ROMAN_NUMERALS = {
+    "I": "1", "II": "2", "III": "3", "IV": "4", "V": "5",
+    "VI": "6", "VII": "7", "VIII": "8", "IX": "9", "X": "10",
+}
+# Numbers keep their decimals ("0.9", "3.5") but are split from units ("15MG")
+TOKEN_PATTERN = re.compile(r"W/WO|W/O|W/|X-RAY|\d+(?:\.\d+)?|[A-Z]+")
+
+
+def normalize_description(text: str) -> List[str]:
+    """Upper-case, tokenize and expand abbreviations and level numerals of a charge description."""
+    tokens: List[str] = []
+    for token in TOKEN_PATTERN.findall(text.upper()):
+        if tokens and tokens[-1] in NUMBERED_WORDS and token in ROMAN_NUMERALS:
+            tokens.append(ROMAN_NUMERALS[token])
+            continue
+        for word in ABBREVIATIONS.get(token, token).split():
+            if word not in STOP_WORDS:
+                tokens.append(word)
+    return tokens
+
+
+def word_trigrams(token: str) -> List[str]:
+    """"~"-prefixed character trigrams of a word padded with spaces."""
+    padded = f" {token} "
+    return [f"~{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+
+def description_terms(tokens: List[str]) -> List[str]:
+    """Whole-word terms plus the character trigrams of every word."""
+    terms = list(tokens)
+    for token in tokens:
+        terms.extend(word_trigrams(token))
+    return terms
+
+
+def build_description_index(chargemaster: Chargemaster, index_dir: Path) -> Dict[str, Any]:
+    """
+    Build the BM25 inverted index over the chargemaster's descriptions and
+    write it to index_dir.
+
+    Rows with the same normalized description share one document. Postings
+    store precomputed BM25 impacts, so a query only sums them.
+
+    Returns:
+        Index metadata: "documents", "terms", "postings" and "seconds"
+    """
+    start = time.perf_counter()
+    documents: Dict[str, int] = {}
+    document_rows: List[List[int]] = []
+    document_terms: List[Counter] = []
+    for row, description in enumerate(chargemaster.descriptions.to_list()):
+        tokens = normalize_description(description)
+        if not tokens:
+            continue
+        key = " ".join(tokens)
+        document = documents.get(key)
+        if document is None:
+            document = documents[key] = len(document_rows)
+            document_rows.append([])
+            document_terms.append(Counter(description_terms(tokens)))
+        document_rows[document].append(row)
+
+    word_counts = np.array(
+        [sum(not term.startswith("~") for term in terms) for terms in document_terms], dtype=np.int32
+    )
+    vocabulary: Dict[str, int] = {}
+    term_ids: List[int] = []
+    posting_docs: List[int] = []
+    frequencies: List[int] = []
+    lengths = np.zeros(len(document_terms), dtype=np.float64)
+    for document, terms in enumerate(document_terms):
+        for term, count in terms.items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            posting_docs.append(document)
+            frequencies.append(count)
+            if not term.startswith("~"):
+                lengths[document] += count
+
+    term_ids_array = np.array(term_ids, dtype=np.int64)
+    docs_array = np.array(posting_docs, dtype=np.int32)
+    tf = np.array(frequencies, dtype=np.float64)
+    document_count = max(1, len(document_terms))
+    df = np.bincount(term_ids_array, minlength=len(vocabulary)).astype(np.float64)
+    idf = np.log(1.0 + (document_count - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs_array] / max(lengths.mean() if len(lengths) else 1.0, 1.0))
+    impacts = idf[term_ids_array] * tf * (BM25_K1 + 1) / (tf + norm)
+    terms_list = list(vocabulary)
+    is_trigram = np.array([term.startswith("~") for term in terms_list], dtype=bool)
+    impacts *= np.where(is_trigram[term_ids_array], TRIGRAM_WEIGHT, 1.0)
+
+    order = np.argsort(term_ids_array, kind="stable")
+    posting_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(df.astype(np.int64), out=posting_offsets[1:])
+    row_offsets = np.zeros(len(document_rows) + 1, dtype=np.int64)
+    np.cumsum([len(rows) for rows in document_rows], out=row_offsets[1:])
+
+    index_dir = Path(index_dir)
+    temp_dir = index_dir.parent / f".tmp-{index_dir.name}-{uuid.uuid4().hex[:8]}"
+    temp_dir.mkdir(parents=True)
+    try:
+        write_string_table(temp_dir, "terms", terms_list)
+        np.save(temp_dir / "posting_offsets.npy", posting_offsets)
+        np.save(temp_dir / "posting_docs.npy", docs_array[order])
+        np.save(temp_dir / "posting_impacts.npy", impacts[order].astype(np.float32))
+        np.save(temp_dir / "word_counts.npy", word_counts)
+        np.save(temp_dir / "row_offsets.npy", row_offsets)
+        np.save(temp_dir / "rows.npy", np.array([row for rows in document_rows for row in rows], dtype=np.int32))
+        meta = {
+            "documents": len(document_rows),
+            "terms": len(terms_list),
+            "postings": len(docs_array),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        (temp_dir / "meta.json").write_text(json.dumps(meta))
+        try:
+            os.rename(temp_dir, index_dir)
+        except OSError:
+            # Another process built the index first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return meta
+
+
+class DescriptionIndex:
+    """
+    Memory-mapped BM25 index over chargemaster descriptions, for matching
+    bill line items that only have a description to reference charges.
+    """
+
+    def __init__(self, chargemaster: Chargemaster, index_dir: Path):
+        self.chargemaster = chargemaster
+        self.meta = json.loads((Path(index_dir) / "meta.json").read_text())
+        terms = StringTable(Path(index_dir), "terms").to_list()
+        self._term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        self.posting_offsets = np.load(Path(index_dir) / "posting_offsets.npy", mmap_mode="r")
+        self.posting_docs = np.load(Path(index_dir) / "posting_docs.npy", mmap_mode="r")
+        self.posting_impacts = np.load(Path(index_dir) / "posting_impacts.npy", mmap_mode="r")
+        self.word_counts = np.load(Path(index_dir) / "word_counts.npy", mmap_mode="r")
+        self.row_offsets = np.load(Path(index_dir) / "row_offsets.npy", mmap_mode="r")
+        self.rows = np.load(Path(index_dir) / "rows.npy", mmap_mode="r")
+        self.max_trigram_postings = max(1, int(self.meta["documents"] * MAX_TRIGRAM_DOC_FRACTION))
+
+    def __len__(self) -> int:
+        return self.meta["documents"]
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Return the k descriptions best matching query.
+
+        Known words are scored directly; words missing from the vocabulary
+        (misspelled or truncated) are matched through their trigrams.
+
+        Returns:
+            List of {"description", "score", "coverage",
+            "description_coverage", "rows", "codes", "cpt_codes"}, best
+            first, where coverage is the share of query words found in the
+            description (partially for trigram matches),
+            description_coverage the share of the description's distinct
+            words found in the query, rows are the chargemaster rows sharing
+            the description and cpt_codes their distinct non-empty CPT codes
+        """
+        # Each query word weighs 1, split across its trigrams if it is unknown
+        terms: Counter = Counter()
+        weights: Counter = Counter()
+        for token in normalize_description(query):
+            parts = [token] if token in self._term_ids else word_trigrams(token)
+            terms.update(parts)
+            for part in parts:
+                weights[part] += 1.0 / len(parts)
+        docs: List[np.ndarray] = []
+        impacts: List[np.ndarray] = []
+        shares: List[np.ndarray] = []
+        total_weight = 0.0
+        for term, count in terms.items():
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                total_weight += weights[term]
+                continue
+            start, stop = int(self.posting_offsets[term_id]), int(self.posting_offsets[term_id + 1])
+            if term.startswith("~") and stop - start > self.max_trigram_postings:
+                continue
+            total_weight += weights[term]
+            docs.append(self.posting_docs[start:stop])
+            impacts.append(self.posting_impacts[start:stop] * count)
+            shares.append(np.full(stop - start, weights[term]))
+        if not docs:
+            return []
+
+        matched, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(impacts))
+        matched_words = np.bincount(inverse, weights=np.concatenate(shares))
+        coverage = matched_words / total_weight
+        description_coverage = np.minimum(1.0, matched_words / np.maximum(1, self.word_counts[matched]))
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results = []
+        for position in top.tolist():
+            document = int(matched[position])
+            rows = self.rows[self.row_offsets[document]:self.row_offsets[document + 1]]
+            cpt_codes = [code for code in dict.fromkeys(self.chargemaster.cpt_codes[rows].tolist()) if code]
+            results.append({
+                "description": self.chargemaster.descriptions[int(rows[0])],
+                "score": round(float(scores[position]), 3),
+                "coverage": round(float(coverage[position]), 3),
+                "description_coverage": round(float(description_coverage[position]), 3),
+                "rows": rows.tolist(),
+                "codes": list(dict.fromkeys(self.chargemaster.codes[rows].tolist())),
+                "cpt_codes": cpt_codes,
+            })
+        return results
+
+
+def match_reference_codes(index: DescriptionIndex, descriptions: List[str]) -> List[Optional[str]]:
+    """
+    Find a CPT/HCPCS code for each line item description, taken from the
+    best matching chargemaster description.
+
+    Only the best match is used: a lower-ranked description with a code is
+    a different service, not a better-documented copy of the best one. If
+    the runner-up scores the same under a different code, the description
+    is ambiguous and takes no code.
+
+    Returns:
+        The matched code per description, None where the best match covers
+        too little of either description, has no code or ties with another
+        code
+    """
+    codes: List[Optional[str]] = []
+    for description in descriptions:
+        matches = index.search(description, 2) if description else []
+        code = None
+        if matches:
+            best = matches[0]
+            tied = (
+                len(matches) > 1
+                and matches[1]["score"] == best["score"]
+                and matches[1]["cpt_codes"]
+                and matches[1]["cpt_codes"] != best["cpt_codes"]
+            )
+            if (
+                best["cpt_codes"]
+                and not tied
+                and best["coverage"] >= MIN_MATCH_COVERAGE
+                and best["description_coverage"] >= MIN_MATCH_COVERAGE
+            ):
+                code = best["cpt_codes"][0]
+        codes.append(code)
+    return codes
+
+
+def load_description_index(chargemaster: Chargemaster) -> DescriptionIndex:
+    """Map the description index stored next to a chargemaster build, building it if missing."""
+    index_dir = chargemaster.build_dir / INDEX_DIR_NAME
+    if not (index_dir / "meta.json").exists():
+        build_description_index(chargemaster, index_dir)
+        for path in chargemaster.build_dir.glob("description_index*"):
+            if path.name != INDEX_DIR_NAME:
+                shutil.rmtree(path, ignore_errors=True)
+    return DescriptionIndex(chargemaster, index_dir)
+
+
+_description_index: Optional[DescriptionIndex] = None
+_description_index_lock = threading.Lock()
+
+
+def get_description_index() -> DescriptionIndex:
+    """Return the shared description index, loading it on first use."""
+    global _description_index
+    if _description_index is None:
+        with _description_index_lock:
+            if _description_index is None:
+                _description_index = load_description_index(get_chargemaster())
+    return _description_index
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    index = get_description_index()
+    print(f"Loaded {len(index)} descriptions in {(time.perf_counter() - start) * 1000:.1f}ms")
+    for query in sys.argv[1:]:
+        start = time.perf_counter()
+        matches = index.search(query)
+        print(f"{query!r} ({(time.perf_counter() - start) * 1e6:.0f}us):")
+        for match in matches:
+            print(f"  {match['score']:7.3f}  {match['description']}  {', '.join(match['cpt_codes'])}")
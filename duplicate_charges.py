@@ -0,0 +1,279 @@
+import hashlib
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Duplicate groups stored per bill and shown to the model, largest amount first
+DUPLICATE_MAX_GROUPS = int(os.environ.get("DUPLICATE_MAX_GROUPS", "20"))
+
+# Labels a bill uses for the patient, most reliable first
+PATIENT_NAME_PATTERN = re.compile(r"\bpatient(?:\s+name)?\s*[:#]\s*([A-Za-z][A-Za-z ,.'-]{1,60})", re.IGNORECASE)
+BIRTH_DATE_PATTERN = re.compile(
+    r"\b(?:DOB|date of birth|birth ?date)\s*[:#]?\s*(\d{1,2}/\d{1,2}/\d{2,4}|\d{4}-\d{2}-\d{2})", re.IGNORECASE
+)
+PATIENT_ID_PATTERN = re.compile(r"\b(?:MRN|medical record(?: number| no\.?| #)?|patient id)\s*[:#]?\s*([A-Z0-9-]{4,20})\b", re.IGNORECASE)
+PROVIDER_PATTERN = re.compile(
+    r"\b(?:provider|facility|hospital|billing provider|rendering provider)(?:\s+name)?\s*:\s*([^\n]{2,80})", re.IGNORECASE
+)
+# Name lines end at the next field on the same line, e.g. "Patient: JANE DOE  DOB: ..."
+FIELD_END_PATTERN = re.compile(r"\s{2,}|\s(?:DOB|MRN|account|acct|date)\b", re.IGNORECASE)
+
+
+def _clean_field(value: str) -> str:
+    value = FIELD_END_PATTERN.split(value.strip(), maxsplit=1)[0]
+    return " ".join(re.sub(r"[^A-Za-z0-9 ]", " ", value).upper().split())
+
+
+def extract_bill_identity(text: str) -> Dict[str, Optional[str]]:
+    """
+    Find who a bill is for and who issued it.
+
+    The patient is identified by name and date of birth, or by medical
+    record number, and only a hash of it is kept. The provider is the
+    labeled provider/facility, or the bill's first line without numbers.
+
+    Returns:
+        Dictionary with "patient_key" (None if the bill does not name the
+        patient) and "provider" ("" if unknown)
+    """
+    patient_key = None
+    name_match = PATIENT_NAME_PATTERN.search(text)
+    birth_match = BIRTH_DATE_PATTERN.search(text)
+    id_match = PATIENT_ID_PATTERN.search(text)
+    if name_match and birth_match:
+        identity = f"{_clean_field(name_match.group(1))}|{birth_match.group(1)}"
+    elif id_match:
+        identity = f"MRN|{id_match.group(1).upper()}"
+    else:
+        identity = None
+    if identity:
+        patient_key = hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+    provider = ""
+    provider_match = PROVIDER_PATTERN.search(text)
+    if provider_match:
+        provider = _clean_field(provider_match.group(1))
+    else:
+        for line in text.splitlines():
+            if line.strip() and re.search(r"[A-Za-z]{3}", line) and not re.search(r"\d", line):
+                provider = _clean_field(line)
+                break
+
+    return {"patient_key": patient_key, "provider": provider}
+
+
+def _key_hash(key: str) -> int:
+    # 64-bit hashes fit a BSON int64, so Mongo can index them directly
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def _service_identity(code: str, description: str) -> str:
+    if code:
+        return code
+    return " ".join(re.sub(r"[^A-Za-z0-9 ]", " ", description or "").upper().split())
+
+
+def charge_key_hashes(columns: Dict[str, List[Any]], provider: str = "") -> Tuple[List[int], List[int]]:
+    """
+    Hash the normalized duplicate key of every line item.
+
+    The exact key is (code, date of service, amount, provider); the near key
+    drops the amount, so the same service billed twice on the same day at
+    different amounts still collides. Items without a code use their
+    normalized description instead. Credits are keyed by their absolute
+    amount so they can cancel the charge they reverse.
+
+    Returns:
+        Lists of exact and near key hashes, aligned with the columns
+    """
+    exact: List[int] = []
+    near: List[int] = []
+    for code, description, service_date, amount in zip(
+        columns["codes"], columns["descriptions"], columns["service_dates"], columns["line_charge_cents"]
+    ):
+        date = service_date.strftime("%Y-%m-%d") if service_date else ""
+        near_key = f"{_service_identity(code, description)}|{date}|{provider}"
+        near.append(_key_hash(near_key))
+        exact.append(_key_hash(f"{near_key}|{abs(amount)}"))
+    return exact, near
+
+
+def ensure_charge_key_indexes(collection: Any) -> None:
+    """Index the stored key hashes of each patient's line items."""
+    collection.create_index([("patient_key", 1), ("charge_hashes", 1)])
+    collection.create_index([("patient_key", 1), ("near_charge_hashes", 1)])
+
+
+def store_charge_keys(
+    collection: Any,
+    bill_id: str,
+    identity: Dict[str, Optional[str]],
+    exact: List[int],
+    near: List[int],
+) -> None:
+    """Store a bill's patient, provider and key hashes on its line item document."""
+    collection.update_one(
+        {"bill_id": bill_id},
+        {
+            "$set": {
+                "patient_key": identity["patient_key"],
+                "provider": identity["provider"],
+                "charge_hashes": exact,
+                "near_charge_hashes": near,
+            }
+        },
+        upsert=True,
+    )
+
+
+def _item(bill_id: str, columns: Dict[str, List[Any]], position: int) -> Dict[str, Any]:
+    service_date = columns["service_dates"][position]
+    return {
+        "bill_id": bill_id,
+        "position": position,
+        "code": columns["codes"][position],
+        "description": columns["descriptions"][position],
+        "service_date": service_date.strftime("%Y-%m-%d") if service_date else None,
+        "amount_cents": int(columns["line_charge_cents"][position]),
+    }
+
+
+def find_duplicate_groups(
+    bills: List[Tuple[str, Dict[str, List[Any]], List[int], List[int]]],
+    bill_id: str,
+) -> List[Dict[str, Any]]:
+    """
+    Group line items sharing a duplicate key, in one pass over all items.
+
+    Args:
+        bills: (bill id, line item columns, exact hashes, near hashes) of the
+            bill being screened and the patient's other bills
+        bill_id: Bill being screened; only groups including it are reported
+
+    Returns:
+        Groups of {"kind": "exact" | "near", "items": [...]}; exact groups
+        repeat the same charge, near groups bill the same service on the
+        same day at different amounts
+    """
+    exact_groups: Dict[int, List[Tuple[str, Dict[str, List[Any]], int]]] = {}
+    near_groups: Dict[int, List[Tuple[str, Dict[str, List[Any]], int]]] = {}
+    credits: Dict[int, int] = {}
+    for owner, columns, exact, near in bills:
+        for position, (exact_hash, near_hash) in enumerate(zip(exact, near)):
+            amount = columns["line_charge_cents"][position]
+            if amount < 0:
+                credits[exact_hash] = credits.get(exact_hash, 0) + 1
+            elif amount > 0:
+                exact_groups.setdefault(exact_hash, []).append((owner, columns, position))
+                near_groups.setdefault(near_hash, []).append((owner, columns, position))
+
+    groups: List[Dict[str, Any]] = []
+    exact_positions = set()
+    for exact_hash, members in exact_groups.items():
+        # A credit reversing one of the copies leaves it a single charge
+        if len(members) - credits.get(exact_hash, 0) < 2 or all(owner != bill_id for owner, _, _ in members):
+            continue
+        groups.append({"kind": "exact", "items": [_item(owner, columns, position) for owner, columns, position in members]})
+        exact_positions.update((owner, position) for owner, _, position in members)
+
+    for members in near_groups.values():
+        amounts = {columns["line_charge_cents"][position] for _, columns, position in members}
+        if len(amounts) < 2 or all(owner != bill_id for owner, _, _ in members):
+            continue
+        if all((owner, position) in exact_positions for owner, _, position in members):
+            continue
+        groups.append({"kind": "near", "items": [_item(owner, columns, position) for owner, columns, position in members]})
+
+    groups.sort(key=lambda group: -max(item["amount_cents"] for item in group["items"]))
+    return groups
+
+
+def screen_duplicate_charges(
+    bill_id: str,
+    columns: Dict[str, List[Any]],
+    identity: Dict[str, Optional[str]],
+    collection: Optional[Any] = None,
+    content_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Find duplicate charges within a bill and across the patient's other bills.
+
+    The bill's key hashes are stored on its line item document, and the
+    patient's other bills are fetched through the key hash indexes, so only
+    bills sharing at least one key are read.
+
+    Args:
+        bill_id: UUID of the bill
+        columns: The bill's line item columns (see line_items.parse_line_items)
+        identity: Output of extract_bill_identity for the bill text
+        collection: Line item collection; without it only the bill itself is checked
+        content_hash: Content hash of the bill file; other uploads of the
+            same file are not counted as duplicates
+
+    Returns:
+        Dictionary with the number of "checked" items and "bills", counts of
+        "exact" and "near" groups and the "groups" themselves
+    """
+    exact, near = charge_key_hashes(columns, identity["provider"] or "")
+    bills = [(bill_id, columns, exact, near)]
+
+    if collection is not None:
+        try:
+            store_charge_keys(collection, bill_id, identity, exact, near)
+            if identity["patient_key"] and exact:
+                query: Dict[str, Any] = {
+                    "patient_key": identity["patient_key"],
+                    "bill_id": {"$ne": bill_id},
+                    "$or": [{"charge_hashes": {"$in": exact}}, {"near_charge_hashes": {"$in": near}}],
+                }
+                if content_hash:
+                    query["content_hash"] = {"$ne": content_hash}
+                projection = {
+                    "bill_id": 1,
+                    "codes": 1,
+                    "descriptions": 1,
+                    "service_dates": 1,
+                    "line_charge_cents": 1,
+                    "charge_hashes": 1,
+                    "near_charge_hashes": 1,
+                }
+                for document in collection.find(query, projection):
+                    bills.append(
+                        (document["bill_id"], document, document["charge_hashes"], document["near_charge_hashes"])
+                    )
+        except Exception as e:
+            print(f"Warning: Cross-bill duplicate check failed for bill {bill_id}: {str(e)}")
+
+    groups = find_duplicate_groups(bills, bill_id)
+    return {
+        "checked": len(exact),
+        "bills": len(bills),
+        "exact": sum(group["kind"] == "exact" for group in groups),
+        "near": sum(group["kind"] == "near" for group in groups),
+        "groups": groups[:DUPLICATE_MAX_GROUPS],
+        "screened_at": datetime.now(),
+    }
+
+
+def format_duplicate_findings(screen: Optional[Dict[str, Any]], bill_id: Optional[str] = None) -> Optional[str]:
+    """Render a duplicate charge screen as prompt text, or None if nothing was found."""
+    if not screen or not screen["groups"]:
+        return None
+    lines = [
+        f"{screen['exact']} exact and {screen['near']} near-duplicate charge groups found "
+        f"(same code, date of service and provider; exact groups also share the amount). "
+        f"Charges repeated on another bill may also be a restated bill for the same visit:"
+    ]
+    for group in screen["groups"]:
+        first = group["items"][0]
+        where = ", ".join(
+            ("this bill" if item["bill_id"] == bill_id else f"bill {item['bill_id']}") + f" ${item['amount_cents'] / 100:,.2f}"
+            for item in group["items"]
+        )
+        label = "Exact duplicate" if group["kind"] == "exact" else "Near duplicate"
+        lines.append(
+            f"- {label}: {first['code'] or '(no code)'} {first['description']} on "
+            f"{first['service_date'] or 'unknown date'}, billed {len(group['items'])} times ({where})"
+        )
+    return "\n".join(lines)
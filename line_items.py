@@ -0,0 +1,220 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Billing codes, most specific first: HCPCS Level II, CPT Category II/III,
+# CPT, and UB-04 revenue codes
+CODE_PATTERNS = [
+    ("HCPCS", re.compile(r"\b([A-V]\d{4})\b")),
+    ("CPT", re.compile(r"\b(\d{4}[FT])\b")),
+    ("CPT", re.compile(r"\b(\d{5})\b")),
+    ("REV", re.compile(r"\b(0\d{3})\b")),
+]
+AMOUNT_PATTERN = re.compile(r"(?<![\w/])\(?-?\$?\s?(\d{1,3}(?:,\d{3})*|\d+)\.(\d{2})\)?(?![\w/])")
+DATE_PATTERN = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})\b|\b(\d{4})-(\d{2})-(\d{2})\b")
+QUANTITY_PATTERN = re.compile(r"\b(?:qty|quantity|units?)\s*[:#]?\s*(\d{1,4})\b|\b(\d{1,4})\s*(?:x|@)\s", re.IGNORECASE)
+# A bare number just before the amount column, e.g. "CT HEAD W/O CONTRAST 2 $90.00"
+TRAILING_NUMBER_PATTERN = re.compile(r"\s(\d{1,3})\s*$")
+# Lines carrying totals or payments rather than services
+SKIP_PATTERN = re.compile(
+    r"\b(sub\s*total|total|balance|amount due|payment|paid|adjustment|insurance paid|patient responsibility)\b",
+    re.IGNORECASE,
+)
+
+# Column names of the per-bill line item document, all of equal length
+LINE_ITEM_COLUMNS = [
+    "codes",
+    "code_types",
+    "descriptions",
+    "quantities",
+    "unit_charge_cents",
+    "line_charge_cents",
+    "service_dates",
+]
+
+
+def _parse_date(match: "re.Match") -> Optional[datetime]:
+    try:
+        if match.group(1):
+            month, day, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+            if year < 100:
+                year += 2000
+            return datetime(year, month, day)
+        return datetime(int(match.group(4)), int(match.group(5)), int(match.group(6)))
+    except ValueError:
+        return None
+
+
+def parse_line_item(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one line of bill text into a line item.
+
+    Returns:
+        Dictionary with code, code_type, description, quantity,
+        unit_charge_cents, line_charge_cents and service_date, or None if
+        the line is not a charge line
+    """
+    if SKIP_PATTERN.search(line):
+        return None
+
+    amounts = list(AMOUNT_PATTERN.finditer(line))
+    if not amounts:
+        return None
+
+    def cents(match: "re.Match") -> int:
+        value = int(match.group(1).replace(",", "")) * 100 + int(match.group(2))
+        negative = match.group(0).startswith(("(", "-"))
+        return -value if negative else value
+
+    remainder = line
+    for match in amounts:
+        remainder = remainder.replace(match.group(0), " ")
+
+    service_date = None
+    date_match = DATE_PATTERN.search(remainder)
+    if date_match:
+        service_date = _parse_date(date_match)
+        remainder = remainder.replace(date_match.group(0), " ")
+
+    code, code_type = None, None
+    for pattern_type, pattern in CODE_PATTERNS:
+        code_match = pattern.search(remainder)
+        if code_match:
+            code, code_type = code_match.group(1), pattern_type
+            remainder = remainder[: code_match.start()] + " " + remainder[code_match.end():]
+            break
+
+    quantity = 1
+    quantity_match = QUANTITY_PATTERN.search(remainder)
+    if quantity_match:
+        quantity = int(quantity_match.group(1) or quantity_match.group(2)) or 1
+        remainder = remainder.replace(quantity_match.group(0), " ")
+    else:
+        # Only trust a bare trailing number as a quantity when the amounts
+        # confirm it (unit x quantity = line total), since descriptions often
+        # end in numbers such as "LEVEL 5"
+        trailing_match = TRAILING_NUMBER_PATTERN.search(remainder.rstrip())
+        if trailing_match:
+            candidate = int(trailing_match.group(1))
+            if candidate == 1 or (
+                len(amounts) > 1 and candidate and cents(amounts[0]) * candidate == cents(amounts[-1])
+            ):
+                quantity = candidate
+                remainder = remainder.rstrip()[: trailing_match.start()]
+
+    description = " ".join(remainder.replace("$", " ").split()).strip(" -:|")
+    if not code and not description:
+        return None
+
+    line_charge = cents(amounts[-1])
+    unit_charge = cents(amounts[0]) if len(amounts) > 1 and quantity > 1 else line_charge // quantity
+
+    return {
+        "code": code or "",
+        "code_type": code_type or "",
+        "description": description,
+        "quantity": quantity,
+        "unit_charge_cents": unit_charge,
+        "line_charge_cents": line_charge,
+        "service_date": service_date,
+    }
+
+
+def parse_line_items(text: str) -> Dict[str, List[Any]]:
+    """
+    Parse bill text into line item columns (see LINE_ITEM_COLUMNS).
+
+    Each charge line becomes one position in every column, so the columns
+    can be stored and scanned without per-item documents.
+    """
+    columns: Dict[str, List[Any]] = {name: [] for name in LINE_ITEM_COLUMNS}
+    for line in text.splitlines():
+        item = parse_line_item(line)
+        if item is None:
+            continue
+        columns["codes"].append(item["code"])
+        columns["code_types"].append(item["code_type"])
+        columns["descriptions"].append(item["description"])
+        columns["quantities"].append(item["quantity"])
+        columns["unit_charge_cents"].append(item["unit_charge_cents"])
+        columns["line_charge_cents"].append(item["line_charge_cents"])
+        columns["service_dates"].append(item["service_date"])
+    return columns
+
+
+def save_line_items(
+    collection: Any,
+    bill_id: str,
+    columns: Dict[str, List[Any]],
+    content_hash: Optional[str] = None,
+    source: str = "text",
+) -> int:
+    """
+    Store a bill's line items as a single document of parallel columns.
+
+    Returns:
+        Number of line items stored
+    """
+    count = len(columns["codes"])
+    collection.update_one(
+        {"bill_id": bill_id},
+        {
+            "$set": {
+                **columns,
+                "bill_id": bill_id,
+                "content_hash": content_hash,
+                "source": source,
+                "count": count,
+                "extracted_at": datetime.now(),
+            }
+        },
+        upsert=True,
+    )
+    return count
+
+
+def load_line_item_columns(documents: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Concatenate line item documents into NumPy columns for vectorized scans.
+
+    Args:
+        documents: Line item documents, e.g. a cursor over the line item
+            collection projected to the needed columns
+
+    Returns:
+        Dictionary of equal-length arrays: bill_ids, codes, descriptions,
+        quantities (int32), unit_charge_cents and line_charge_cents (int64)
+        and service_dates (datetime64[D], NaT when unknown)
+    """
+    bill_ids: List[str] = []
+    codes: List[str] = []
+    descriptions: List[str] = []
+    quantities: List[int] = []
+    unit_charges: List[int] = []
+    line_charges: List[int] = []
+    dates: List[Any] = []
+
+    for document in documents:
+        count = document.get("count", len(document.get("codes", [])))
+        bill_ids.extend([document["bill_id"]] * count)
+        codes.extend(document.get("codes", []))
+        descriptions.extend(document.get("descriptions", [""] * count))
+        quantities.extend(document.get("quantities", [1] * count))
+        unit_charges.extend(document.get("unit_charge_cents", [0] * count))
+        line_charges.extend(document.get("line_charge_cents", [0] * count))
+        dates.extend(
+            np.datetime64(value, "D") if value is not None else np.datetime64("NaT")
+            for value in document.get("service_dates", [None] * count)
+        )
+
+    return {
+        "bill_ids": np.array(bill_ids, dtype=object),
+        "codes": np.array(codes, dtype="U8"),
+        "descriptions": np.array(descriptions, dtype=object),
+        "quantities": np.array(quantities, dtype=np.int32),
+        "unit_charge_cents": np.array(unit_charges, dtype=np.int64),
+        "line_charge_cents": np.array(line_charges, dtype=np.int64),
+        "service_dates": np.array(dates, dtype="datetime64[D]"),
+    }
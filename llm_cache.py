@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from cache_stats import get_counter
+
+# Cached responses expire after this many seconds via a Mongo TTL index
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Number of responses kept in the in-process LRU in front of Mongo
+LLM_CACHE_MEMORY_SIZE = int(os.environ.get("LLM_CACHE_MEMORY_SIZE", "256"))
+# Rounds of tool calls answered before the model is asked for its final answer
+MAX_TOOL_ROUNDS = 3
+
+
+def make_cache_key(model: str, messages: List[Dict[str, Any]], **params: Any) -> str:
+    """Hash the model, prompt messages and sampling params into a cache key."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-level cache of chat completion responses: an in-process LRU in front
+    of a Mongo collection whose entries expire through a TTL index.
+    """
+
+    def __init__(self, collection: Any, memory_size: int = LLM_CACHE_MEMORY_SIZE):
+        self.collection = collection
+        self.memory_size = memory_size
+        self.counter = get_counter("llm_cache")
+        self.memory_counter = get_counter("llm_cache_memory")
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._indexes_ready = False
+
+    def ensure_indexes(self) -> None:
+        """Create the unique key index and the TTL index on created_at."""
+        if self._indexes_ready:
+            return
+        self.collection.create_index("key", unique=True)
+        self.collection.create_index("created_at", expireAfterSeconds=LLM_CACHE_TTL_SECONDS)
+        self._indexes_ready = True
+
+    def _remember(self, key: str, content: str) -> None:
+        with self._lock:
+            self._memory[key] = content
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+        if content is not None:
+            self.memory_counter.hit()
+            self.counter.hit()
+            return content
+        self.memory_counter.miss()
+
+        try:
+            self.ensure_indexes()
+            document = self.collection.find_one({"key": key}, {"content": 1})
+        except Exception as e:
+            print(f"Warning: LLM cache lookup failed: {str(e)}")
+            document = None
+
+        if not document:
+            self.counter.miss()
+            return None
+
+        self.counter.hit()
+        self._remember(key, document["content"])
+        return document["content"]
+
+    def put(self, key: str, content: str, model: str) -> None:
+        """Store a response in memory and in Mongo."""
+        self._remember(key, content)
+        try:
+            self.ensure_indexes()
+            self.collection.update_one(
+                {"key": key},
+                {"$set": {"content": content, "model": model, "created_at": datetime.now()}},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Warning: LLM cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return overall and in-memory hit-rate metrics."""
+        with self._lock:
+            memory_entries = len(self._memory)
+        return {
+            **self.counter.snapshot(),
+            "memory": self.memory_counter.snapshot(),
+            "memory_entries": memory_entries,
+        }
+
+
+def _run_tool_call(name: str, arguments: str, tool_handlers: Dict[str, Callable[[str], str]]) -> str:
+    handler = tool_handlers.get(name)
+    if handler is None:
+        return json.dumps({"error": f"Unknown tool {name}"})
+    try:
+        return handler(arguments)
+    except Exception as e:
+        print(f"Warning: Tool {name} failed: {str(e)}")
+        return json.dumps({"error": str(e)})
+
+
+def _answer_tool_calls(
+    conversation: List[Dict[str, Any]],
+    content: Optional[str],
+    tool_calls: List[Dict[str, str]],
+    tool_handlers: Dict[str, Callable[[str], str]],
+) -> None:
+    """Append the assistant's tool calls ({"id", "name", "arguments"}) and their results to the conversation."""
+    conversation.append({
+        "role": "assistant",
+        "content": content,
+        "tool_calls": [
+            {
+                "id": tool_call["id"],
+                "type": "function",
+                "function": {"name": tool_call["name"], "arguments": tool_call["arguments"]},
+            }
+            for tool_call in tool_calls
+        ],
+    })
+    for tool_call in tool_calls:
+        conversation.append({
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "content": _run_tool_call(tool_call["name"], tool_call["arguments"], tool_handlers),
+        })
+
+
+def cached_chat_completion(
+    client: Any,
+    cache: LLMResponseCache,
+    model: str,
+    messages: List[Dict[str, Any]],
+    use_cache: bool = True,
+    refresh: bool = False,
+    tool_handlers: Optional[Dict[str, Callable[[str], str]]] = None,
+    **params: Any,
+) -> str:
+    """
+    Run a chat completion through the response cache.
+
+    If tool_handlers are given (with matching "tools" in params), tool calls
+    made by the model are answered locally and the conversation continued
+    until it returns a final answer, which is what gets cached.
+
+    Args:
+        client: OpenAI client
+        cache: Response cache to read from and write to
+        model: Model name
+        messages: Chat messages
+        use_cache: Set to False to bypass the cache entirely
+        refresh: Set to True to skip the cached response and store a fresh one
+        tool_handlers: Tool name to function taking the JSON arguments and
+            returning the tool result content
+        **params: Sampling params passed to the API and included in the key
+
+    Returns:
+        The response message content
+    """
+    key = make_cache_key(model, messages, **params)
+    if use_cache and not refresh:
+        content = cache.get(key)
+        if content is not None:
+            return content
+
+    conversation = list(messages)
+    for tool_round in range(MAX_TOOL_ROUNDS + 1):
+        request_params = params
+        if tool_handlers and tool_round == MAX_TOOL_ROUNDS:
+            request_params = {**params, "tool_choice": "none"}
+        response = client.chat.completions.create(model=model, messages=conversation, **request_params)
+        message = response.choices[0].message
+        if not tool_handlers or not message.tool_calls:
+            break
+        _answer_tool_calls(
+            conversation,
+            message.content,
+            [
+                {"id": tool_call.id, "name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                for tool_call in message.tool_calls
+            ],
+            tool_handlers,
+        )
+    content = message.content
+
+    if use_cache and content:
+        cache.put(key, content, model)
+    return content
+
+
+def stream_chat_completion(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, Any]],
+    tool_handlers: Optional[Dict[str, Callable[[str], str]]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    **params: Any,
+) -> Iterator[str]:
+    """
+    Stream a chat completion, yielding its text as it arrives.
+
+    Takes the same tools as cached_chat_completion: tool calls streamed by
+    the model are answered locally and the conversation streamed again, so
+    a streamed answer is grounded like a blocking one and can share its
+    cache entry. Nothing is cached here; the caller caches the full text.
+
+    Args:
+        client: OpenAI client
+        model: Model name
+        messages: Chat messages
+        tool_handlers: Tool name to function taking the JSON arguments and
+            returning the tool result content
+        usage: Dictionary the "prompt_tokens" and "completion_tokens" the
+            API reports for all requests are added to
+        **params: Sampling params passed to the API
+
+    Yields:
+        Pieces of the response text in order
+    """
+    conversation = list(messages)
+    for tool_round in range(MAX_TOOL_ROUNDS + 1):
+        request_params = params
+        if tool_handlers and tool_round == MAX_TOOL_ROUNDS:
+            request_params = {**params, "tool_choice": "none"}
+        stream = client.chat.completions.create(
+            model=model,
+            messages=conversation,
+            stream=True,
+            stream_options={"include_usage": True},
+            **request_params,
+        )
+        pieces: List[str] = []
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        for chunk in stream:
+            if chunk.usage is not None and usage is not None:
+                usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + chunk.usage.prompt_tokens
+                usage["completion_tokens"] = usage.get("completion_tokens", 0) + chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            # Tool calls arrive in fragments keyed by their index
+            for fragment in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                if fragment.id:
+                    tool_call["id"] = fragment.id
+                if fragment.function is not None:
+                    tool_call["name"] += fragment.function.name or ""
+                    tool_call["arguments"] += fragment.function.arguments or ""
+            if delta.content:
+                pieces.append(delta.content)
+                yield delta.content
+        if not tool_handlers or not tool_calls:
+            return
+        _answer_tool_calls(
+            conversation,
+            "".join(pieces) or None,
+            [tool_calls[index] for index in sorted(tool_calls)],
+            tool_handlers,
+        )
@@ -1,19 +1,67 @@
-from openai import OpenAI
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from pymongo import MongoClient
-import PyPDF2
-from typing import Optional, Dict, Any
+import base64
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterator, List, Tuple
 
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
-MONGO_DB = os.environ.get("MONGO_DB", "app_database")
+from bill_chunker import ANALYSIS_TOKEN_BUDGET, CHUNK_TOKEN_BUDGET, count_tokens, split_bill_text
+from bill_content import delete_checkpoint, load_checkpoint, load_text, save_checkpoint, store_screen, store_text
+from database import LazyCollection
+from llm_cache import LLMResponseCache, cached_chat_completion, make_cache_key, stream_chat_completion
+from page_cache import file_content_hash, get_page_cache
+from page_render import MIME_TYPES, RENDER_FORMAT, render_page
+from pdf_text import extract_pdf_pages, extraction_summary
+from duplicate_charges import format_duplicate_findings
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# The OpenAI SDK and the NumPy-based screening modules (bill_screening,
+# overcharge, price_index) are imported on first use, keeping this module
+# quick to import for the upload page, workers and tests
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from price_index import PriceIndex
 
-# Initialize MongoDB client
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[MONGO_DB]
-bills_collection = db["bills"]
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+ANALYSIS_MODEL = "gpt-4"
+# Number of chunks of a long bill analyzed at once in the map step
+MAP_CONCURRENCY = int(os.environ.get("MAP_CONCURRENCY", "4"))
+# How often a streaming analysis is checkpointed to the bill document
+STREAM_CHECKPOINT_TOKENS = int(os.environ.get("STREAM_CHECKPOINT_TOKENS", "50"))
+STREAM_CHECKPOINT_SECONDS = float(os.environ.get("STREAM_CHECKPOINT_SECONDS", "2"))
+# Let the model look up chargemaster reference prices while analyzing
+PRICE_LOOKUP_ENABLED = os.environ.get("PRICE_LOOKUP_ENABLED", "true").lower() == "true"
+
+_client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+# MongoDB collections, connected through the shared client on first use
+bills_collection = LazyCollection("bills")
+
+# Analyses are cached by (model, prompt, sampling params) so unchanged bills
+# are not sent to GPT-4 again
+response_cache = LLMResponseCache(LazyCollection("llm_cache"))
+# Extracted page text, keyed by file content hash
+text_cache_collection = LazyCollection("pdf_text")
+# Parsed line items, one document of parallel columns per bill
+line_items_collection = LazyCollection("bill_line_items")
+# Analyses and stream checkpoints, referenced from the bill by content hash
+content_collection = LazyCollection("bill_content")
+
+# Bill fields an analysis reads; the stored screens are left on the server
+ANALYSIS_BILL_FIELDS = {"_id": 0, "id": 1, "path": 1, "duplicate_of": 1}
+
+def get_openai_client() -> "OpenAI":
+    """Return the shared OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                
+                _client = OpenAI(api_key=OPENAI_API_KEY)
+    return _client
 
 ## this is basic chat completion, change once org gets access to reasoning capability
 system_message = """
@@ -39,51 +87,105 @@ When reviewing medical bills or insurance issues, look for:
 Always provide actionable advice and explain the legal basis for any disputes you recommend.
 """
 
-def extract_text_from_pdf(file_path: Path) -> str:
-    """Extract text content from a PDF file."""
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
-    except Exception as e:
-        raise Exception(f"Failed to extract text from PDF: {str(e)}")
-
-def get_bill_by_id(bill_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieve bill document from MongoDB by ID."""
-    return bills_collection.find_one({"id": bill_id})
+def ocr_page_with_vision(file_path: Path, page_number: int, content_hash: Optional[str] = None) -> str:
+    """Transcribe the text of an image-only PDF page with the vision model."""
+    page = render_page(file_path, page_number, content_hash=content_hash, cache=get_page_cache())
+    img_base64 = base64.b64encode(page["image"]).decode("utf-8")
+    mime_type = MIME_TYPES.get(RENDER_FORMAT, "image/jpeg")
+    
+    response = get_openai_client().chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": "You transcribe scanned medical bills. Output only the text on the page, keeping each line item on its own line with its code, description, date and amount."
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Transcribe page {page_number} of this bill."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{mime_type};base64,{img_base64}"}
+                    }
+                ]
+            }
+        ]
+    )
+    return response.choices[0].message.content or ""
 
-def analyze_medical_bill(bill_id: str) -> Dict[str, Any]:
+def extract_bill_text(file_path: Path) -> Dict[str, Any]:
     """
-    Analyze a medical bill for issues and provide legal advice.
+    Extract the text of each page of a bill PDF.
+    
+    Pages are extracted in parallel and cached by file content hash; pages
+    without a text layer (scanned or image-only bills) are transcribed with
+    the vision model.
     
-    Args:
-        bill_id: UUID of the bill to analyze
-        
     Returns:
-        Dictionary containing analysis results and recommendations
+        Dictionary with "pages", per-page "methods" ("text"/"ocr"/"empty"),
+        extraction "seconds", "content_hash" and whether it was "cached"
     """
-    # Get bill from database
-    bill_doc = get_bill_by_id(bill_id)
-    if not bill_doc:
-        raise Exception(f"Bill with ID {bill_id} not found")
-    
-    # Extract text from PDF
-    file_path = Path(bill_doc["path"])
-    if not file_path.exists():
-        raise Exception(f"Bill file not found at {file_path}")
-    
-    bill_text = extract_text_from_pdf(file_path)
+    content_hash = file_content_hash(file_path)
+    return extract_pdf_pages(
+        file_path,
+        ocr_page=lambda path, page_number: ocr_page_with_vision(path, page_number, content_hash),
+        cache_collection=text_cache_collection,
+        content_hash=content_hash
+    )
+
+def extract_pages_from_pdf(file_path: Path) -> List[str]:
+    """Extract the text content of each page of a PDF file."""
+    return extract_bill_text(file_path)["pages"]
+
+def extract_text_from_pdf(file_path: Path) -> str:
+    """Extract text content from a PDF file."""
+    return "\n".join(extract_pages_from_pdf(file_path)).strip()
+
+def extract_line_items(bill_id: str, extraction: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Parse line items from extracted bill text and store them as columns."""
+    import bill_screening
     
+    return bill_screening.extract_line_items(line_items_collection, bill_id, extraction)
+
+def get_bill_by_id(bill_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Retrieve bill document from MongoDB by ID, only the projected fields if given."""
+    return bills_collection.find_one({"id": bill_id}, projection)
+
+def price_findings_section(price_findings: Optional[str]) -> str:
+    """Prompt section with the reference price screen of the bill's line items."""
+    if not price_findings:
+        return ""
+    return f"""
+    REFERENCE PRICE SCREEN (line items compared with published hospital chargemaster prices):
+    {price_findings}
+"""
+
+def duplicate_findings_section(duplicate_findings: Optional[str]) -> str:
+    """Prompt section with the duplicate charges found in the bill and the patient's other bills."""
+    if not duplicate_findings:
+        return ""
+    return f"""
+    DUPLICATE CHARGE SCREEN (line items sharing code, date of service and provider):
+    {duplicate_findings}
+"""
+
+def build_analysis_messages(
+    bill_text: str,
+    price_findings: Optional[str] = None,
+    duplicate_findings: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Build the chat messages asking for a legal analysis of the bill text."""
     # Create user query with bill content
     user_query = f"""
     Please analyze this medical bill for potential issues, errors, and billing irregularities:
 
     MEDICAL BILL CONTENT:
     {bill_text}
-
+{price_findings_section(price_findings)}{duplicate_findings_section(duplicate_findings)}
     Please provide:
     1. A summary of the bill
     2. Any potential issues or red flags you identify
@@ -92,35 +194,604 @@ def analyze_medical_bill(bill_id: str) -> Dict[str, Any]:
     5. Next steps the patient should take
     """
     
-    # Get AI analysis
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {
-                "role": "system",
-                "content": system_message
-            },
-            {
-                "role": "user",
-                "content": user_query
-            }
-        ]
+    return [
+        {
+            "role": "system",
+            "content": system_message
+        },
+        {
+            "role": "user",
+            "content": user_query
+        }
+    ]
+
+def build_map_messages(chunk_text: str, part: int, total_parts: int) -> List[Dict[str, str]]:
+    """Build the messages for analyzing one chunk of a long bill."""
+    user_query = f"""
+    This is part {part} of {total_parts} of a long medical bill. Do not write a final report yet.
+
+    MEDICAL BILL CONTENT (PART {part} OF {total_parts}):
+    {chunk_text}
+
+    List concisely:
+    1. Every line item with its code, description, date of service and amount
+    2. Totals, payments and adjustments shown in this part
+    3. Any potential issues or red flags in this part (incorrect codes, duplicates, inflated charges, services not received, coverage problems)
+    """
+    
+    return [
+        {
+            "role": "system",
+            "content": system_message
+        },
+        {
+            "role": "user",
+            "content": user_query
+        }
+    ]
+
+def build_reduce_messages(
+    notes: List[str],
+    price_findings: Optional[str] = None,
+    duplicate_findings: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Build the messages merging per-chunk notes into the final report."""
+    joined_notes = "\n\n".join(
+        f"NOTES FOR PART {index} OF {len(notes)}:\n{note}" for index, note in enumerate(notes, start=1)
     )
+    user_query = f"""
+    A long medical bill was reviewed in parts. Here are the notes from each part:
+
+    {joined_notes}
+{price_findings_section(price_findings)}{duplicate_findings_section(duplicate_findings)}
+    Based on all parts together, please provide:
+    1. A summary of the bill
+    2. Any potential issues or red flags you identify
+    3. Specific recommendations for disputing incorrect charges
+    4. Legal basis for any disputes you recommend
+    5. Next steps the patient should take
+    """
+    
+    return [
+        {
+            "role": "system",
+            "content": system_message
+        },
+        {
+            "role": "user",
+            "content": user_query
+        }
+    ]
+
+def reference_price_index() -> Optional["PriceIndex"]:
+    """Return the chargemaster price index, or None if it is disabled or not built."""
+    if not PRICE_LOOKUP_ENABLED:
+        return None
+    import bill_screening
+    
+    return bill_screening.reference_price_index()
+
+def price_lookup_params() -> Dict[str, Any]:
+    """Completion parameters exposing the lookup_reference_prices tool, if reference prices are available."""
+    index = reference_price_index()
+    if index is None:
+        return {}
+    from price_index import PRICE_LOOKUP_TOOL, price_lookup_tool_handlers
+    
+    return {"tools": [PRICE_LOOKUP_TOOL], "tool_handlers": price_lookup_tool_handlers(index)}
+
+def analysis_cache_key(messages: List[Dict[str, str]]) -> str:
+    """
+    Cache key of an analysis completion, the same one cached_chat_completion
+    uses in _run_stage, so streamed, blocking and batch analyses of the same
+    prompt share cached responses.
+    """
+    params = {name: value for name, value in price_lookup_params().items() if name != "tool_handlers"}
+    return make_cache_key(ANALYSIS_MODEL, messages, **params)
+
+def screen_overcharges(line_items: Dict[str, List[Any]]) -> Optional[Dict[str, Any]]:
+    """Screen a bill's line items against chargemaster reference prices."""
+    import bill_screening
+    
+    return bill_screening.screen_overcharges(reference_price_index(), line_items)
+
+def screen_duplicates(bill_id: str, extraction: Dict[str, Any], line_items: Dict[str, List[Any]]) -> Optional[Dict[str, Any]]:
+    """Screen a bill's line items for duplicate charges within it and across the patient's bills."""
+    import bill_screening
+    
+    return bill_screening.screen_duplicates(line_items_collection, bill_id, extraction, line_items)
+
+def _run_stage(
+    messages_list: List[List[Dict[str, str]]],
+    use_cache: bool,
+    refresh: bool,
+    client: Optional[Any] = None
+) -> Tuple[List[str], Dict[str, Any]]:
+    """Run a list of completions concurrently and report their token usage."""
+    start = time.perf_counter()
+    client = client or get_openai_client()
     
-    analysis_result = response.choices[0].message.content
+    def complete(messages):
+        return cached_chat_completion(
+            client,
+            response_cache,
+            model=ANALYSIS_MODEL,
+            messages=messages,
+            use_cache=use_cache,
+            refresh=refresh,
+            **price_lookup_params()
+        )
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(MAP_CONCURRENCY, len(messages_list)))) as pool:
+        outputs = list(pool.map(complete, messages_list))
+    
+    stats = {
+        "calls": len(messages_list),
+        "prompt_tokens": sum(
+            count_tokens(message["content"], ANALYSIS_MODEL) for messages in messages_list for message in messages
+        ),
+        "completion_tokens": sum(count_tokens(output or "", ANALYSIS_MODEL) for output in outputs),
+        "seconds": round(time.perf_counter() - start, 2)
+    }
+    return outputs, stats
+
+def prepare_final_messages(
+    pages: List[str],
+    use_cache: bool = True,
+    refresh: bool = False,
+    price_findings: Optional[str] = None,
+    duplicate_findings: Optional[str] = None,
+    client: Optional[Any] = None
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Build the messages for the final five-section report.
+    
+    Short bills go into a single prompt. Long bills are split on page and
+    line-item boundaries into chunks of at most CHUNK_TOKEN_BUDGET tokens,
+    the chunks are analyzed concurrently (map), and the final messages merge
+    their notes (reduce).
+    
+    Args:
+        pages: Text of each page of the bill
+        use_cache: Set to False to bypass the LLM response cache entirely
+        refresh: Set to True to ignore cached responses and store fresh ones
+        price_findings: Reference price screen added to the final prompt
+        duplicate_findings: Duplicate charge screen added to the final prompt
+        client: OpenAI client to send the requests with (defaults to
+            get_openai_client(); batch_analysis passes a rate-limited one)
+        
+    Returns:
+        Tuple of (final messages, statistics of the stages run so far)
+    """
+    bill_text = "\n".join(pages).strip()
+    bill_tokens = count_tokens(bill_text, ANALYSIS_MODEL)
     
-    # Update bill status in database
-    bills_collection.update_one(
-        {"id": bill_id},
-        {"$set": {"status": "analyzed", "analysis": analysis_result}}
+    if bill_tokens <= ANALYSIS_TOKEN_BUDGET:
+        return build_analysis_messages(bill_text, price_findings, duplicate_findings), {"mode": "single", "bill_tokens": bill_tokens, "stages": {}}
+    
+    chunks = split_bill_text(pages, CHUNK_TOKEN_BUDGET, ANALYSIS_MODEL)
+    notes, map_stage = _run_stage(
+        [build_map_messages(chunk, index, len(chunks)) for index, chunk in enumerate(chunks, start=1)],
+        use_cache,
+        refresh,
+        client
+    )
+    stages = {"map": map_stage}
+    
+    # Condense the notes again if there are too many to merge in one prompt
+    round_number = 1
+    while count_tokens("\n\n".join(notes), ANALYSIS_MODEL) > ANALYSIS_TOKEN_BUDGET and len(notes) > 1:
+        groups = split_bill_text(notes, CHUNK_TOKEN_BUDGET, ANALYSIS_MODEL)
+        if len(groups) >= len(notes):
+            break
+        notes, stages[f"condense_{round_number}"] = _run_stage(
+            [build_map_messages(group, index, len(groups)) for index, group in enumerate(groups, start=1)],
+            use_cache,
+            refresh,
+            client
+        )
+        round_number += 1
+    
+    stats = {
+        "mode": "map_reduce",
+        "bill_tokens": bill_tokens,
+        "chunks": len(chunks),
+        "stages": stages
+    }
+    return build_reduce_messages(notes, price_findings, duplicate_findings), stats
+
+def final_stage_name(stats: Dict[str, Any]) -> str:
+    """Name of the stage producing the final report."""
+    return "analyze" if stats["mode"] == "single" else "reduce"
+
+def analyze_bill_pages(
+    pages: List[str],
+    use_cache: bool = True,
+    refresh: bool = False,
+    price_findings: Optional[str] = None,
+    duplicate_findings: Optional[str] = None,
+    client: Optional[Any] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Analyze bill text, using map-reduce when it exceeds the token budget.
+    
+    Args:
+        pages: Text of each page of the bill
+        use_cache: Set to False to bypass the LLM response cache entirely
+        refresh: Set to True to ignore cached responses and store fresh ones
+        price_findings: Reference price screen added to the final prompt
+        duplicate_findings: Duplicate charge screen added to the final prompt
+        client: OpenAI client to send the requests with
+        
+    Returns:
+        Tuple of (analysis text, per-stage token and timing statistics)
+    """
+    messages, stats = prepare_final_messages(pages, use_cache, refresh, price_findings, duplicate_findings, client)
+    # Identifies the final prompt, e.g. in the RL agent's replay buffer
+    stats["prompt_hash"] = analysis_cache_key(messages)
+    outputs, stats["stages"][final_stage_name(stats)] = _run_stage([messages], use_cache, refresh, client)
+    return outputs[0], stats
+
+def analysis_update(
+    bill_id: str,
+    analysis: str,
+    analysis_stats: Optional[Dict[str, Any]] = None,
+    text_extraction: Optional[Dict[str, Any]] = None,
+    overcharge_screen: Optional[Dict[str, Any]] = None,
+    duplicate_screen: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Store the text of a finished analysis and build the update recording it
+    on the bill and its re-uploads.
+    
+    The analysis text and screens go to the content collection and the bills
+    keep references to them in analysis_ref (see get_bill_analysis),
+    overcharge_screen_ref and duplicate_screen_ref. The bill's
+    status keeps tracking its upload summary (see api/openapi.yaml);
+    analysis progress is recorded separately in analysis_status.
+    
+    Returns:
+        Tuple of (filter, update) for update_many, or an UpdateMany in a
+        bulk write (see batch_analysis.analyze_bills)
+    """
+    analysis_ref = store_text(content_collection, analysis)
+    update = {"$set": {"analysis_status": "analyzed", "analysis_ref": analysis_ref, "analyzed_at": datetime.now()}}
+    if analysis_stats is not None:
+        update["$set"]["analysis_stats"] = analysis_stats
+    if text_extraction is not None:
+        update["$set"]["text_extraction"] = text_extraction
+    # Bills saved before analyses moved out of the bill document kept them inline
+    update["$unset"] = {"analysis": "", "partial_analysis": "", "partial_analysis_key": "", "partial_analysis_at": ""}
+    for name, screen in (("overcharge_screen", overcharge_screen), ("duplicate_screen", duplicate_screen)):
+        if screen is not None:
+            update["$set"][f"{name}_ref"] = store_screen(content_collection, screen)
+            update["$unset"][name] = ""
+    return {"$or": [{"id": bill_id}, {"duplicate_of": bill_id}]}, update
+
+def save_analysis(
+    bill_id: str,
+    analysis: str,
+    analysis_stats: Optional[Dict[str, Any]] = None,
+    text_extraction: Optional[Dict[str, Any]] = None,
+    overcharge_screen: Optional[Dict[str, Any]] = None,
+    duplicate_screen: Optional[Dict[str, Any]] = None,
+    lease_owner: Optional[str] = None
+) -> bool:
+    """
+    Store a finished analysis for the bill and its re-uploads (see
+    analysis_update), clearing any stream checkpoint.
+    
+    Args:
+        lease_owner: Queue worker that claimed the bill (see
+            analysis_queue.AnalysisQueue); the analysis is only saved while
+            it still holds the bill's lease
+    
+    Returns:
+        False if the lease was lost and nothing was saved
+    """
+    query, update = analysis_update(
+        bill_id, analysis, analysis_stats, text_extraction, overcharge_screen, duplicate_screen
     )
+    if lease_owner is not None:
+        # Another worker claimed the bill after our lease expired; its analysis wins
+        result = bills_collection.update_one({"id": bill_id, "lease_owner": lease_owner}, update)
+        if result.matched_count == 0:
+            print(f"Warning: Lost the analysis lease on bill {bill_id}, not saving its analysis")
+            return False
+        query = {"duplicate_of": bill_id}
+    bills_collection.update_many(query, update)
+    delete_checkpoint(content_collection, bill_id)
+    return True
+
+def load_bill_analysis(bill_doc: Dict[str, Any]) -> Optional[str]:
+    """Load the analysis a bill document references, or its inline analysis if it predates analysis_ref."""
+    if bill_doc.get("analysis_ref"):
+        return load_text(content_collection, bill_doc["analysis_ref"])
+    return bill_doc.get("analysis")
+
+def get_bill_analysis(bill_id: str) -> Optional[str]:
+    """Load the stored analysis of a bill, None if it has not been analyzed."""
+    bill_doc = get_bill_by_id(bill_id, {"_id": 0, "analysis_ref": 1, "analysis": 1})
+    return load_bill_analysis(bill_doc) if bill_doc else None
+
+def reuse_canonical_analysis(bill_id: str, bill_doc: Dict[str, Any]) -> Optional[str]:
+    """Copy the analysis of the first upload of the same file onto a re-upload, returning it if there is one."""
+    canonical_id = bill_doc.get("duplicate_of")
+    if not canonical_id:
+        return None
+    analysis = get_bill_analysis(canonical_id)
+    if not analysis:
+        return None
+    save_analysis(bill_id, analysis)
+    return analysis
+
+def prepare_bill_analysis(bill_id: str, bill_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract a bill's text and line items and run the screens whose findings
+    go into the analysis prompt.
+    
+    Returns:
+        Dictionary with the "pages", "text_extraction" summary, the
+        "overcharge_screen" and "duplicate_screen" and their prompt text as
+        "price_findings" and "duplicate_findings"
+    """
+    from overcharge import format_overcharge_findings
     
+    file_path = Path(bill_doc["path"])
+    if not file_path.exists():
+        raise Exception(f"Bill file not found at {file_path}")
+    
+    extraction = extract_bill_text(file_path)
+    line_items = extract_line_items(bill_id, extraction)
+    text_extraction = extraction_summary(extraction)
+    text_extraction["line_items"] = len(line_items["codes"])
+    overcharge_screen = screen_overcharges(line_items)
+    duplicate_screen = screen_duplicates(bill_id, extraction, line_items)
     return {
+        "pages": extraction["pages"],
+        "text_extraction": text_extraction,
+        "overcharge_screen": overcharge_screen,
+        "duplicate_screen": duplicate_screen,
+        "price_findings": format_overcharge_findings(overcharge_screen),
+        "duplicate_findings": format_duplicate_findings(duplicate_screen, bill_id)
+    }
+
+def run_bill_analysis(
+    bill_id: str,
+    prepared: Dict[str, Any],
+    use_cache: bool = True,
+    refresh: bool = False,
+    client: Optional[Any] = None,
+    save: bool = True,
+    lease_owner: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Analyze a bill prepared with prepare_bill_analysis and store the result.
+    
+    Args:
+        bill_id: UUID of the bill
+        prepared: Result of prepare_bill_analysis
+        use_cache: Set to False to bypass the LLM response cache entirely
+        refresh: Set to True to ignore cached responses and store fresh ones
+        client: OpenAI client to send the requests with
+        save: Set to False to return the bill update as "update" (see
+            analysis_update) instead of writing it
+        lease_owner: Queue worker whose lease the result is saved under (see
+            save_analysis)
+    """
+    # Get AI analysis, reusing cached responses for identical prompts; long
+    # bills are analyzed in chunks and merged
+    analysis_result, analysis_stats = analyze_bill_pages(
+        prepared["pages"],
+        use_cache=use_cache,
+        refresh=refresh,
+        price_findings=prepared["price_findings"],
+        duplicate_findings=prepared["duplicate_findings"],
+        client=client
+    )
+    
+    # Update bill status in database, including re-uploads of the same file
+    analysis_fields = (
+        bill_id,
+        analysis_result,
+        analysis_stats,
+        prepared["text_extraction"],
+        prepared["overcharge_screen"],
+        prepared["duplicate_screen"]
+    )
+    update = None
+    if save:
+        save_analysis(*analysis_fields, lease_owner=lease_owner)
+    else:
+        update = analysis_update(*analysis_fields)
+    
+    bill_text = "\n".join(prepared["pages"]).strip()
+    result = {
         "bill_id": bill_id,
         "status": "analyzed",
         "analysis": analysis_result,
+        "analysis_stats": analysis_stats,
+        "overcharge_screen": prepared["overcharge_screen"],
+        "duplicate_screen": prepared["duplicate_screen"],
         "bill_text": bill_text[:500] + "..." if len(bill_text) > 500 else bill_text  # Truncated for response
     }
+    if update is not None:
+        result["update"] = update
+    return result
+
+def analyze_medical_bill(
+    bill_id: str,
+    use_cache: bool = True,
+    refresh: bool = False,
+    lease_owner: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Analyze a medical bill for issues and provide legal advice.
+    
+    Args:
+        bill_id: UUID of the bill to analyze
+        use_cache: Set to False to bypass the LLM response cache entirely
+        refresh: Set to True to ignore a cached analysis and store a fresh one
+        lease_owner: Queue worker that claimed the bill; the analysis is
+            only saved while it holds the lease (see save_analysis)
+        
+    Returns:
+        Dictionary containing analysis results and recommendations
+    """
+    # Get bill from database
+    bill_doc = get_bill_by_id(bill_id, ANALYSIS_BILL_FIELDS)
+    if not bill_doc:
+        raise Exception(f"Bill with ID {bill_id} not found")
+    
+    # Re-uploads of an already analyzed file reuse the stored analysis
+    reused = reuse_canonical_analysis(bill_id, bill_doc)
+    if reused is not None:
+        return {
+            "bill_id": bill_id,
+            "status": "analyzed",
+            "analysis": reused,
+            "duplicate_of": bill_doc["duplicate_of"]
+        }
+    
+    return run_bill_analysis(
+        bill_id,
+        prepare_bill_analysis(bill_id, bill_doc),
+        use_cache,
+        refresh,
+        lease_owner=lease_owner
+    )
+
+def analyze_medical_bill_stream(
+    bill_id: str,
+    use_cache: bool = True,
+    refresh: bool = False,
+    checkpoint_tokens: int = STREAM_CHECKPOINT_TOKENS,
+    checkpoint_seconds: float = STREAM_CHECKPOINT_SECONDS
+) -> Iterator[str]:
+    """
+    Analyze a medical bill, yielding the analysis text as it is generated.
+    
+    The partial analysis is checkpointed every checkpoint_tokens streamed
+    chunks (about a token each) or checkpoint_seconds seconds. If the stream
+    is interrupted, the next call for the same prompt yields the
+    checkpointed text and asks the model to continue from there. For long
+    bills the map step runs first and only the final reduce step is
+    streamed. The stream gets the same price lookup tools as the blocking
+    analysis, so both share one cache entry per prompt.
+    
+    Args:
+        bill_id: UUID of the bill to analyze
+        use_cache: Set to False to bypass the LLM response cache entirely
+        refresh: Set to True to ignore a cached analysis and store a fresh one
+        checkpoint_tokens: Streamed chunks between checkpoints of the partial analysis
+        checkpoint_seconds: Seconds between checkpoints of the partial analysis
+        
+    Yields:
+        Pieces of the analysis text in order
+    """
+    bill_doc = get_bill_by_id(bill_id, ANALYSIS_BILL_FIELDS)
+    if not bill_doc:
+        raise Exception(f"Bill with ID {bill_id} not found")
+    
+    # Re-uploads of an already analyzed file reuse the stored analysis
+    reused = reuse_canonical_analysis(bill_id, bill_doc)
+    if reused is not None:
+        yield reused
+        return
+    
+    start = time.perf_counter()
+    prepared = prepare_bill_analysis(bill_id, bill_doc)
+    text_extraction = prepared["text_extraction"]
+    overcharge_screen = prepared["overcharge_screen"]
+    duplicate_screen = prepared["duplicate_screen"]
+    messages, analysis_stats = prepare_final_messages(
+        prepared["pages"],
+        use_cache,
+        refresh,
+        prepared["price_findings"],
+        prepared["duplicate_findings"]
+    )
+    key = analysis_cache_key(messages)
+    analysis_stats["prompt_hash"] = key
+    
+    if use_cache and not refresh:
+        cached = response_cache.get(key)
+        if cached is not None:
+            save_analysis(bill_id, cached, analysis_stats, text_extraction, overcharge_screen, duplicate_screen)
+            yield cached
+            return
+    
+    # Resume from the checkpoint of an interrupted stream of the same prompt
+    pieces = []
+    request_messages = messages
+    partial_analysis = load_checkpoint(content_collection, bill_id, key)
+    if partial_analysis:
+        pieces.append(partial_analysis)
+        request_messages = messages + [
+            {
+                "role": "assistant",
+                "content": partial_analysis
+            },
+            {
+                "role": "user",
+                "content": "Continue the analysis exactly where it stopped, without repeating anything."
+            }
+        ]
+        yield partial_analysis
+    
+    def checkpoint():
+        save_checkpoint(content_collection, bill_id, key, "".join(pieces))
+    
+    stream_start = time.perf_counter()
+    time_to_first_token = None
+    streamed_pieces = []
+    chunks_since_checkpoint = 0
+    last_checkpoint = time.monotonic()
+    usage: Dict[str, int] = {}
+    
+    try:
+        for delta in stream_chat_completion(
+            get_openai_client(),
+            ANALYSIS_MODEL,
+            request_messages,
+            usage=usage,
+            **price_lookup_params()
+        ):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - stream_start
+            pieces.append(delta)
+            streamed_pieces.append(delta)
+            chunks_since_checkpoint += 1
+            yield delta
+            
+            if chunks_since_checkpoint >= checkpoint_tokens or time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                checkpoint()
+                chunks_since_checkpoint = 0
+                last_checkpoint = time.monotonic()
+    except BaseException:
+        # Keep what was generated so the next call can resume
+        if chunks_since_checkpoint:
+            checkpoint()
+        raise
+    
+    analysis_result = "".join(pieces)
+    # Token counts reported by the API, counted locally if it sent none
+    analysis_stats["stages"][final_stage_name(analysis_stats)] = {
+        "calls": 1,
+        "prompt_tokens": usage.get(
+            "prompt_tokens",
+            sum(count_tokens(message["content"], ANALYSIS_MODEL) for message in request_messages)
+        ),
+        "completion_tokens": usage.get("completion_tokens", count_tokens("".join(streamed_pieces), ANALYSIS_MODEL)),
+        "seconds": round(time.perf_counter() - stream_start, 2),
+        "time_to_first_token": round(time_to_first_token, 2) if time_to_first_token is not None else None
+    }
+    analysis_stats["streamed"] = True
+    analysis_stats["total_seconds"] = round(time.perf_counter() - start, 2)
+    
+    if use_cache and analysis_result:
+        response_cache.put(key, analysis_result, ANALYSIS_MODEL)
+    save_analysis(bill_id, analysis_result, analysis_stats, text_extraction, overcharge_screen, duplicate_screen)
 
 # Example usage - uncomment to test with a specific bill ID
 # if __name__ == "__main__":
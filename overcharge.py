@@ -0,0 +1,243 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from pymongo import UpdateMany
+
+from bill_content import store_screen
+from description_index import DescriptionIndex, match_reference_codes
+from line_items import load_line_item_columns
+from price_index import PriceIndex
+
+# Items charged above this percentile of the reference prices for their code are flagged
+OVERCHARGE_PERCENTILE = float(os.environ.get("OVERCHARGE_PERCENTILE", "90"))
+# Codes listed on fewer CDM rows, or priced by fewer hospitals, than this are
+# not judged: a percentile of one hospital's price list says nothing about
+# what is usual
+OVERCHARGE_MIN_REFERENCES = int(os.environ.get("OVERCHARGE_MIN_REFERENCES", "3"))
+OVERCHARGE_MIN_HOSPITALS = int(os.environ.get("OVERCHARGE_MIN_HOSPITALS", "2"))
+# Flagged items stored per bill and shown to the model, largest excess first
+OVERCHARGE_MAX_ITEMS = int(os.environ.get("OVERCHARGE_MAX_ITEMS", "20"))
+
+
+def detect_overcharges(
+    index: PriceIndex,
+    codes: np.ndarray,
+    unit_charge_cents: np.ndarray,
+    quantities: Optional[np.ndarray] = None,
+    percentile: float = OVERCHARGE_PERCENTILE,
+    min_references: int = OVERCHARGE_MIN_REFERENCES,
+    min_hospitals: int = OVERCHARGE_MIN_HOSPITALS,
+) -> Dict[str, np.ndarray]:
+    """
+    Compare a batch of line items with the chargemaster price distribution
+    of their codes, all items at once.
+
+    Args:
+        index: Reference price index
+        codes: Billing code of each item
+        unit_charge_cents: Charge per unit of each item
+        quantities: Units of each item (1 if not given)
+        percentile: Items priced above this percentile of their code are flagged
+        min_references: Minimum number of CDM rows listing a code to judge it
+        min_hospitals: Minimum number of hospitals pricing a code to judge it
+
+    Returns:
+        Dictionary of arrays aligned with the items: "percentiles" (percentile
+        rank of the unit charge among hospitals, NaN for codes not judged),
+        "median_cents" and "threshold_cents" (0 for codes not judged),
+        "references" (hospitals pricing the code, 0 for codes not judged),
+        "flagged" and "excess_cents" (charge above the median times
+        quantity, for flagged items)
+    """
+    unit_charge_cents = np.asarray(unit_charge_cents, dtype=np.int64)
+    if quantities is None:
+        quantities = np.ones(len(unit_charge_cents), dtype=np.int64)
+
+    ranks = index.code_ranks(codes)
+    safe_ranks = np.maximum(ranks, 0)
+    known = (
+        (ranks >= 0)
+        & (index.row_counts[safe_ranks] >= max(1, min_references))
+        & (index.counts[safe_ranks] >= max(1, min_hospitals))
+    )
+    references = np.where(known, index.counts[safe_ranks], 0)
+
+    median = np.where(known, np.rint(index.quantile_prices(50)[safe_ranks]), 0).astype(np.int64)
+    threshold = np.where(known, np.rint(index.quantile_prices(percentile)[safe_ranks]), 0).astype(np.int64)
+    flagged = known & (unit_charge_cents > threshold)
+    excess = np.where(flagged, (unit_charge_cents - median) * np.asarray(quantities, dtype=np.int64), 0)
+
+    percentiles = index.percentile_ranks_by_rank(np.where(known, ranks, -1), unit_charge_cents)
+    return {
+        "percentiles": percentiles,
+        "median_cents": median,
+        "threshold_cents": threshold,
+        "references": references,
+        "flagged": flagged,
+        "excess_cents": excess,
+    }
+
+
+def summarize_overcharges(
+    columns: Dict[str, Any],
+    detection: Dict[str, np.ndarray],
+    positions: Optional[np.ndarray] = None,
+    percentile: float = OVERCHARGE_PERCENTILE,
+) -> Dict[str, Any]:
+    """
+    Build the overcharge screen stored on a bill document.
+
+    Args:
+        columns: Line item columns the detection ran on
+        detection: Output of detect_overcharges
+        positions: Positions of this bill's items in the columns (all if not given)
+        percentile: Percentile the items were screened against
+
+    Returns:
+        Dictionary with counts of "screened", "priced" and "flagged" items,
+        the total "excess_cents" and the flagged "items" with the largest
+        excess first
+    """
+    if positions is None:
+        positions = np.arange(len(detection["flagged"]))
+    flagged = positions[detection["flagged"][positions]]
+    flagged = flagged[np.argsort(-detection["excess_cents"][flagged], kind="stable")]
+
+    items = []
+    for position in flagged[:OVERCHARGE_MAX_ITEMS].tolist():
+        items.append({
+            "code": str(columns["codes"][position]),
+            "description": str(columns["descriptions"][position]),
+            "quantity": int(columns["quantities"][position]),
+            "unit_charge_cents": int(columns["unit_charge_cents"][position]),
+            "median_cents": int(detection["median_cents"][position]),
+            "threshold_cents": int(detection["threshold_cents"][position]),
+            "percentile": round(float(detection["percentiles"][position]), 1),
+            "references": int(detection["references"][position]),
+            "excess_cents": int(detection["excess_cents"][position]),
+            "matched_by_description": bool(columns["matched"][position]) if "matched" in columns else False,
+        })
+
+    return {
+        "percentile": percentile,
+        "screened": int(len(positions)),
+        "priced": int((detection["references"][positions] > 0).sum()),
+        "flagged": int(len(flagged)),
+        "excess_cents": int(detection["excess_cents"][flagged].sum()),
+        "items": items,
+        "screened_at": datetime.now(),
+    }
+
+
+def screen_line_items(
+    index: PriceIndex,
+    line_items: Dict[str, List[Any]],
+    percentile: float = OVERCHARGE_PERCENTILE,
+    description_index: Optional[DescriptionIndex] = None,
+) -> Dict[str, Any]:
+    """
+    Screen the line item columns of one bill (see line_items.parse_line_items).
+
+    Items without a billing code are priced under the CPT/HCPCS code of the
+    best matching chargemaster description if description_index is given.
+    """
+    codes = list(line_items["codes"])
+    matched = np.zeros(len(codes), dtype=bool)
+    if description_index is not None:
+        missing = [position for position, code in enumerate(codes) if not code]
+        found = match_reference_codes(description_index, [line_items["descriptions"][position] for position in missing])
+        for position, code in zip(missing, found):
+            if code:
+                codes[position] = code
+                matched[position] = True
+
+    columns = {
+        "codes": np.array(codes, dtype=object),
+        "matched": matched,
+        "descriptions": np.array(line_items["descriptions"], dtype=object),
+        "quantities": np.array(line_items["quantities"], dtype=np.int64),
+        "unit_charge_cents": np.array(line_items["unit_charge_cents"], dtype=np.int64),
+    }
+    detection = detect_overcharges(
+        index, columns["codes"], columns["unit_charge_cents"], columns["quantities"], percentile
+    )
+    return summarize_overcharges(columns, detection, percentile=percentile)
+
+
+def screen_bills(
+    index: PriceIndex,
+    bill_ids: Iterable[str],
+    line_items_collection: Any,
+    bills_collection: Any,
+    content_collection: Any,
+    percentile: float = OVERCHARGE_PERCENTILE,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Screen many bills' stored line items in one vectorized pass, store each
+    screen in the content collection and reference it from the bill (and
+    re-uploads of it) as "overcharge_screen_ref" (see bill_content.store_screen).
+
+    Returns:
+        Dictionary of bill id to its overcharge screen
+    """
+    documents = line_items_collection.find(
+        {"bill_id": {"$in": list(bill_ids)}},
+        {"bill_id": 1, "count": 1, "codes": 1, "descriptions": 1, "quantities": 1, "unit_charge_cents": 1},
+    )
+    columns = load_line_item_columns(documents)
+    detection = detect_overcharges(
+        index, columns["codes"], columns["unit_charge_cents"], columns["quantities"], percentile
+    )
+
+    screens: Dict[str, Dict[str, Any]] = {}
+    if len(columns["bill_ids"]):
+        order = np.argsort(columns["bill_ids"], kind="stable")
+        sorted_ids = columns["bill_ids"][order]
+        boundaries = np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1
+        for positions in np.split(order, boundaries):
+            bill_id = columns["bill_ids"][positions[0]]
+            screens[bill_id] = summarize_overcharges(columns, detection, positions, percentile)
+
+    updates = [
+        UpdateMany(
+            {"$or": [{"id": bill_id}, {"duplicate_of": bill_id}]},
+            {
+                "$set": {"overcharge_screen_ref": store_screen(content_collection, screen)},
+                "$unset": {"overcharge_screen": ""},
+            },
+        )
+        for bill_id, screen in screens.items()
+    ]
+    if updates:
+        try:
+            bills_collection.bulk_write(updates, ordered=False)
+        except Exception as e:
+            print(f"Warning: Failed to store {len(updates)} overcharge screens: {str(e)}")
+    return screens
+
+
+def format_overcharge_findings(screen: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Render an overcharge screen as prompt text, or None if nothing could be priced."""
+    if not screen or not screen["priced"]:
+        return None
+    if not screen["flagged"]:
+        return (
+            f"{screen['priced']} of {screen['screened']} line items have reference prices from several hospitals; "
+            f"none is above the {screen['percentile']:g}th percentile."
+        )
+    lines = [
+        f"{screen['flagged']} of {screen['priced']} priced line items are above the "
+        f"{screen['percentile']:g}th percentile of published chargemaster prices for their code:"
+    ]
+    for item in screen["items"]:
+        code = f"{item['code']} (matched by description)" if item.get("matched_by_description") else item["code"]
+        lines.append(
+            f"- {code} {item['description']}: ${item['unit_charge_cents'] / 100:,.2f} per unit "
+            f"(x{item['quantity']}), median ${item['median_cents'] / 100:,.2f}, "
+            f"p{screen['percentile']:g} ${item['threshold_cents'] / 100:,.2f}, "
+            f"percentile {item['percentile']:g} among {item['references']} hospitals' prices"
+        )
+    lines.append(f"Total charged above the median: ${screen['excess_cents'] / 100:,.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from cache_stats import get_counter
+
+# Rendered page images shared by every worker on this machine
+PAGE_CACHE_DIR = Path(os.environ.get("PAGE_CACHE_DIR", "./cache/pages"))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Eviction trims the cache to this fraction of the budget so it does not run on every put
+PAGE_CACHE_LOW_WATER = 0.9
+
+
+def file_content_hash(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    Disk-backed LRU cache of encoded page images.
+
+    Entries are keyed by (file content hash, page number, DPI, encoding) and
+    written atomically (temp file + rename), so several processes can share
+    one cache directory. Recency is tracked through file modification times,
+    and the least recently used entries are evicted once the total size
+    exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: Path = PAGE_CACHE_DIR, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.counter = get_counter("page_cache")
+        self._lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+
+    @staticmethod
+    def make_key(content_hash: str, page_number: int, dpi: int, encoding: str) -> str:
+        """Build the cache key for one rendered page."""
+        return hashlib.sha256(
+            f"{content_hash}:{page_number}:{dpi}:{encoding}".encode("utf-8")
+        ).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        # Two-level fan-out keeps directory listings short
+        return self.cache_dir / key[:2] / f"{key}.img"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached bytes for key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.counter.miss()
+            return None
+
+        try:
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.counter.hit()
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store bytes under key, evicting old entries if over budget."""
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_name, path)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+            raise
+
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_size()
+            else:
+                self._approx_bytes += len(data)
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _scan_size(self) -> int:
+        total = 0
+        for entry in self.cache_dir.glob("*/*.img"):
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def evict(self) -> None:
+        """Delete least recently used entries until under the low-water mark."""
+        entries = []
+        for entry in self.cache_dir.glob("*/*.img"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * PAGE_CACHE_LOW_WATER)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= target:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                # Another worker evicted it first
+                pass
+            total -= size
+
+        with self._lock:
+            self._approx_bytes = total
+
+
+_page_cache: Optional[PageCache] = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """Return the shared page cache, creating it on first use."""
+    global _page_cache
+    if _page_cache is None:
+        with _page_cache_lock:
+            if _page_cache is None:
+                _page_cache = PageCache()
+    return _page_cache
@@ -0,0 +1,199 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from page_cache import PageCache, file_content_hash, get_page_cache
+
+# Rendering settings trade image fidelity against request size and latency
+RENDER_MAX_PAGES = int(os.environ.get("RENDER_MAX_PAGES", "10"))
+RENDER_DPI = int(os.environ.get("RENDER_DPI", "150"))
+RENDER_MAX_DIMENSION = int(os.environ.get("RENDER_MAX_DIMENSION", "1600"))
+RENDER_FORMAT = os.environ.get("RENDER_FORMAT", "JPEG").upper()
+RENDER_QUALITY = int(os.environ.get("RENDER_QUALITY", "70"))
+RENDER_GRAYSCALE = os.environ.get("RENDER_GRAYSCALE", "true").lower() == "true"
+RENDER_THREADS = int(os.environ.get("RENDER_THREADS", "4"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+# pdf2image and Pillow are imported when a page is first rendered
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def get_page_count(file_path: Path) -> int:
+    """Return the number of pages in a PDF."""
+    from pdf2image import pdfinfo_from_path
+
+    return int(pdfinfo_from_path(str(file_path))["Pages"])
+
+
+def encode_page_image(
+    image: "Image.Image",
+    max_dimension: int = RENDER_MAX_DIMENSION,
+    image_format: str = RENDER_FORMAT,
+    quality: int = RENDER_QUALITY,
+    grayscale: bool = RENDER_GRAYSCALE,
+) -> bytes:
+    """
+    Downscale a rendered page so its longest side is at most max_dimension
+    and encode it in the configured format.
+    """
+    from PIL import Image
+
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+    elif image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if max(image.size) > max_dimension:
+        image = image.copy()
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    buffered = BytesIO()
+    if image_format == "JPEG":
+        image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffered, format=image_format, optimize=True)
+    return buffered.getvalue()
+
+
+def encoding_label(
+    image_format: str, quality: int, grayscale: bool, max_dimension: int
+) -> str:
+    """Describe an encoding so differently encoded pages get distinct cache keys."""
+    color = "gray" if grayscale else "color"
+    return f"{image_format}-q{quality}-{color}-{max_dimension}"
+
+
+def _page_result(page_number: int, encoded: bytes, start: float, cached: bool) -> Dict[str, Any]:
+    from PIL import Image
+
+    with Image.open(BytesIO(encoded)) as encoded_image:
+        width, height = encoded_image.size
+
+    return {
+        "page": page_number,
+        "image": encoded,
+        "bytes": len(encoded),
+        "width": width,
+        "height": height,
+        "render_ms": round((time.perf_counter() - start) * 1000, 1),
+        "cached": cached,
+    }
+
+
+def render_page(
+    file_path: Path,
+    page_number: int,
+    dpi: int = RENDER_DPI,
+    max_dimension: int = RENDER_MAX_DIMENSION,
+    image_format: str = RENDER_FORMAT,
+    quality: int = RENDER_QUALITY,
+    grayscale: bool = RENDER_GRAYSCALE,
+    content_hash: Optional[str] = None,
+    cache: Optional[PageCache] = None,
+) -> Dict[str, Any]:
+    """
+    Render and encode a single PDF page, reading from the page cache first
+    when a cache and the file's content hash are given.
+
+    Returns:
+        Dictionary with the page number, encoded image bytes, its size and
+        dimensions, the render time in milliseconds and whether it was cached
+    """
+    start = time.perf_counter()
+
+    cache_key = None
+    if cache is not None and content_hash:
+        cache_key = cache.make_key(
+            content_hash,
+            page_number,
+            dpi,
+            encoding_label(image_format, quality, grayscale, max_dimension),
+        )
+        encoded = cache.get(cache_key)
+        if encoded is not None:
+            return _page_result(page_number, encoded, start, cached=True)
+
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(
+        file_path,
+        dpi=dpi,
+        first_page=page_number,
+        last_page=page_number,
+        grayscale=grayscale,
+    )
+    if not images:
+        raise Exception(f"Failed to render page {page_number} of {file_path}")
+
+    encoded = encode_page_image(
+        images[0],
+        max_dimension=max_dimension,
+        image_format=image_format,
+        quality=quality,
+        grayscale=grayscale,
+    )
+    if cache_key is not None:
+        cache.put(cache_key, encoded)
+
+    return _page_result(page_number, encoded, start, cached=False)
+
+
+def render_pages(
+    file_path: Path,
+    max_pages: int = RENDER_MAX_PAGES,
+    threads: int = RENDER_THREADS,
+    use_cache: bool = True,
+    **render_options: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Render up to max_pages pages of a PDF in parallel.
+
+    Each page runs in its own poppler subprocess, so a thread pool renders
+    pages concurrently without contending for the GIL. Pages already in the
+    shared page cache are not re-rendered.
+
+    Args:
+        file_path: Path to the PDF file
+        max_pages: Maximum number of pages to render, starting at page 1
+        threads: Number of pages rendered concurrently
+        use_cache: Whether to read and fill the shared page cache
+        **render_options: Passed through to render_page
+
+    Returns:
+        List of rendered pages (see render_page) in page order
+    """
+    if use_cache:
+        render_options.setdefault("cache", get_page_cache())
+        if not render_options.get("content_hash"):
+            render_options["content_hash"] = file_content_hash(file_path)
+
+    page_count = min(get_page_count(file_path), max_pages)
+    if page_count < 1:
+        raise Exception("Failed to convert PDF to images")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, page_count))) as pool:
+        return list(
+            pool.map(
+                lambda page_number: render_page(file_path, page_number, **render_options),
+                range(1, page_count + 1),
+            )
+        )
+
+
+def render_stats(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize per-page sizes and render times for storing on a bill."""
+    return {
+        "pages": len(pages),
+        "total_bytes": sum(page["bytes"] for page in pages),
+        "render_ms": round(sum(page["render_ms"] for page in pages), 1),
+        "cached_pages": sum(1 for page in pages if page.get("cached")),
+        "per_page": [
+            {key: page[key] for key in ("page", "bytes", "width", "height", "render_ms", "cached")}
+            for page in pages
+        ],
+    }
@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from cache_stats import get_counter
+from page_cache import file_content_hash
+
+# PDFs with fewer pages are extracted in-process; the pool is not worth it
+PARALLEL_MIN_PAGES = int(os.environ.get("PARALLEL_MIN_PAGES", "8"))
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", "4"))
+# Pages with less text than this are treated as image-only and sent to OCR
+MIN_PAGE_TEXT_CHARS = int(os.environ.get("MIN_PAGE_TEXT_CHARS", "20"))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+_indexed_collections = set()
+text_cache_counter = get_counter("pdf_text_cache")
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Return the shared extraction process pool, creating it on first use.
+
+    Workers are spawned rather than forked: the pool is created from the
+    summary worker threads, and forking a multi-threaded process can copy
+    locks held by other threads into the child.
+    """
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _process_pool
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the text layer of pages [start, end) of a PDF."""
+    import PyPDF2
+
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[index].extract_text() or "" for index in range(start, end)]
+
+
+def count_pdf_pages(file_path: Path) -> int:
+    """Return the number of pages in a PDF."""
+    import PyPDF2
+
+    with open(file_path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_text_layer(file_path: Path) -> List[str]:
+    """
+    Extract the text layer of every page, spreading page ranges across the
+    process pool for large documents.
+    """
+    page_count = count_pdf_pages(file_path)
+    if page_count < PARALLEL_MIN_PAGES:
+        return extract_page_range(str(file_path), 0, page_count)
+
+    ranges_count = min(EXTRACT_WORKERS, page_count)
+    step = -(-page_count // ranges_count)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    pool = get_process_pool()
+    futures = [pool.submit(extract_page_range, str(file_path), start, end) for start, end in ranges]
+    # Join the per-range page lists once, in order
+    return [page for future in futures for page in future.result()]
+
+
+def extract_pdf_pages(
+    file_path: Path,
+    ocr_page: Optional[Callable[[Path, int], str]] = None,
+    cache_collection: Optional[Any] = None,
+    content_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Extract the text of every page of a PDF, falling back to OCR for pages
+    without a usable text layer.
+
+    Results are cached by file content hash in cache_collection, so the same
+    file is only extracted (and OCR'd) once.
+
+    Args:
+        file_path: Path to the PDF file
+        ocr_page: Function returning the text of a 1-based page number, used
+            for image-only pages. Those pages are left empty if not given.
+        cache_collection: MongoDB collection caching extracted text
+        content_hash: SHA-256 of the file, computed if not given
+
+    Returns:
+        Dictionary with "pages" (text per page), "methods" ("text", "ocr" or
+        "empty" per page), extraction "seconds", "content_hash" and "cached"
+    """
+    start = time.perf_counter()
+    content_hash = content_hash or file_content_hash(file_path)
+
+    if cache_collection is not None:
+        try:
+            if cache_collection.full_name not in _indexed_collections:
+                cache_collection.create_index("content_hash", unique=True)
+                _indexed_collections.add(cache_collection.full_name)
+            cached = cache_collection.find_one(
+                {"content_hash": content_hash}, {"pages": 1, "methods": 1}
+            )
+        except Exception as e:
+            print(f"Warning: Text cache lookup failed: {str(e)}")
+            cached = None
+        if cached:
+            text_cache_counter.hit()
+            return {
+                "pages": cached["pages"],
+                "methods": cached["methods"],
+                "seconds": round(time.perf_counter() - start, 3),
+                "content_hash": content_hash,
+                "cached": True,
+            }
+        text_cache_counter.miss()
+
+    try:
+        pages = extract_text_layer(file_path)
+    except Exception as e:
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+
+    methods = ["text" if len(page.strip()) >= MIN_PAGE_TEXT_CHARS else "empty" for page in pages]
+    image_pages = [index for index, method in enumerate(methods) if method == "empty"]
+
+    ocr_failed = False
+    if ocr_page and image_pages:
+
+        def run_ocr(index: int) -> Optional[str]:
+            try:
+                return ocr_page(file_path, index + 1)
+            except Exception as e:
+                print(f"Warning: OCR failed for page {index + 1} of {file_path}: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(OCR_CONCURRENCY, len(image_pages)))) as pool:
+            ocr_texts = list(pool.map(run_ocr, image_pages))
+        for index, text in zip(image_pages, ocr_texts):
+            if text is None:
+                ocr_failed = True
+                continue
+            pages[index] = text
+            methods[index] = "ocr"
+
+    result = {
+        "pages": pages,
+        "methods": methods,
+        "seconds": round(time.perf_counter() - start, 3),
+        "content_hash": content_hash,
+        "cached": False,
+    }
+
+    # Results with failed OCR pages are not cached so a later call retries them
+    if cache_collection is not None and not ocr_failed:
+        try:
+            cache_collection.update_one(
+                {"content_hash": content_hash},
+                {"$set": {"pages": pages, "methods": methods, "created_at": datetime.now()}},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Warning: Text cache write failed: {str(e)}")
+
+    return result
+
+
+def extraction_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact record of an extraction for storing on the bill document."""
+    return {
+        "seconds": result["seconds"],
+        "cached": result["cached"],
+        "pages": len(result["pages"]),
+        "methods": result["methods"],
+        "ocr_pages": [index + 1 for index, method in enumerate(result["methods"]) if method == "ocr"],
+    }
@@ -0,0 +1,275 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chargemaster import Chargemaster, get_chargemaster
+
+# Prices are packed as code_rank * PRICE_KEY_STRIDE + price_cents so one
+# sorted array answers percentile-rank queries for every code at once
+PRICE_KEY_STRIDE = 2 ** 40
+PERCENTILES = (10, 50, 90)
+
+PRICE_LOOKUP_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "lookup_reference_prices",
+        "description": (
+            "Look up reference prices for CPT/HCPCS or hospital charge codes from published "
+            "California hospital chargemasters. Returns the 10th, 50th and 90th percentile "
+            "list price in dollars across hospitals, and the price at one hospital if its "
+            "9-digit HCAI facility number is given."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "codes": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "CPT, HCPCS or hospital charge codes from the bill"
+                },
+                "hospital_id": {
+                    "type": "string",
+                    "description": "HCAI/OSHPD facility number, if known"
+                },
+            },
+            "required": ["codes"],
+        },
+    },
+}
+
+
+class PriceIndex:
+    """
+    Reference prices from the compiled chargemaster.
+
+    Built once per process from the memory-mapped columns:
+
+    - (code, hospital) lookups are a dictionary hit on the rows a hospital
+      lists under a CPT/HCPCS code or its own charge code.
+    - Every CPT/HCPCS code has a sorted array of prices across hospitals,
+      with p10/p50/p90 precomputed and percentile ranks answered by binary
+      search, singly or for whole batches of line items. A hospital listing
+      a code on several CDM lines, in one or several of its workbooks (e.g.
+      its CDM and its AB 1045 "Common 25" list), contributes one price, the
+      median of those lines, so it does not outweigh the others. A workbook
+      published by several hospitals counts once for each of them.
+    """
+
+    def __init__(self, chargemaster: Chargemaster):
+        self.chargemaster = chargemaster
+        cpt_codes = np.asarray(chargemaster.cpt_codes)
+        codes = np.asarray(chargemaster.codes)
+        prices = np.asarray(chargemaster.price_cents)
+        self._sources = np.asarray(chargemaster.source_index)
+
+        # Each workbook (source) belongs to the hospitals in its hospital_ids
+        self.hospital_ids = chargemaster.hospital_ids
+        self._hospital_ranks = {hospital_id: rank for rank, hospital_id in enumerate(self.hospital_ids)}
+        source_hospitals = [[self._hospital_ranks[hospital_id] for hospital_id in source["hospital_ids"]]
+                            for source in chargemaster.sources]
+        self._source_hospital_counts = np.array([len(ranks) for ranks in source_hospitals], dtype=np.int64)
+        self._source_hospital_starts = np.cumsum(self._source_hospital_counts) - self._source_hospital_counts
+        self._source_hospitals = np.array([rank for ranks in source_hospitals for rank in ranks], dtype=np.int64)
+
+        # One price per (code, hospital): the (lower) median of its rows
+        priced = (cpt_codes != "") & (prices > 0)
+        rows, hospitals = self._hospital_pairs(np.flatnonzero(priced))
+        order = np.lexsort((prices[rows], hospitals, cpt_codes[rows]))
+        rows, hospitals = rows[order], hospitals[order]
+        row_codes = cpt_codes[rows]
+        new_group = np.ones(len(rows), dtype=bool)
+        new_group[1:] = (row_codes[1:] != row_codes[:-1]) | (hospitals[1:] != hospitals[:-1])
+        group_starts = np.flatnonzero(new_group)
+        group_sizes = np.diff(np.concatenate([group_starts, [len(rows)]]))
+        hospital_rows = rows[group_starts + (group_sizes - 1) // 2]
+
+        # Distribution of each CPT/HCPCS code across hospitals
+        order = np.lexsort((prices[hospital_rows], cpt_codes[hospital_rows]))
+        self.rows = hospital_rows[order]
+        self.sorted_prices = prices[self.rows]
+        unique_codes, starts, counts = np.unique(cpt_codes[self.rows], return_index=True, return_counts=True)
+        self.codes = unique_codes
+        self.starts = starts
+        # Hospitals pricing each code, and the CDM rows behind their prices
+        self.counts = counts
+        self.row_counts = np.unique(cpt_codes[priced], return_counts=True)[1]
+        self._code_ranks = {code: rank for rank, code in enumerate(unique_codes.tolist())}
+        code_ranks = np.repeat(np.arange(len(unique_codes), dtype=np.int64), counts)
+        self.price_keys = code_ranks * PRICE_KEY_STRIDE + self.sorted_prices
+        self.percentiles: Dict[float, np.ndarray] = {q: self._quantiles(q / 100.0) for q in PERCENTILES}
+
+        # Rows per (code, hospital) under both code namespaces
+        has_cpt = cpt_codes != ""
+        key_rows = np.concatenate([np.arange(len(codes)), np.flatnonzero(has_cpt)])
+        key_codes = np.concatenate([codes, cpt_codes[has_cpt]])
+        key_rows, key_hospitals, key_codes = self._hospital_pairs(key_rows, key_codes)
+        order = np.lexsort((prices[key_rows], key_hospitals, key_codes))
+        self._hospital_rows = key_rows[order]
+        key_codes, key_hospitals = key_codes[order], key_hospitals[order]
+        boundaries = np.flatnonzero(
+            (key_codes[1:] != key_codes[:-1]) | (key_hospitals[1:] != key_hospitals[:-1])
+        ) + 1
+        group_starts = np.concatenate([[0], boundaries])
+        group_stops = np.concatenate([boundaries, [len(key_codes)]])
+        self._code_hospital_ranges: Dict[Tuple[str, int], Tuple[int, int]] = dict(zip(
+            zip(key_codes[group_starts].tolist(), key_hospitals[group_starts].tolist()),
+            zip(group_starts.tolist(), group_stops.tolist()),
+        ))
+
+    def _hospital_pairs(self, rows: np.ndarray, *columns: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """
+        Repeat each row once per hospital publishing its workbook.
+
+        Returns:
+            The repeated rows, the rank in self.hospital_ids of each one's
+            hospital, and every given per-row column repeated alike
+        """
+        sources = self._sources[rows]
+        repeats = self._source_hospital_counts[sources]
+        offsets = np.arange(int(repeats.sum())) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        hospitals = self._source_hospitals[np.repeat(self._source_hospital_starts[sources], repeats) + offsets]
+        return (np.repeat(rows, repeats), hospitals, *(np.repeat(column, repeats) for column in columns))
+
+    def _quantiles(self, q: float) -> np.ndarray:
+        # Linear interpolation between the closest ranks of every code at once
+        position = self.starts + (self.counts - 1) * q
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        return self.sorted_prices[lower] + (self.sorted_prices[upper] - self.sorted_prices[lower]) * fraction
+
+    def code_ranks(self, codes: np.ndarray) -> np.ndarray:
+        """Map codes to their rank in self.codes, -1 for codes without reference prices."""
+        return np.fromiter((self._code_ranks.get(code, -1) for code in np.asarray(codes).tolist()),
+                           dtype=np.int64, count=len(codes))
+
+    def prices_for_code(self, code: str) -> np.ndarray:
+        """Return the sorted per-hospital reference prices (cents) of a CPT/HCPCS code."""
+        rank = self._code_ranks.get(code)
+        if rank is None:
+            return self.sorted_prices[:0]
+        return self.sorted_prices[self.starts[rank]:self.starts[rank] + self.counts[rank]]
+
+    def lookup(self, code: str, hospital_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a hospital's price for a CPT/HCPCS or charge code.
+
+        Returns:
+            Dictionary with the median, min and max price in cents over the
+            hospital's rows for the code, their count and a description, or
+            None if the hospital does not list the code
+        """
+        span = self._code_hospital_ranges.get((code, self._hospital_ranks.get(hospital_id, -1)))
+        if span is None:
+            return None
+        rows = self._hospital_rows[span[0]:span[1]]
+        prices = np.asarray(self.chargemaster.price_cents)[rows]
+        return {
+            "code": code,
+            "hospital_id": hospital_id,
+            "price_cents": int(prices[(len(prices) - 1) // 2]),
+            "min_cents": int(prices[0]),
+            "max_cents": int(prices[-1]),
+            "count": len(prices),
+            "description": self.chargemaster.descriptions[int(rows[0])],
+        }
+
+    def code_percentiles(self, code: str) -> Optional[Dict[str, Any]]:
+        """Return the p10/p50/p90 reference price (cents) of a CPT/HCPCS code across hospitals."""
+        rank = self._code_ranks.get(code)
+        if rank is None:
+            return None
+        return {
+            "code": code,
+            "count": int(self.counts[rank]),
+            "rows": int(self.row_counts[rank]),
+            **{f"p{q}_cents": int(round(self.percentiles[q][rank])) for q in PERCENTILES},
+            "description": self.chargemaster.descriptions[int(self.rows[self.starts[rank]])],
+        }
+
+    def quantile_prices(self, percentile: float) -> np.ndarray:
+        """Return the given percentile price (cents) of every code in self.codes."""
+        if percentile not in self.percentiles:
+            self.percentiles[percentile] = self._quantiles(percentile / 100.0)
+        return self.percentiles[percentile]
+
+    def percentile_ranks(self, codes: np.ndarray, price_cents: np.ndarray) -> np.ndarray:
+        """
+        Percentage of hospitals' reference prices at or below each price, for
+        a batch of (code, price) pairs.
+
+        Returns:
+            float64 array, NaN where the code has no reference prices
+        """
+        return self.percentile_ranks_by_rank(self.code_ranks(codes), price_cents)
+
+    def percentile_ranks_by_rank(self, ranks: np.ndarray, price_cents: np.ndarray) -> np.ndarray:
+        """Like percentile_ranks, for codes already mapped with code_ranks."""
+        known = ranks >= 0
+        result = np.full(len(ranks), np.nan)
+        if not known.any():
+            return result
+        known_ranks = ranks[known]
+        prices = np.clip(np.asarray(price_cents, dtype=np.int64)[known], 0, PRICE_KEY_STRIDE - 1)
+        positions = np.searchsorted(self.price_keys, known_ranks * PRICE_KEY_STRIDE + prices, side="right")
+        result[known] = (positions - self.starts[known_ranks]) * 100.0 / self.counts[known_ranks]
+        return result
+
+    def percentile_rank(self, code: str, price_cents: int) -> Optional[float]:
+        """Percentage of hospitals' reference prices for a code at or below price_cents."""
+        rank = self.percentile_ranks(np.array([code]), np.array([price_cents]))[0]
+        return None if np.isnan(rank) else float(rank)
+
+
+def lookup_reference_prices(index: PriceIndex, codes: List[str], hospital_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Handler of the lookup_reference_prices tool, with prices in dollars.
+
+    Returns:
+        {"prices": [...]} with one entry per code: its percentiles across
+        hospitals and/or the given hospital's price, or "found": False
+    """
+    results = []
+    for code in codes[:50]:
+        code = str(code).strip().upper()
+        entry: Dict[str, Any] = {"code": code}
+        percentiles = index.code_percentiles(code)
+        if percentiles:
+            entry["description"] = percentiles["description"]
+            entry["hospitals"] = percentiles["count"]
+            for q in PERCENTILES:
+                entry[f"p{q}"] = round(percentiles[f"p{q}_cents"] / 100, 2)
+        if hospital_id:
+            hospital_price = index.lookup(code, hospital_id)
+            if hospital_price:
+                entry.setdefault("description", hospital_price["description"])
+                entry["hospital_price"] = round(hospital_price["price_cents"] / 100, 2)
+        entry["found"] = len(entry) > 1
+        results.append(entry)
+    return {"prices": results}
+
+
+def price_lookup_tool_handlers(index: PriceIndex) -> Dict[str, Callable[[str], str]]:
+    """Map tool names to handlers taking the JSON arguments and returning JSON content."""
+
+    def handle(arguments: str) -> str:
+        params = json.loads(arguments or "{}")
+        return json.dumps(lookup_reference_prices(index, params.get("codes", []), params.get("hospital_id")))
+
+    return {"lookup_reference_prices": handle}
+
+
+_price_index: Optional[PriceIndex] = None
+_price_index_lock = threading.Lock()
+
+
+def get_price_index() -> PriceIndex:
+    """Return the shared price index, building it from the chargemaster on first use."""
+    global _price_index
+    if _price_index is None:
+        with _price_index_lock:
+            if _price_index is None:
+                _price_index = PriceIndex(get_chargemaster())
+    return _price_index
@@ -0,0 +1,79 @@
+import math
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Most recent rewards kept in memory; older ones are only in the running
+# statistics (and the replay buffer)
+REWARD_HISTORY_SIZE = int(os.environ.get("REWARD_HISTORY_SIZE", "1000"))
+# Episodes averaged for the recent reward, e.g. for early stopping
+RECENT_REWARD_WINDOW = int(os.environ.get("RECENT_REWARD_WINDOW", "10"))
+
+
+class RewardStats:
+    """
+    Running reward statistics of a training run in constant memory.
+
+    The count, mean, variance (Welford's algorithm) and best reward are
+    updated per episode; the latest `history` rewards are kept in a NumPy
+    ring buffer for the recent average. Adding a reward and reading the
+    statistics both take constant time however long the run is. Safe to
+    update from concurrent episodes.
+    """
+
+    def __init__(self, history: int = REWARD_HISTORY_SIZE, window: int = RECENT_REWARD_WINDOW):
+        if not 0 < window <= history:
+            raise ValueError(f"Recent reward window ({window}) must be between 1 and the history size ({history})")
+        self.window = window
+        self._ring = np.zeros(history, dtype=np.float64)
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._best = -math.inf
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, reward: float) -> None:
+        """Record an episode's reward."""
+        reward = float(reward)
+        with self._lock:
+            self._ring[self._count % len(self._ring)] = reward
+            self._count += 1
+            delta = reward - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (reward - self._mean)
+            self._best = max(self._best, reward)
+
+    def recent(self, size: Optional[int] = None) -> np.ndarray:
+        """The last size rewards (at most the history size), oldest first."""
+        with self._lock:
+            return self._recent(size)
+
+    def _recent(self, size: Optional[int]) -> np.ndarray:
+        size = min(self._count, len(self._ring), len(self._ring) if size is None else size)
+        end = self._count % len(self._ring)
+        return np.take(self._ring, range(end - size, end), mode="wrap")
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Current statistics.
+
+        Returns:
+            Dictionary with "total_episodes" and, once there are episodes,
+            "avg_reward", "reward_std", "best_reward" and "recent_avg" (the
+            average of the last `window` rewards)
+        """
+        with self._lock:
+            if not self._count:
+                return {"avg_reward": 0, "total_episodes": 0}
+            return {
+                "avg_reward": self._mean,
+                "total_episodes": self._count,
+                "reward_std": math.sqrt(self._m2 / self._count),
+                "best_reward": self._best,
+                "recent_avg": float(self._recent(self.window).mean()),
+            }
@@ -1,8 +1,7 @@
-import wandb 
-import weave
 import numpy as np
-import random
-from typing import Dict, List, Any
+import asyncio
+import threading
+from typing import Dict, List, Any, Optional
 import os
 import sys
 from pathlib import Path
@@ -15,20 +14,63 @@ load_dotenv()
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
-from oai_client import analyze_medical_bill, bills_collection
-from openai import OpenAI
+from analysis_queue import AnalysisQueue
+from batch_analysis import RateLimiter, analyze_bill_document
+from episode_metrics import RewardStats
+from keyword_matcher import KeywordMatcher
+from oai_client import bills_collection, get_openai_client
+from replay_buffer import ReplayBuffer, format_rescore_report, rescore
 
-# Initialize wandb
-wandb.init(
-    project="medical-bill-rl",
-    name="bill-analysis-agent",
-    config={
-        "learning_rate": 0.001,
-        "episodes": 100,
-        "reward_threshold": 0.8,
-        "model": "gpt-4"
-    }
-)
+# Episodes run at once; the OpenAI quota (see batch_analysis.RateLimiter)
+# bounds the actual request rate
+EPISODE_CONCURRENCY = int(os.environ.get("EPISODE_CONCURRENCY", "4"))
+# Random bill ids drawn per $sample query and handed out to episodes
+BILL_SAMPLE_SIZE = int(os.environ.get("BILL_SAMPLE_SIZE", "64"))
+# Episodes logged to wandb per batch
+WANDB_LOG_BATCH = int(os.environ.get("WANDB_LOG_BATCH", "10"))
+# Replay records re-scored per batch
+RESCORE_BATCH = int(os.environ.get("RESCORE_BATCH", "4096"))
+
+# Key elements of a complete analysis; the element score is the matched
+# share of the total weight
+REWARD_TERMS = {
+    "billing error": 1.0, "overcharge": 1.0, "duplicate": 1.0, "CPT code": 1.0,
+    "insurance": 1.0, "dispute": 1.0, "legal": 1.0, "recommendation": 1.0
+}
+# Issues simulated experts find helpful, each adding its weight to the 0.5 baseline
+FEEDBACK_TERMS = {
+    "cpt code": 0.1, "duplicate": 0.1, "overcharge": 0.1, "dispute": 0.1, "legal": 0.1
+}
+
+_wandb = None
+_wandb_lock = threading.Lock()
+
+def get_wandb():
+    """
+    Return the wandb module with the training run started, importing wandb
+    and weave and initializing the run on first use, so importing this
+    module (e.g. for offline re-scoring) does not start a run.
+    """
+    global _wandb
+    if _wandb is None:
+        with _wandb_lock:
+            if _wandb is None:
+                import wandb
+                import weave
+                
+                wandb.init(
+                    project="medical-bill-rl",
+                    name="bill-analysis-agent",
+                    config={
+                        "learning_rate": 0.001,
+                        "episodes": 100,
+                        "reward_threshold": 0.8,
+                        "model": "gpt-4",
+                        "episode_concurrency": EPISODE_CONCURRENCY
+                    }
+                )
+                _wandb = wandb
+    return _wandb
 
 class MedicalBillRLAgent:
     """
@@ -36,181 +78,302 @@ class MedicalBillRLAgent:
     by getting feedback on its recommendations
     """
     
-    def __init__(self, openai_client):
+    def __init__(
+        self,
+        openai_client,
+        replay: Optional[ReplayBuffer] = None,
+        reward_terms: Dict[str, float] = REWARD_TERMS,
+        feedback_terms: Dict[str, float] = FEEDBACK_TERMS
+    ):
         self.client = openai_client
-        self.episode_rewards = []
-        self.analysis_history = []
+        # Rewards are summarized in constant memory; full analyses are only
+        # kept in the replay buffer
+        self.rewards = RewardStats()
+        # Bills are claimed from the shared queue, so several training
+        # processes never analyze the same bill
+        self.queue = AnalysisQueue(bills_collection)
+        # Ids from the last $sample query not handed out yet
+        self._sampled_ids: List[str] = []
+        self._sample_lock = threading.Lock()
+        # Every episode is recorded, so reward changes can be re-scored offline
+        self.replay = replay if replay is not None else ReplayBuffer()
+        # Reward and feedback terms are found in one pass over an analysis
+        self.keywords = KeywordMatcher([*reward_terms, *feedback_terms])
+        self.reward_weights = self.keywords.weights(reward_terms) / sum(reward_terms.values())
+        self.feedback_weights = self.keywords.weights(feedback_terms)
+        
+    def next_bill(self) -> Optional[Dict]:
+        """
+        Claim a random waiting bill for an episode, None if there is none.
+        
+        Random ids are drawn server-side in batches of BILL_SAMPLE_SIZE, so
+        choosing a bill does not read every pending bill.
+        """
+        with self._sample_lock:
+            for _ in range(2):
+                if not self._sampled_ids:
+                    self._sampled_ids = self.queue.sample(BILL_SAMPLE_SIZE)
+                while self._sampled_ids:
+                    # Another worker may have claimed a sampled bill since
+                    bill = self.queue.claim(self._sampled_ids.pop())
+                    if bill is not None:
+                        return bill
+            return None
+    
+    def with_confidence(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a confidence score to an analysis result"""
+        # Simple confidence scoring based on analysis length and specificity
+        analysis_text = result.get("analysis", "")
+        confidence = min(1.0, len(analysis_text.split()) / 200)  # Normalize by word count
         
-    def get_pending_bills(self) -> List[Dict]:
-        """Get bills that need analysis"""
-        return list(bills_collection.find({"status": "pending"}))
+        result["confidence"] = confidence
+        return result
     
-    def analyze_bill_with_confidence(self, bill_id: str) -> Dict[str, Any]:
-        """Analyze bill and return confidence score"""
+    async def analyze_bill_with_confidence(self, bill: Dict, limiter: RateLimiter) -> Dict[str, Any]:
+        """Analyze a claimed bill under the shared rate limiter and return confidence score"""
         try:
-            result = analyze_medical_bill(bill_id)
-            
-            # Simple confidence scoring based on analysis length and specificity
-            analysis_text = result.get("analysis", "")
-            confidence = min(1.0, len(analysis_text.split()) / 200)  # Normalize by word count
-            
-            result["confidence"] = confidence
-            return result
+            return self.with_confidence(await analyze_bill_document(bill, limiter, lease_owner=self.queue.owner))
         except Exception as e:
             return {"error": str(e), "confidence": 0.0}
     
-    def calculate_reward(self, analysis_result: Dict, feedback: Dict = None) -> float:
+    def keyword_matches(self, analysis_result: Dict) -> np.ndarray:
+        """Reward and feedback terms found in an analysis (see KeywordMatcher.match)"""
+        return self.keywords.match(analysis_result.get("analysis", ""))
+    
+    def calculate_reward(self, analysis_result: Dict, feedback: Dict = None, matches: Optional[np.ndarray] = None) -> float:
         """
         Calculate reward based on analysis quality
         In a real system, this would come from user feedback
+        
+        Args:
+            analysis_result: Analysis with its confidence
+            feedback: Feedback with a 0-1 "helpful" score
+            matches: keyword_matches of the analysis, if already computed
         """
         if "error" in analysis_result:
             return -1.0
         
-        # Simple reward based on confidence and analysis completeness
-        confidence = analysis_result.get("confidence", 0)
-        analysis = analysis_result.get("analysis", "")
-        
-        # Check for key elements in analysis
-        key_elements = [
-            "billing error", "overcharge", "duplicate", "CPT code", 
-            "insurance", "dispute", "legal", "recommendation"
-        ]
-        
-        element_score = sum(1 for element in key_elements if element.lower() in analysis.lower())
-        element_score = element_score / len(key_elements)  # Normalize
+        if matches is None:
+            matches = self.keyword_matches(analysis_result)
+        helpful = feedback.get("helpful", 0.5) if feedback else None  # 0-1 scale
+        return float(self.reward_scores(matches, analysis_result.get("confidence", 0), helpful))
+    
+    def reward_scores(self, matches: np.ndarray, confidence: Any, helpful: Any = None) -> Any:
+        """
+        The reward formula, for one analysis (a match vector and scalars) or
+        a batch (a match matrix with a row per analysis and arrays).
         
-        # Combine confidence and completeness
-        reward = (confidence * 0.6) + (element_score * 0.4)
+        Args:
+            matches: keyword_matches of the analyses
+            confidence: Confidence of the analyses
+            helpful: Feedback "helpful" scores, None without feedback
+        """
+        # Combine confidence and completeness (the matched key elements)
+        rewards = (confidence * 0.6) + ((matches @ self.reward_weights) * 0.4)
         
         # Add feedback bonus if available
-        if feedback:
-            feedback_score = feedback.get("helpful", 0.5)  # 0-1 scale
-            reward = (reward * 0.7) + (feedback_score * 0.3)
-        
-        return reward
+        if helpful is not None:
+            rewards = (rewards * 0.7) + (helpful * 0.3)
+        return rewards
     
-    def train_episode(self) -> float:
-        """Run one training episode"""
-        pending_bills = self.get_pending_bills()
-        
-        if not pending_bills:
-            print("No pending bills found for training")
-            return 0.0
+    def helpful_scores(self, matches: np.ndarray) -> Any:
+        """Simulated expert "helpful" scores: a 0.5 baseline plus a bonus per specific issue mentioned, capped at 1.0"""
+        return np.minimum(1.0, 0.5 + matches @ self.feedback_weights)
+    
+    def finish_episode(self, bill: Dict, analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Release the episode's bill, score its analysis and store it.
         
-        # Select random bill for this episode
-        bill = random.choice(pending_bills)
+        Returns:
+            The episode's wandb log entry, including its "episode_reward"
+        """
         bill_id = bill["id"]
-        
-        print(f"Training on bill: {bill_id}")
-        
-        # Analyze the bill
-        analysis_result = self.analyze_bill_with_confidence(bill_id)
+        if "error" in analysis_result:
+            self.queue.fail(bill, analysis_result["error"])
+        else:
+            self.queue.complete(bill_id)
         
         # Simulate feedback (in real system, this would come from users/experts)
-        simulated_feedback = self.simulate_expert_feedback(analysis_result)
+        matches = self.keyword_matches(analysis_result)
+        simulated_feedback = self.simulate_expert_feedback(analysis_result, matches)
         
         # Calculate reward
-        reward = self.calculate_reward(analysis_result, simulated_feedback)
+        reward = self.calculate_reward(analysis_result, simulated_feedback, matches)
         
-        # Log to wandb
-        wandb.log({
-            "episode_reward": reward,
-            "confidence": analysis_result.get("confidence", 0),
+        self.replay.append({
             "bill_id": bill_id,
-            "analysis_length": len(analysis_result.get("analysis", "")),
+            "prompt_hash": (analysis_result.get("analysis_stats") or {}).get("prompt_hash"),
+            "analysis": analysis_result.get("analysis", ""),
+            "confidence": analysis_result.get("confidence", 0),
+            "error": analysis_result.get("error"),
+            "feedback": simulated_feedback,
+            "reward": reward
         })
         
         # Store for learning
-        self.episode_rewards.append(reward)
-        self.analysis_history.append({
-            "bill_id": bill_id,
-            "reward": reward,
-            "analysis": analysis_result
-        })
+        self.rewards.add(reward)
         
-        return reward
+        return {
+            "episode_reward": reward,
+            "confidence": analysis_result.get("confidence", 0),
+            "bill_id": bill_id,
+            "analysis_length": len(analysis_result.get("analysis", "")),
+        }
+    
+    async def train_episode(self, bill: Dict, limiter: RateLimiter) -> Dict[str, Any]:
+        """Run one training episode on a claimed bill, returning its wandb log entry"""
+        # Analyze the bill, holding its lease so no other worker picks it up
+        with self.queue.lease(bill["id"]):
+            analysis_result = await self.analyze_bill_with_confidence(bill, limiter)
+        return await asyncio.to_thread(self.finish_episode, bill, analysis_result)
     
-    def simulate_expert_feedback(self, analysis_result: Dict) -> Dict:
+    def simulate_expert_feedback(self, analysis_result: Dict, matches: Optional[np.ndarray] = None) -> Dict:
         """
         Simulate expert feedback on the analysis
         In a real system, this would come from medical billing experts
         """
-        analysis = analysis_result.get("analysis", "").lower()
-        
-        # Simple heuristic scoring
-        helpful_score = 0.5  # baseline
-        
-        # Bonus for mentioning specific issues
-        if "cpt code" in analysis:
-            helpful_score += 0.1
-        if "duplicate" in analysis:
-            helpful_score += 0.1
-        if "overcharge" in analysis:
-            helpful_score += 0.1
-        if "dispute" in analysis:
-            helpful_score += 0.1
-        if "legal" in analysis:
-            helpful_score += 0.1
+        if matches is None:
+            matches = self.keyword_matches(analysis_result)
+        return {"helpful": float(self.helpful_scores(matches))}
+    
+    def score_batch(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Rewards of many recorded episodes at once, equal to calculate_reward
+        with simulated feedback for each.
         
-        # Cap at 1.0
-        helpful_score = min(1.0, helpful_score)
+        Args:
+            records: Replay records with "analysis", "confidence" and "error"
+            
+        Returns:
+            Array of rewards, one per record
+        """
+        matches = self.keywords.match_many([record.get("analysis") or "" for record in records])
+        confidence = np.array([record.get("confidence", 0) for record in records], dtype=np.float64)
+        failed = np.array([bool(record.get("error")) for record in records], dtype=bool)
         
-        return {"helpful": helpful_score}
+        rewards = self.reward_scores(matches, confidence, self.helpful_scores(matches))
+        rewards[failed] = -1.0
+        return rewards
     
     def get_performance_metrics(self) -> Dict:
-        """Get current performance metrics"""
-        if not self.episode_rewards:
-            return {"avg_reward": 0, "total_episodes": 0}
+        """Get current performance metrics (see RewardStats.summary)"""
+        return self.rewards.summary()
+
+async def train_concurrently(
+    agent: MedicalBillRLAgent,
+    episodes: int,
+    concurrency: int = EPISODE_CONCURRENCY,
+    reward_threshold: Optional[float] = None,
+    limiter: Optional[RateLimiter] = None
+) -> int:
+    """
+    Run up to episodes training episodes, concurrency of them at a time.
+    
+    A new episode starts as soon as one finishes, so wall-clock time falls
+    roughly linearly with concurrency until the OpenAI quota of the shared
+    rate limiter is reached. Episodes are logged to wandb from this loop in
+    batches of WANDB_LOG_BATCH, numbered in the order they finish.
+    
+    Args:
+        agent: Agent whose episodes to run
+        episodes: Maximum number of episodes
+        concurrency: Episodes run at once
+        reward_threshold: Stop starting episodes once the recent average
+            reward exceeds this
+        limiter: Rate limiter shared by all episodes (defaults to the quotas
+            configured in the environment)
         
-        return {
-            "avg_reward": np.mean(self.episode_rewards),
-            "total_episodes": len(self.episode_rewards),
-            "best_reward": max(self.episode_rewards),
-            "recent_avg": np.mean(self.episode_rewards[-10:]) if len(self.episode_rewards) >= 10 else np.mean(self.episode_rewards)
-        }
+    Returns:
+        Number of episodes run
+    """
+    limiter = limiter or RateLimiter()
+    running = set()
+    pending_logs: List[Dict[str, Any]] = []
+    started = 0
+    completed = 0
+    stopping = False
+    
+    def flush_logs():
+        for entry in pending_logs:
+            get_wandb().log(entry)
+        pending_logs.clear()
+    
+    while True:
+        while not stopping and started < episodes and len(running) < concurrency:
+            bill = await asyncio.to_thread(agent.next_bill)
+            if bill is None:
+                print("No pending bills found for training")
+                stopping = True
+                break
+            print(f"Episode {started + 1}/{episodes}: training on bill {bill['id']}")
+            running.add(asyncio.create_task(agent.train_episode(bill, limiter)))
+            started += 1
+        if not running:
+            break
+        
+        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            entry = task.result()
+            completed += 1
+            metrics = agent.get_performance_metrics()
+            pending_logs.append({
+                **entry,
+                "episode": completed,
+                "avg_reward": metrics["avg_reward"],
+                "recent_avg_reward": metrics["recent_avg"]
+            })
+            print(f"Episode reward: {entry['episode_reward']:.3f} (average {metrics['avg_reward']:.3f})")
+            
+            # Early stopping if performance is good; running episodes finish
+            if reward_threshold is not None and not stopping and metrics["recent_avg"] > reward_threshold:
+                print(f"Reached reward threshold! Stopping early at episode {completed}")
+                stopping = True
+        if len(pending_logs) >= WANDB_LOG_BATCH:
+            flush_logs()
+    
+    flush_logs()
+    return completed
 
-def run_rl_training():
-    """Main training loop"""
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def rescore_replay(replay: Optional[ReplayBuffer] = None) -> Dict[str, Any]:
+    """
+    Re-score every recorded episode with the current calculate_reward and
+    simulate_expert_feedback, without analyzing any bill again.
     
+    Returns:
+        Report of the recorded and re-scored reward distributions (see
+        replay_buffer.rescore)
+    """
+    agent = MedicalBillRLAgent(None, replay)
+    return rescore(agent.replay, agent.score_batch, RESCORE_BATCH)
+
+def run_rl_training(concurrency: int = EPISODE_CONCURRENCY):
+    """Main training loop"""
     # Create RL agent
-    agent = MedicalBillRLAgent(client)
+    agent = MedicalBillRLAgent(get_openai_client())
+    run = get_wandb()
     
-    print("Starting RL training for medical bill analysis...")
+    print(f"Starting RL training for medical bill analysis ({concurrency} episodes at a time)...")
     
-    # Training loop
-    for episode in range(wandb.config.episodes):
-        print(f"\nEpisode {episode + 1}/{wandb.config.episodes}")
-        
-        reward = agent.train_episode()
-        
-        # Log performance metrics
-        metrics = agent.get_performance_metrics()
-        wandb.log({
-            "episode": episode + 1,
-            "avg_reward": metrics["avg_reward"],
-            "recent_avg_reward": metrics["recent_avg"]
-        })
-        
-        print(f"Episode reward: {reward:.3f}")
-        print(f"Average reward: {metrics['avg_reward']:.3f}")
-        
-        # Early stopping if performance is good
-        if metrics["recent_avg"] > wandb.config.reward_threshold:
-            print(f"Reached reward threshold! Stopping early at episode {episode + 1}")
-            break
+    asyncio.run(train_concurrently(
+        agent,
+        run.config.episodes,
+        concurrency,
+        reward_threshold=run.config.reward_threshold
+    ))
     
     # Final metrics
     final_metrics = agent.get_performance_metrics()
     print(f"\nTraining completed!")
     print(f"Final average reward: {final_metrics['avg_reward']:.3f}")
-    print(f"Best reward: {final_metrics['best_reward']:.3f}")
+    print(f"Best reward: {final_metrics.get('best_reward', 0):.3f}")
     print(f"Total episodes: {final_metrics['total_episodes']}")
     
-    wandb.finish()
+    run.finish()
     return agent
 
 if __name__ == "__main__":
-    agent = run_rl_training()
\ No newline at end of file
+    # "python rl/medical_rl.py rescore" re-scores the replay buffer offline
+    if sys.argv[1:] == ["rescore"]:
+        print(format_rescore_report(rescore_replay()))
+    else:
+        agent = run_rl_training()
\ No newline at end of file
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+REPLAY_DIR = Path(os.environ.get("REPLAY_DIR", "./cache/replay"))
+# Segments are closed and a new one started past this size
+REPLAY_SEGMENT_BYTES = int(os.environ.get("REPLAY_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+
+# One index entry per record: segment number, byte offset and length
+INDEX_DTYPE = np.dtype([("segment", "<u4"), ("offset", "<u8"), ("length", "<u4")])
+INDEX_FILE = "index.bin"
+# Reward histograms of rescore reports span the reward range
+REWARD_BINS = np.linspace(-1.0, 1.0, 11)
+
+
+def segment_name(segment: int) -> str:
+    return f"segment-{segment:06d}.jsonl"
+
+
+class ReplayBuffer:
+    """
+    Append-only on-disk log of training episodes, so reward code can be
+    re-scored offline without new analyses.
+
+    Records are JSON lines in numbered segment files; index.bin holds a
+    fixed-size (segment, offset, length) entry per record, so record i is
+    read with one seek. Records are written before their index entry, and
+    bytes past the last indexed record (an interrupted append) are
+    truncated on open. One process appends to a buffer directory at a time.
+    """
+
+    def __init__(self, directory: Path = REPLAY_DIR, segment_bytes: int = REPLAY_SEGMENT_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._index_path = self.directory / INDEX_FILE
+        index = self._read_index()
+        # Drop a torn trailing index entry, then a segment tail without one
+        with open(self._index_path, "ab") as f:
+            f.truncate(len(index) * INDEX_DTYPE.itemsize)
+        if len(index):
+            last = index[-1]
+            self._segment = int(last["segment"])
+            self._segment_size = int(last["offset"]) + int(last["length"])
+        else:
+            self._segment = 0
+            self._segment_size = 0
+        segment_path = self.directory / segment_name(self._segment)
+        if segment_path.exists() and segment_path.stat().st_size > self._segment_size:
+            with open(segment_path, "ab") as f:
+                f.truncate(self._segment_size)
+        self._count = len(index)
+
+    def _read_index(self) -> np.ndarray:
+        if not self._index_path.exists():
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        data = self._index_path.read_bytes()
+        usable = len(data) - len(data) % INDEX_DTYPE.itemsize
+        return np.frombuffer(data[:usable], dtype=INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """
+        Append a record and return its position.
+
+        Records get a "recorded_at" timestamp unless they carry one.
+        """
+        record = {"recorded_at": datetime.now().isoformat(), **record}
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if self._segment_size and self._segment_size + len(line) > self.segment_bytes:
+                self._segment += 1
+                self._segment_size = 0
+            with open(self.directory / segment_name(self._segment), "ab") as f:
+                f.write(line)
+            entry = np.array([(self._segment, self._segment_size, len(line))], dtype=INDEX_DTYPE)
+            with open(self._index_path, "ab") as f:
+                f.write(entry.tobytes())
+            self._segment_size += len(line)
+            self._count += 1
+            return self._count - 1
+
+    def read(self, position: int) -> Dict[str, Any]:
+        """Read the record at a position through the index."""
+        if not 0 <= position < self._count:
+            raise IndexError(f"Replay record {position} out of range (buffer holds {self._count})")
+        entry = np.memmap(self._index_path, dtype=INDEX_DTYPE, mode="r", shape=(self._count,))[position]
+        with open(self.directory / segment_name(int(entry["segment"])), "rb") as f:
+            f.seek(int(entry["offset"]))
+            return json.loads(f.read(int(entry["length"])))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Stream all records in order, reading each segment sequentially."""
+        remaining = self._count
+        for segment in range(self._segment + 1):
+            path = self.directory / segment_name(segment)
+            if not path.exists():
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    if remaining == 0:
+                        return
+                    remaining -= 1
+                    yield json.loads(line)
+
+
+def reward_distribution(rewards: np.ndarray) -> Dict[str, Any]:
+    """Summary statistics and histogram (over REWARD_BINS) of a set of rewards."""
+    if not len(rewards):
+        return {"count": 0}
+    p10, p50, p90 = np.percentile(rewards, [10, 50, 90])
+    histogram, _ = np.histogram(np.clip(rewards, REWARD_BINS[0], REWARD_BINS[-1]), bins=REWARD_BINS)
+    return {
+        "count": int(len(rewards)),
+        "mean": round(float(rewards.mean()), 4),
+        "std": round(float(rewards.std()), 4),
+        "min": round(float(rewards.min()), 4),
+        "p10": round(float(p10), 4),
+        "p50": round(float(p50), 4),
+        "p90": round(float(p90), 4),
+        "max": round(float(rewards.max()), 4),
+        "histogram": histogram.tolist(),
+    }
+
+
+def rescore(
+    buffer: ReplayBuffer,
+    score: Callable[[List[Dict[str, Any]]], Sequence[float]],
+    batch_size: int = 4096,
+) -> Dict[str, Any]:
+    """
+    Score every record of a replay buffer with new reward code.
+
+    Args:
+        buffer: Replay buffer to read
+        score: Function returning the new rewards of a list of records
+        batch_size: Records passed to score at once
+
+    Returns:
+        Dictionary with the "recorded" and "rescored" reward distributions
+        side by side, the "mean_change", the number of records whose reward
+        "changed" and the "seconds" it took
+    """
+    start = time.perf_counter()
+    recorded: List[float] = []
+    rescored: List[float] = []
+    batch: List[Dict[str, Any]] = []
+    for record in buffer:
+        recorded.append(record.get("reward", np.nan))
+        batch.append(record)
+        if len(batch) >= batch_size:
+            rescored.extend(score(batch))
+            batch = []
+    if batch:
+        rescored.extend(score(batch))
+    old = np.array(recorded, dtype=np.float64)
+    new = np.array(rescored, dtype=np.float64)
+    known = ~np.isnan(old)
+    return {
+        "recorded": reward_distribution(old[known]),
+        "rescored": reward_distribution(new),
+        "mean_change": round(float((new[known] - old[known]).mean()), 4) if known.any() else None,
+        "changed": int((np.abs(new[known] - old[known]) > 1e-9).sum()),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def format_rescore_report(report: Dict[str, Any]) -> str:
+    """Render a rescore report as a side-by-side table."""
+    rows = ["count", "mean", "std", "min", "p10", "p50", "p90", "max"]
+    lines = [f"{'':>8}  {'recorded':>10}  {'rescored':>10}"]
+    for row in rows:
+        lines.append(f"{row:>8}  {report['recorded'].get(row, '-'):>10}  {report['rescored'].get(row, '-'):>10}")
+    lines.append("")
+    lines.append(f"{'reward':>12}  {'recorded':>10}  {'rescored':>10}")
+    for position in range(len(REWARD_BINS) - 1):
+        bucket = f"{REWARD_BINS[position]:+.1f}..{REWARD_BINS[position + 1]:+.1f}"
+        old = report["recorded"].get("histogram", [0] * (len(REWARD_BINS) - 1))[position]
+        new = report["rescored"].get("histogram", [0] * (len(REWARD_BINS) - 1))[position]
+        lines.append(f"{bucket:>12}  {old:>10}  {new:>10}")
+    lines.append("")
+    lines.append(
+        f"{report['changed']} rewards changed, mean change {report['mean_change']}, "
+        f"re-scored in {report['seconds']}s"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+# Add the repository root to the Python path so we can import chargemaster
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from chargemaster import build_chargemaster_cache, load_chargemaster
+
+CDM_HEADER = ("CDM code", "CDM description", "CPT", "Price")
+
+
+@pytest.fixture
+def build_chargemaster(tmp_path):
+    """
+    Return a function compiling small hospital chargemasters and loading the result.
+
+    It takes a dictionary of hospital id to (CDM code, description, CPT,
+    price) rows and writes one workbook per hospital.
+    """
+    def build(hospitals):
+        source_dir = tmp_path / "cdm"
+        source_dir.mkdir(exist_ok=True)
+        for hospital_id, rows in hospitals.items():
+            workbook = openpyxl.Workbook()
+            workbook.active.append(CDM_HEADER)
+            for row in rows:
+                workbook.active.append(row)
+            workbook.save(source_dir / f"{hospital_id}_CDM.xlsx")
+        build_chargemaster_cache(source_dir, tmp_path / "cache", workers=1)
+        return load_chargemaster(tmp_path / "cache")
+
+    return build
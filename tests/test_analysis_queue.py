@@ -0,0 +1,124 @@
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, Mock
+
+from pymongo.errors import OperationFailure
+
+# Add the repository root to the Python path so we can import analysis_queue
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from analysis_queue import AnalysisQueue, run_worker
+
+
+def test_claim_takes_waiting_or_expired_bills_atomically():
+    """
+    Test that a claim moves one waiting or expired bill to processing under this worker's lease.
+    """
+    collection = MagicMock()
+    collection.find_one_and_update.return_value = {"id": "bill-1", "analysis_attempts": 1}
+    queue = AnalysisQueue(collection, owner="worker-1", lease_seconds=60)
+
+    assert queue.claim()["id"] == "bill-1"
+
+    query, update = collection.find_one_and_update.call_args[0]
+    assert query["duplicate_of"] == {"$exists": False}
+    # Bills analyzed before analysis_status existed are not analyzed again
+    assert query["analysis"] == query["analysis_ref"] == {"$exists": False}
+    assert {"analysis_status": {"$in": [None, "pending"]}} in query["$or"]
+    expired = [clause for clause in query["$or"] if clause.get("analysis_status") == "processing"][0]
+    assert "$lt" in expired["lease_expires_at"]
+    assert update["$set"]["analysis_status"] == "processing"
+    assert update["$set"]["lease_owner"] == "worker-1"
+    assert update["$inc"] == {"analysis_attempts": 1}
+    assert collection.find_one_and_update.call_args[1]["sort"] == [("uploaded_at", 1)]
+
+    queue.claim("bill-2")
+    assert collection.find_one_and_update.call_args[0][0]["id"] == "bill-2"
+
+
+def test_failed_bills_are_retried_then_marked_failed():
+    """
+    Test that a failed analysis goes back to pending until it runs out of attempts.
+    """
+    collection = MagicMock()
+    queue = AnalysisQueue(collection, owner="worker-1", max_attempts=2)
+
+    assert queue.fail({"id": "bill-1", "analysis_attempts": 1}, "timeout") == "pending"
+    assert queue.fail({"id": "bill-1", "analysis_attempts": 2}, "timeout") == "failed"
+
+    query, update = collection.update_one.call_args[0]
+    assert query == {"id": "bill-1", "lease_owner": "worker-1"}
+    assert update["$set"] == {"analysis_status": "failed", "analysis_error": "timeout"}
+
+
+def test_lease_is_renewed_while_working():
+    """
+    Test that the lease on a claimed bill is extended while the analysis runs.
+    """
+    collection = MagicMock()
+    queue = AnalysisQueue(collection, owner="worker-1", lease_seconds=0.03)
+    renewed = threading.Event()
+    collection.update_one.side_effect = lambda *args, **kwargs: renewed.set() or Mock(matched_count=1)
+
+    with queue.lease("bill-1"):
+        assert renewed.wait(1)
+
+    assert collection.update_one.call_args[0][0] == {
+        "id": "bill-1",
+        "lease_owner": "worker-1",
+        "analysis_status": "processing",
+    }
+
+
+def test_wait_falls_back_to_polling_without_change_streams():
+    """
+    Test that a server without change streams is polled instead.
+    """
+    collection = MagicMock()
+    collection.watch.side_effect = OperationFailure("The $changeStream stage is only supported on replica sets")
+    queue = AnalysisQueue(collection, poll_seconds=0.01)
+
+    assert queue.wait_for_work() is False
+    assert queue.wait_for_work() is False
+    collection.watch.assert_called_once()
+
+
+def test_worker_analyzes_claimed_bills():
+    """
+    Test that the worker releases bills it analyzed and returns failed ones to the queue.
+    """
+    collection = MagicMock()
+    collection.find_one_and_update.side_effect = [
+        {"id": "bill-1", "analysis_attempts": 1},
+        {"id": "bill-2", "analysis_attempts": 1},
+    ]
+    queue = AnalysisQueue(collection, owner="worker-1")
+
+    def analyze(bill_id, lease_owner):
+        assert lease_owner == "worker-1"
+        if bill_id == "bill-2":
+            raise Exception("rate limited")
+
+    assert run_worker(queue, analyze, max_bills=2) == 2
+
+    first, second = [c[0][1] for c in collection.update_one.call_args_list]
+    assert first == {"$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    assert second["$set"]["analysis_status"] == "pending"
+
+
+def test_sample_draws_claimable_bills_on_the_server():
+    """
+    Test that random bills are drawn with a $sample stage over the claimable bills only.
+    """
+    collection = MagicMock()
+    collection.aggregate.return_value = [{"id": "bill-3"}, {"id": "bill-1"}]
+    queue = AnalysisQueue(collection)
+
+    assert queue.sample(2) == ["bill-3", "bill-1"]
+
+    match, sample, project = collection.aggregate.call_args[0][0]
+    assert match["$match"]["duplicate_of"] == {"$exists": False}
+    assert match["$match"]["analysis_ref"] == {"$exists": False}
+    assert sample == {"$sample": {"size": 2}}
+    assert project == {"$project": {"_id": 0, "id": 1}}
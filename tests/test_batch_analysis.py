@@ -0,0 +1,173 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+# The async client is created with the key from the environment
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+# Add the repository root to the Python path so we can import batch_analysis
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from batch_analysis import RateLimitedClient, RateLimiter, TokenBucket, analyze_bills
+
+
+def completion(content):
+    """
+    Build a mock chat completion response with the given content.
+    """
+    return Mock(choices=[Mock(message=Mock(content=content))])
+
+
+def rate_limit_error():
+    """
+    Build a 429 error as raised by the OpenAI client.
+    """
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after": "0"})
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_token_bucket_waits_for_refill():
+    """
+    Test that taking more tokens than are left waits for the bucket to refill.
+    """
+    async def scenario():
+        bucket = TokenBucket(rate_per_minute=600)  # 10 tokens per second
+        bucket.tokens = 0
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire(2)
+        return loop.time() - start
+
+    assert asyncio.run(scenario()) >= 0.15
+
+
+def send_from_thread(client, **params):
+    """
+    Send a request through a RateLimitedClient from a worker thread, as the analysis code does.
+    """
+    async def scenario():
+        limited = RateLimitedClient(RateLimiter(6000, 10 ** 6), asyncio.get_running_loop(), client)
+        return await asyncio.to_thread(limited.chat.completions.create, **params)
+
+    return asyncio.run(scenario())
+
+
+def test_rate_limited_client_retries_rate_limits():
+    """
+    Test that 429 responses are retried per request and the eventual response is returned.
+    """
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        side_effect=[rate_limit_error(), rate_limit_error(), completion("Analysis")]
+    )
+
+    response = send_from_thread(client, model="gpt-4", messages=[{"role": "user", "content": "Analyze"}])
+
+    assert response.choices[0].message.content == "Analysis"
+    assert client.chat.completions.create.call_count == 3
+
+
+def test_rate_limited_client_does_not_retry_client_errors():
+    """
+    Test that non-retryable errors are raised immediately.
+    """
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        send_from_thread(client, model="gpt-4", messages=[{"role": "user", "content": "Analyze"}])
+    assert client.chat.completions.create.call_count == 1
+
+
+def test_analyze_bills_runs_the_single_bill_analysis(tmp_path):
+    """
+    Test that a batch yields a result or error for every bill, analyzing each
+    through the same preparation, prompts and storage as analyze_medical_bill.
+    """
+    bill_path = tmp_path / "bill.pdf"
+    bill_path.write_bytes(b"%PDF-1.4")
+    collection = MagicMock()
+    collection.find.return_value = [{"id": "bill-1", "path": str(bill_path)}]
+    prepared = {"pages": ["Bill text"], "price_findings": None, "duplicate_findings": None}
+
+    async def collect():
+        return [
+            result
+            async for result in analyze_bills(
+                ["bill-1", "missing"],
+                limiter=RateLimiter(6000, 10 ** 6),
+                use_cache=False,
+            )
+        ]
+
+    with patch("batch_analysis.bills_collection", collection), \
+            patch("batch_analysis.reuse_canonical_analysis", return_value=None), \
+            patch("batch_analysis.prepare_bill_analysis", return_value=prepared) as mock_prepare, \
+            patch("batch_analysis.content_collection"), \
+            patch(
+                "batch_analysis.run_bill_analysis",
+                return_value={
+                    "analysis": "Analysis",
+                    "analysis_stats": {"mode": "single"},
+                    "update": ({"id": "bill-1"}, {"$set": {"analysis_status": "analyzed"}}),
+                },
+            ) as mock_run:
+        results = asyncio.run(collect())
+
+    by_id = {result["bill_id"]: result for result in results}
+    assert by_id["bill-1"] == {
+        "bill_id": "bill-1",
+        "status": "analyzed",
+        "analysis": "Analysis",
+        "analysis_stats": {"mode": "single"},
+    }
+    assert by_id["missing"]["status"] == "failed"
+    mock_prepare.assert_called_once()
+    bill_id, run_prepared, use_cache, refresh, client, save, lease_owner = mock_run.call_args[0]
+    assert (bill_id, run_prepared, use_cache, refresh, save) == ("bill-1", prepared, False, False, False)
+    assert isinstance(client, RateLimitedClient)
+    # Results are written back in one bulk write
+    writes = collection.bulk_write.call_args[0][0]
+    assert [write._filter for write in writes] == [{"id": "bill-1"}]
+
+
+def test_cached_analyses_are_not_charged_to_the_limiter():
+    """
+    Test that an analysis served from the LLM cache sends no request and takes nothing from the rate limiter.
+    """
+    collection = MagicMock()
+    collection.find.return_value = [{"id": "bill-1", "path": "bill.pdf"}]
+    prepared = {
+        "pages": ["Bill text"],
+        "price_findings": None,
+        "duplicate_findings": None,
+        "text_extraction": {},
+        "overcharge_screen": None,
+        "duplicate_screen": None,
+    }
+    limiter = MagicMock()
+    limiter.acquire = AsyncMock()
+
+    async def collect():
+        return [result async for result in analyze_bills(["bill-1"], limiter=limiter)]
+
+    with patch("batch_analysis.bills_collection", collection), \
+            patch("batch_analysis.content_collection"), \
+            patch("batch_analysis.reuse_canonical_analysis", return_value=None), \
+            patch("batch_analysis.prepare_bill_analysis", return_value=prepared), \
+            patch("oai_client.content_collection"), \
+            patch("oai_client.reference_price_index", return_value=None), \
+            patch("oai_client.response_cache") as mock_cache:
+        mock_cache.get.return_value = "Cached analysis"
+        results = asyncio.run(collect())
+
+    assert results[0]["analysis"] == "Cached analysis"
+    limiter.acquire.assert_not_called()
+    collection.bulk_write.assert_called_once()
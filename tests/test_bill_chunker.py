@@ -0,0 +1,80 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# oai_client builds an OpenAI client at import time
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+# Add the repository root to the Python path so we can import bill_chunker
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bill_chunker import count_tokens, split_bill_text
+import oai_client
+
+
+def line_items(count, prefix="99213 Office visit established patient"):
+    """
+    Build itemized bill lines of roughly equal length.
+    """
+    return "\n".join(f"{prefix} item {index} $125.00" for index in range(count))
+
+
+def test_small_pages_are_packed_together():
+    """
+    Test that whole pages are packed into one chunk when they fit the budget.
+    """
+    pages = ["Page one charges", "Page two charges", "Page three charges"]
+
+    assert split_bill_text(pages, max_tokens=100) == ["\n".join(pages)]
+
+
+def test_large_page_is_split_on_line_boundaries():
+    """
+    Test that a page over budget is split between line items and every chunk
+    stays within the token budget.
+    """
+    page = line_items(200)
+
+    chunks = split_bill_text([page], max_tokens=200)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    # No line item is cut in half
+    assert "\n".join(chunks).splitlines() == page.splitlines()
+
+
+def test_long_bill_uses_map_reduce():
+    """
+    Test that a bill over the token budget is analyzed per chunk and merged
+    in a single reduce call, with per-stage token statistics.
+    """
+    pages = [line_items(150) for _ in range(4)]
+    prompts = []
+
+    def fake_completion(client, cache, model, messages, use_cache, refresh):
+        prompts.append(messages[1]["content"])
+        return "Final report" if "Based on all parts together" in messages[1]["content"] else "Chunk notes"
+
+    with patch("oai_client.cached_chat_completion", side_effect=fake_completion), \
+            patch("oai_client.ANALYSIS_TOKEN_BUDGET", 2000), \
+            patch("oai_client.CHUNK_TOKEN_BUDGET", 1000):
+        analysis, stats = oai_client.analyze_bill_pages(pages)
+
+    assert analysis == "Final report"
+    assert stats["mode"] == "map_reduce"
+    assert stats["stages"]["map"]["calls"] == stats["chunks"] > 1
+    assert stats["stages"]["reduce"]["calls"] == 1
+    assert len(prompts) == stats["chunks"] + 1
+
+
+def test_short_bill_uses_single_prompt():
+    """
+    Test that a bill within budget is analyzed with one prompt.
+    """
+    with patch("oai_client.cached_chat_completion", return_value="Report") as mock_completion:
+        analysis, stats = oai_client.analyze_bill_pages(["99213 Office visit $125.00"])
+
+    assert analysis == "Report"
+    assert stats["mode"] == "single"
+    mock_completion.assert_called_once()
@@ -0,0 +1,175 @@
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import openpyxl
+
+# Add the repository root to the Python path so we can import chargemaster
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from chargemaster import (
+    build_chargemaster_cache,
+    cpt_code,
+    find_price_columns,
+    hospital_id_from_filename,
+    load_chargemaster,
+)
+
+
+def write_workbook(path: Path, sheets: dict) -> None:
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def test_hospital_id_from_filename():
+    """
+    Test that the OSHPD facility number is found anywhere in the file name.
+    """
+    assert hospital_id_from_filename(Path("106341006_CDM_All.xlsx")) == "106341006"
+    assert hospital_id_from_filename(Path("HCAI 106381154_UCSF CDM_ALL 06 2024.xlsx")) == "106381154"
+    assert hospital_id_from_filename(Path("AB1045 chargemaster 106370652.xlsx")) == "106370652"
+    assert hospital_id_from_filename(Path("AB1045 chargemaster 06012024.xlsx")) is None
+
+
+def test_find_price_columns_skips_sheets_without_prices():
+    """
+    Test that header rows are mapped to column roles and non-price sheets are rejected.
+    """
+    assert find_price_columns(("CDM code", "CDM description", "CPT", "Price")) == {
+        "code": 0,
+        "cpt": 2,
+        "description": 1,
+        "price": 3,
+    }
+    assert find_price_columns(("CDM Code", "Description", "IP PRICE", "OP PRICE"))["price"] == 3
+    assert find_price_columns(("Count", "Description", "Procedure Type")) is None
+
+
+def test_cpt_code_keeps_only_cpt_and_hcpcs_codes():
+    """
+    Test that internal codes and notes in CPT columns are dropped and modifiers stripped.
+    """
+    assert cpt_code("70450") == "70450"
+    assert cpt_code(70450.0) == "70450"
+    assert cpt_code("70450-26") == "70450"
+    assert cpt_code("j1885") == "J1885"
+    assert cpt_code("0001F") == "0001F"
+    assert cpt_code("00002029") == ""
+    assert cpt_code("SEE NOTE") == ""
+    assert cpt_code(None) == ""
+
+
+def test_build_and_load_memory_mapped_cache(tmp_path):
+    """
+    Test that workbooks are compiled into typed, memory-mapped columns with per-hospital row ranges.
+    """
+    source_dir = tmp_path / "cdm"
+    source_dir.mkdir()
+    write_workbook(source_dir / "106010776_CDM_ALL.xlsx", {
+        "Disclosure": [("Charge Description Master Disclosure",)],
+        "CDM_SERVICES": [
+            ("Internal ID", "Bill description", "Charge"),
+            (155571, "ROOM & BOARD - ACUTE", 5526),
+            (155572, "PULSE OX  MULTIPLE", None),
+        ],
+        "CDM_DRUGS": [
+            ("ERX ID", "Medication", "Price"),
+            (103, "ACETAMINOPHEN 120 MG", 7.18),
+        ],
+    })
+    write_workbook(source_dir / "AB1045 chargemaster 06012024.xlsx", {
+        "Form": [("HCAI Facility No: 106-370782",)],
+        "Sheet1": [
+            ("CDM code", "CDM description", "CPT", "Price"),
+            ("00000001", "HB FINE NEEDLE ASPIRATION", "10021", "1,427.50"),
+        ],
+    })
+
+    meta = build_chargemaster_cache(source_dir, tmp_path / "cache")
+    chargemaster = load_chargemaster(tmp_path / "cache")
+
+    assert meta["rows"] == len(chargemaster) == 3
+    assert chargemaster.hospital_ids == ["106010776", "106370782"]
+    assert isinstance(chargemaster.price_cents, np.memmap)
+    assert chargemaster.price_cents.tolist() == [552600, 718, 142750]
+    assert list(chargemaster.descriptions) == [
+        "ROOM & BOARD - ACUTE",
+        "ACETAMINOPHEN 120 MG",
+        "HB FINE NEEDLE ASPIRATION",
+    ]
+    assert chargemaster.row(2) == {
+        "hospital_ids": ["106370782"],
+        "code": "00000001",
+        "cpt_code": "10021",
+        "description": "HB FINE NEEDLE ASPIRATION",
+        "price_cents": 142750,
+    }
+    rows = chargemaster.hospital_rows("106010776")[0]
+    assert chargemaster.codes[rows].tolist() == ["155571", "103"]
+
+
+def test_incremental_build_skips_unchanged_and_duplicate_workbooks(tmp_path):
+    """
+    Test that identical workbooks are parsed once with aliases and unchanged files are not reparsed.
+    """
+    source_dir = tmp_path / "cdm"
+    source_dir.mkdir()
+    sheets = {"Sheet1": [("CDM code", "CDM description", "CPT", "Price"), ("1", "XRAY CHEST", "71046", 250)]}
+    write_workbook(source_dir / "AB1045 chargemaster 106370652.xlsx", sheets)
+    shutil.copy(source_dir / "AB1045 chargemaster 106370652.xlsx", source_dir / "AB1045 chargemaster 106374141.xlsx")
+
+    first = build_chargemaster_cache(source_dir, tmp_path / "cache", workers=2)
+    assert len(first["parsed"]) == 1
+    assert first["rows"] == 1
+    assert first["sources"][0]["hospital_ids"] == ["106370652", "106374141"]
+    assert load_chargemaster(tmp_path / "cache").hospital_rows("106374141") == [slice(0, 1)]
+
+    second = build_chargemaster_cache(source_dir, tmp_path / "cache", workers=2)
+    assert second["parsed"] == []
+    assert second["changed"] is False
+    assert second["build"] == first["build"]
+
+    write_workbook(source_dir / "106010776_CDM_ALL.xlsx", {
+        "CDM_SERVICES": [("Internal ID", "Bill description", "Charge"), (155571, "ROOM & BOARD", 5526)],
+    })
+    third = build_chargemaster_cache(source_dir, tmp_path / "cache", workers=2)
+    assert third["parsed"] == ["106010776_CDM_ALL.xlsx"]
+    assert third["changed"] is True
+    assert load_chargemaster(tmp_path / "cache").hospital_ids == ["106010776", "106370652", "106374141"]
+
+
+def test_common_25_header_below_facility_details_is_found_and_skips_are_recorded(tmp_path):
+    """
+    Test that a header on row 6 (AB 1045 "Common 25" layout) is recognized,
+    and workbooks without price sheets are recorded in the manifest.
+    """
+    import json
+
+    source_dir = tmp_path / "cdm"
+    source_dir.mkdir()
+    write_workbook(source_dir / "106370652_Common25.xlsx", {
+        "AB 1045 Common 25": [
+            ("Hospital Name: Example Hospital",),
+            ("HCAI Facility No: 106370652",),
+            ("Effective Date: 06/01/2024",),
+            (None,),
+            ("Top 25 Common Outpatient Procedures",),
+            ("CPT", "Description", "Price"),
+            ("71046", "RADIOLOGIC EXAM CHEST 2 VIEWS", 310),
+        ],
+    })
+    write_workbook(source_dir / "106370652_Notes.xlsx", {"Notes": [("See the CDM for prices",)]})
+
+    meta = build_chargemaster_cache(source_dir, tmp_path / "cache")
+
+    assert meta["rows"] == 1
+    assert meta["sources"][0]["files"] == ["106370652_Common25.xlsx"]
+    assert [entry["file"] for entry in meta["skipped"]] == ["106370652_Notes.xlsx"]
+    manifest = json.loads((tmp_path / "cache" / "manifest.json").read_text())
+    assert manifest["skipped"] == meta["skipped"]
@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add the repository root to the Python path so we can import database
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import database
+
+
+@pytest.fixture
+def mock_client():
+    """
+    Replace MongoClient and reset the shared client and collections.
+    """
+    with patch("pymongo.MongoClient") as client_class, \
+            patch("database._client", None), \
+            patch("database._collections", {}):
+        yield client_class
+
+
+def test_lazy_collection_connects_on_first_use(mock_client):
+    """
+    Test that declaring a collection creates no client, and using it creates one pool-tuned client.
+    """
+    bills = database.LazyCollection("bills")
+    mock_client.assert_not_called()
+
+    bills.find_one({"id": "bill-1"})
+    database.LazyCollection("bill_line_items").find_one({"bill_id": "bill-1"})
+
+    mock_client.assert_called_once()
+    assert mock_client.call_args[1]["maxPoolSize"] == database.MONGO_MAX_POOL_SIZE
+    collection = mock_client.return_value[database.MONGO_DB]["bills"]
+    collection.find_one.assert_any_call({"id": "bill-1"})
+
+
+def test_bill_indexes_are_created_once(mock_client):
+    """
+    Test that the bills collection gets its id, status and upload time indexes on first use only.
+    """
+    collection = MagicMock()
+    mock_client.return_value.__getitem__.return_value.__getitem__.return_value = collection
+
+    database.get_collection("bills")
+    database.get_collection("bills")
+
+    indexed = [c[0][0][0][0] for c in collection.create_index.call_args_list]
+    assert indexed == ["id", "status", "uploaded_at", "duplicate_of"]
+    assert collection.create_index.call_args_list[0][1] == {"unique": True}
+
+
+def test_index_failure_does_not_block_queries(mock_client):
+    """
+    Test that a failed index build is reported and the collection is still returned.
+    """
+    collection = MagicMock()
+    collection.create_index.side_effect = Exception("not primary")
+    mock_client.return_value.__getitem__.return_value.__getitem__.return_value = collection
+
+    assert database.get_collection("bills") is collection
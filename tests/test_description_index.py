@@ -0,0 +1,106 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the repository root to the Python path so we can import description_index
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from description_index import load_description_index, match_reference_codes, normalize_description
+
+
+@pytest.fixture
+def description_index(build_chargemaster):
+    """
+    Build a description index over a small chargemaster.
+    """
+    return load_description_index(build_chargemaster({"106370652": [
+        ("1", "HB CT HEAD/BRAIN W/O CONTRAST MATERIAL", "70450", 1800),
+        ("2", "CT HEAD W/WO CONTRAST", "70470", 2400),
+        ("3", "X-RAY EXAM CHEST 2 VIEWS", "71046", 400),
+        ("4", "KETOROLAC 15 MG/ML INJECTION SOLUTION", "", 12),
+        ("5", "HB KETOROLAC TROMETHAMINE PER 15 MG", "J1885", 3),
+        ("6", "ELECTROCARDIOGRAM TRACING", "93005", 300),
+        ("7", "HB ANESTHESIA PER MINUTE", "01999", 40),
+        ("8", "HB SUPPLIES FOR SPINAL", "A4550", 90),
+        ("9", "HB IV INFUSION HYDRATION EACH ADDITIONAL HOUR", "96361", 350),
+    ]}))
+
+
+def test_normalize_description_expands_abbreviations():
+    """
+    Test that abbreviations and billing prefixes are normalized.
+    """
+    assert normalize_description("HB CT HD W/O CNTRST") == ["CT", "HEAD", "WITHOUT", "CONTRAST"]
+    assert normalize_description("XR CHEST 2V") == ["XRAY", "CHEST", "2", "VIEW"]
+    assert normalize_description("KETOROLAC INJ 15MG") == ["KETOROLAC", "INJECTION", "15", "MG"]
+    # Roman level numerals match Arabic ones; "V" and "IV" elsewhere stay abbreviations
+    assert normalize_description("ED VISIT LVL III") == normalize_description("ER VISIT LEVEL 3")
+    assert normalize_description("ER LEVEL V IV PUSH") == ["EMERGENCY", "LEVEL", "5", "INTRAVENOUS", "PUSH"]
+
+
+def test_search_ranks_best_match_first(description_index):
+    """
+    Test that abbreviated bill descriptions find the right chargemaster entry.
+    """
+    assert description_index.search("CT HEAD W/O CONTRAST")[0]["cpt_codes"] == ["70450"]
+    assert description_index.search("XR CHEST 2V", k=1)[0]["description"] == "X-RAY EXAM CHEST 2 VIEWS"
+
+
+def test_misspelled_words_match_through_trigrams(description_index):
+    """
+    Test that words missing from the vocabulary fall back to trigram matching.
+    """
+    assert description_index.search("ELECTROCARDOGRAM")[0]["cpt_codes"] == ["93005"]
+
+
+def test_match_reference_codes_uses_the_best_match(description_index):
+    """
+    Test that the code comes from the best match only, never from a lower-ranked description.
+    """
+    codes = match_reference_codes(
+        description_index, ["CT HEAD W/O CONTRAST", "KETOROLAC TROMETHAMINE 15MG", "KETOROLAC INJ 15MG", "", "UNRELATED"]
+    )
+
+    assert codes == ["70450", "J1885", None, None, None]
+    assert match_reference_codes(description_index, ["NOTHING LIKE IT"]) == [None]
+
+
+def test_match_reference_codes_requires_coverage_both_ways(description_index):
+    """
+    Test that a description sharing only some of the words of a chargemaster entry takes no code.
+    """
+    assert description_index.search("SUPPLIES", k=1)[0]["description"] == "HB SUPPLIES FOR SPINAL"
+    assert description_index.search("SUPPLIES", k=1)[0]["description_coverage"] == 0.5
+
+    codes = match_reference_codes(description_index, ["ANESTHESIA", "SUPPLIES", "IV INFUSION FIRST HOUR"])
+
+    assert codes == [None, None, None]
+
+
+def test_index_is_persisted_next_to_the_build(description_index):
+    """
+    Test that the index is stored in the build directory and reloaded from it.
+    """
+    index_dir = description_index.chargemaster.build_dir / "description_index-v3"
+    assert (index_dir / "meta.json").exists()
+    reloaded = load_description_index(description_index.chargemaster)
+    assert len(reloaded) == len(description_index)
+
+
+def test_match_reference_codes_skips_ties_between_codes(build_chargemaster):
+    """
+    Test that a description scoring the same against two differently coded entries takes no code.
+    """
+    index = load_description_index(build_chargemaster({"106370652": [
+        ("1", "X-RAY EXAM CHEST 1 VIEW", "71045", 300),
+        ("2", "X-RAY EXAM CHEST 2 VIEWS", "71046", 400),
+        ("3", "EMERGENCY VISIT LEVEL 3", "99283", 900),
+        ("4", "EMERGENCY VISIT LEVEL 4", "99284", 1400),
+    ]}))
+    first, second = index.search("XR EXAM CHEST VIEWS", k=2)
+    assert first["score"] == second["score"]
+
+    codes = match_reference_codes(index, ["XR EXAM CHEST VIEWS", "XR EXAM CHEST 2 VIEWS", "ED VISIT LVL IV"])
+
+    assert codes == [None, "71046", "99284"]
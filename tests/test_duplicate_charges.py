@@ -0,0 +1,141 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Add the repository root to the Python path so we can import duplicate_charges
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from duplicate_charges import (
+    charge_key_hashes,
+    extract_bill_identity,
+    format_duplicate_findings,
+    screen_duplicate_charges,
+)
+from line_items import parse_line_items
+
+BILL_HEADER = """ST. MARY HOSPITAL
+123 Main Street, Springfield
+Patient: JANE Q DOE  DOB: 04/12/1961  Account #: 55501234
+"""
+
+DAY = datetime(2024, 1, 15)
+
+
+def columns(*items):
+    return {
+        "codes": [item[0] for item in items],
+        "descriptions": [item[1] for item in items],
+        "service_dates": [DAY] * len(items),
+        "line_charge_cents": [item[2] for item in items],
+    }
+
+
+def test_extract_bill_identity_from_header():
+    """
+    Test that the patient is keyed by name and birth date and the provider taken from the header.
+    """
+    identity = extract_bill_identity(BILL_HEADER)
+
+    assert identity["provider"] == "ST MARY HOSPITAL"
+    assert len(identity["patient_key"]) == 32
+    assert "DOE" not in identity["patient_key"]
+    # The same patient on another statement gets the same key
+    other = extract_bill_identity("Provider: Valley Clinic\nPatient Name: Jane Q. Doe   Date of Birth: 04/12/1961\n")
+    assert other["patient_key"] == identity["patient_key"]
+    assert other["provider"] == "VALLEY CLINIC"
+    assert extract_bill_identity("ST. MARY HOSPITAL\n99285 ER VISIT $100.00")["patient_key"] is None
+
+
+def test_exact_and_near_duplicate_groups():
+    """
+    Test that repeated charges form an exact group and the same service at another amount a near group.
+    """
+    items = columns(
+        ("70450", "CT HEAD", 187550),
+        ("70450", "CT HEAD", 187550),
+        ("J1885", "KETOROLAC", 4500),
+        ("J1885", "KETOROLAC", 9000),
+        ("99285", "ER VISIT", 245000),
+    )
+    screen = screen_duplicate_charges("bill-1", items, {"patient_key": None, "provider": "ST MARY"})
+
+    assert screen["checked"] == 5
+    assert (screen["exact"], screen["near"]) == (1, 1)
+    exact, near = screen["groups"]
+    assert exact["kind"] == "exact"
+    assert [item["position"] for item in exact["items"]] == [0, 1]
+    assert near["kind"] == "near"
+    assert [item["amount_cents"] for item in near["items"]] == [4500, 9000]
+
+    findings = format_duplicate_findings(screen, "bill-1")
+    assert "Exact duplicate: 70450 CT HEAD on 2024-01-15, billed 2 times" in findings
+    assert format_duplicate_findings(
+        screen_duplicate_charges("bill-1", columns(("99285", "ER VISIT", 245000)), {"patient_key": None, "provider": ""})
+    ) is None
+
+
+def test_credit_cancels_a_duplicate_copy():
+    """
+    Test that a reversal of one copy leaves no duplicate.
+    """
+    items = columns(("70450", "CT HEAD", 187550), ("70450", "CT HEAD", -187550), ("70450", "CT HEAD", 187550))
+    screen = screen_duplicate_charges("bill-1", items, {"patient_key": None, "provider": ""})
+
+    assert screen["groups"] == []
+
+
+def test_items_from_parsed_text_share_keys():
+    """
+    Test that keys ignore formatting differences between statements of the same charge.
+    """
+    first = parse_line_items("01/15/2024 70450 CT HEAD W/O CONTRAST $1,875.50")
+    second = parse_line_items("2024-01-15  70450  CT head without contrast   1,875.50")
+
+    assert charge_key_hashes(first, "ST MARY") == charge_key_hashes(second, "ST MARY")
+    assert charge_key_hashes(first, "ST MARY") != charge_key_hashes(first, "VALLEY CLINIC")
+
+
+def test_cross_bill_duplicates_through_patient_key():
+    """
+    Test that the patient's other bills are found by key hash and re-uploads of the same file are excluded.
+    """
+    earlier = columns(("70450", "CT HEAD", 187550))
+    exact, near = charge_key_hashes(earlier, "ST MARY")
+    collection = MagicMock()
+    collection.find.return_value = [
+        {"bill_id": "bill-0", **earlier, "charge_hashes": exact, "near_charge_hashes": near}
+    ]
+    identity = {"patient_key": "patient-1", "provider": "ST MARY"}
+
+    screen = screen_duplicate_charges(
+        "bill-1", columns(("70450", "CT HEAD", 187550)), identity, collection, content_hash="hash-1"
+    )
+
+    query, projection = collection.find.call_args[0]
+    assert query["patient_key"] == "patient-1"
+    assert query["bill_id"] == {"$ne": "bill-1"}
+    assert query["content_hash"] == {"$ne": "hash-1"}
+    assert {"charge_hashes": {"$in": exact}} in query["$or"]
+    assert "descriptions" in projection
+
+    stored = collection.update_one.call_args[0][1]["$set"]
+    assert stored["patient_key"] == "patient-1"
+    assert stored["charge_hashes"] == exact
+
+    assert screen["bills"] == 2
+    assert screen["exact"] == 1
+    assert [item["bill_id"] for item in screen["groups"][0]["items"]] == ["bill-1", "bill-0"]
+    assert "bill bill-0 $1,875.50" in format_duplicate_findings(screen, "bill-1")
+
+
+def test_bills_without_patient_are_not_compared():
+    """
+    Test that bills without a patient key are only checked against themselves.
+    """
+    collection = MagicMock()
+    screen_duplicate_charges(
+        "bill-1", columns(("70450", "CT HEAD", 187550)), {"patient_key": None, "provider": ""}, collection
+    )
+
+    collection.find.assert_not_called()
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the rl directory to the Python path so we can import episode_metrics
+sys.path.insert(0, str(Path(__file__).parent.parent / "rl"))
+
+from episode_metrics import RewardStats
+
+
+def test_running_statistics_match_the_full_history():
+    """
+    Test that the running statistics equal those of all rewards after the ring buffer wraps around.
+    """
+    rewards = np.random.default_rng(0).uniform(-1.0, 1.0, 2500)
+    stats = RewardStats(history=100, window=10)
+    for reward in rewards:
+        stats.add(reward)
+
+    summary = stats.summary()
+
+    assert summary["total_episodes"] == 2500
+    assert summary["avg_reward"] == pytest.approx(rewards.mean())
+    assert summary["reward_std"] == pytest.approx(rewards.std())
+    assert summary["best_reward"] == rewards.max()
+    assert summary["recent_avg"] == pytest.approx(rewards[-10:].mean())
+    assert np.array_equal(stats.recent(), rewards[-100:])
+
+
+def test_recent_average_covers_the_episodes_so_far_until_the_window_fills():
+    """
+    Test the summary before any episode and while fewer episodes than the window have run.
+    """
+    stats = RewardStats(history=20, window=10)
+    assert stats.summary() == {"avg_reward": 0, "total_episodes": 0}
+
+    for reward in (0.2, 0.4, -1.0):
+        stats.add(reward)
+
+    assert stats.summary()["recent_avg"] == pytest.approx(-0.4 / 3)
+    assert stats.recent(2).tolist() == [0.4, -1.0]
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# Cumulative import time budgets (python -X importtime) of the entry points
+# that start the upload page, analysis workers and training runs
+IMPORT_BUDGETS_MS = {
+    "oai_client": 100,
+    "streamlit_app": 100,
+    # The replay buffer and reward statistics need NumPy
+    "medical_rl": 300,
+}
+# Heavy dependencies that must not be imported until they are used
+DEFERRED_MODULES = {
+    "oai_client": ("openai", "pymongo", "numpy", "PyPDF2", "pdf2image", "PIL", "tiktoken"),
+    "streamlit_app": ("streamlit", "openai", "pymongo", "numpy", "PyPDF2", "pdf2image", "PIL"),
+    "medical_rl": ("wandb", "weave", "openai", "pymongo", "PyPDF2", "pdf2image", "PIL"),
+}
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        Dictionary of every imported module name to its cumulative import time in milliseconds
+    """
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(str(ROOT / path) for path in (".", "api", "rl")),
+        "WANDB_MODE": "disabled",
+    }
+    env.pop("OPENAI_API_KEY", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=ROOT, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS_MS))
+def test_import_stays_within_budget(module):
+    """
+    Test that importing an entry point neither loads heavy dependencies nor exceeds its time budget.
+    """
+    times = import_times(module)
+
+    loaded = [name for name in DEFERRED_MODULES[module] if name in times]
+    assert not loaded, f"{module} imports {', '.join(loaded)} at module load"
+    assert times[module] <= IMPORT_BUDGETS_MS[module], (
+        f"Importing {module} took {times[module]:.0f} ms (budget {IMPORT_BUDGETS_MS[module]} ms)"
+    )
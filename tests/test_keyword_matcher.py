@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the rl directory to the Python path so we can import keyword_matcher
+sys.path.insert(0, str(Path(__file__).parent.parent / "rl"))
+
+from keyword_matcher import KeywordMatcher
+
+
+def test_matches_like_case_insensitive_substrings():
+    """
+    Test that terms are found anywhere in the text regardless of case, like a substring check.
+    """
+    matcher = KeywordMatcher(["billing error", "CPT code", "legal", "dispute"])
+
+    found = matcher.match("Check the cpt CODE on line 3; an ILLEGAL billing error.")
+
+    assert matcher.terms == ["billing error", "cpt code", "legal", "dispute"]
+    assert found.tolist() == [True, True, True, False]
+
+
+def test_overlapping_and_nested_terms_are_all_found():
+    """
+    Test that terms sharing a start position, or overlapping a longer match, are not missed.
+    """
+    terms = ["cpt", "cpt code", "code review", "duplicate", "dup"]
+    matcher = KeywordMatcher(terms)
+    texts = ["cpt code review", "duplicate", "", "CPT", "codes"]
+
+    matches = matcher.match_many(texts)
+
+    expected = [[term in text.lower() for term in terms] for text in texts]
+    assert matches.tolist() == expected
+
+
+def test_weights_align_with_terms():
+    """
+    Test that weight vectors score match vectors with a dot product, merging terms differing in case.
+    """
+    matcher = KeywordMatcher(["overcharge", "CPT code", "cpt code"])
+    weights = matcher.weights({"cpt code": 0.1, "overcharge": 0.25})
+
+    assert len(matcher) == 2
+    assert float(matcher.match("Overcharge for CPT code 99213") @ weights) == 0.35
+    assert np.array_equal(matcher.match_many(["nothing"]) @ weights, [0.0])
@@ -0,0 +1,61 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Add the repository root to the Python path so we can import line_items
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from line_items import load_line_item_columns, parse_line_item, parse_line_items
+
+BILL_TEXT = """ST. MARY HOSPITAL
+Date of Service  Code  Description  Qty  Amount
+01/15/2024 99285 EMERGENCY DEPT VISIT HIGH SEVERITY $2,450.00
+01/15/2024 70450 CT HEAD W/O CONTRAST 1 $1,875.50
+01/15/2024 J1885 KETOROLAC INJ 15MG 2 x $45.00 $90.00
+2024-01-15 0450 EMERGENCY ROOM GENERAL $500.00
+Total charges $4,915.50
+Insurance paid ($1,200.00)
+"""
+
+
+def test_parse_line_items_builds_parallel_columns():
+    """
+    Test that charge lines become equal-length typed columns and total/payment lines are skipped.
+    """
+    columns = parse_line_items(BILL_TEXT)
+
+    assert columns["codes"] == ["99285", "70450", "J1885", "0450"]
+    assert columns["code_types"] == ["CPT", "CPT", "HCPCS", "REV"]
+    assert columns["descriptions"][1] == "CT HEAD W/O CONTRAST"
+    assert columns["quantities"] == [1, 1, 2, 1]
+    assert columns["unit_charge_cents"] == [245000, 187550, 4500, 50000]
+    assert columns["line_charge_cents"] == [245000, 187550, 9000, 50000]
+    assert columns["service_dates"] == [datetime(2024, 1, 15)] * 4
+    assert len({len(values) for values in columns.values()}) == 1
+
+
+def test_numbers_in_descriptions_are_not_quantities():
+    """
+    Test that a trailing number is only read as a quantity when the amounts confirm it.
+    """
+    item = parse_line_item("99283 ED VISIT LEVEL 5 $900.00")
+
+    assert item["quantity"] == 1
+    assert item["description"] == "ED VISIT LEVEL 5"
+
+
+def test_load_line_item_columns_concatenates_bills_into_numpy_arrays():
+    """
+    Test that stored bill documents load as typed NumPy columns ready for vectorized scans.
+    """
+    first = dict(parse_line_items(BILL_TEXT), bill_id="bill-1", count=4)
+    second = dict(parse_line_items("A4550 SURGICAL TRAY Qty: 2 $50.00"), bill_id="bill-2", count=1)
+
+    columns = load_line_item_columns([first, second])
+
+    assert list(columns["bill_ids"]) == ["bill-1"] * 4 + ["bill-2"]
+    assert columns["line_charge_cents"].dtype == np.int64
+    assert columns["line_charge_cents"].sum() == 245000 + 187550 + 9000 + 50000 + 5000
+    assert np.isnat(columns["service_dates"][-1])
@@ -0,0 +1,158 @@
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, Mock
+
+# Add the repository root to the Python path so we can import llm_cache
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from llm_cache import LLMResponseCache, cached_chat_completion, make_cache_key, stream_chat_completion
+
+MESSAGES = [
+    {"role": "system", "content": "You are a medical insurance lawyer."},
+    {"role": "user", "content": "Please analyze this medical bill."},
+]
+
+
+def make_client(content="Analysis text"):
+    """
+    Create a mock OpenAI client whose completions return the given content.
+    """
+    client = MagicMock()
+    client.chat.completions.create.return_value = Mock(
+        choices=[Mock(message=Mock(content=content))]
+    )
+    return client
+
+
+def make_collection(document=None):
+    """
+    Create a mock cache collection whose find_one returns the given document.
+    """
+    collection = MagicMock()
+    collection.find_one.return_value = document
+    return collection
+
+
+def test_cache_key_depends_on_model_prompt_and_params():
+    """
+    Test that changing the model, messages or sampling params changes the key.
+    """
+    key = make_cache_key("gpt-4", MESSAGES)
+
+    assert key == make_cache_key("gpt-4", list(MESSAGES))
+    assert key != make_cache_key("gpt-4o", MESSAGES)
+    assert key != make_cache_key("gpt-4", MESSAGES[:1])
+    assert key != make_cache_key("gpt-4", MESSAGES, temperature=0.2)
+
+
+def test_repeated_prompt_is_served_from_memory():
+    """
+    Test that the second identical request is answered from the in-process LRU.
+    """
+    client = make_client()
+    collection = make_collection()
+    cache = LLMResponseCache(collection)
+
+    first = cached_chat_completion(client, cache, "gpt-4", MESSAGES)
+    second = cached_chat_completion(client, cache, "gpt-4", MESSAGES)
+
+    assert first == second == "Analysis text"
+    client.chat.completions.create.assert_called_once()
+    collection.update_one.assert_called_once()
+    assert cache.stats()["memory"]["hits"] >= 1
+
+
+def test_mongo_hit_skips_api_call():
+    """
+    Test that a response stored in Mongo by another process is reused.
+    """
+    client = make_client()
+    cache = LLMResponseCache(make_collection({"content": "Stored analysis"}))
+
+    assert cached_chat_completion(client, cache, "gpt-4", MESSAGES) == "Stored analysis"
+    client.chat.completions.create.assert_not_called()
+
+
+def test_refresh_and_bypass_call_the_api():
+    """
+    Test that refresh replaces the cached response and use_cache=False skips the cache.
+    """
+    client = make_client("Fresh analysis")
+    collection = make_collection({"content": "Stored analysis"})
+    cache = LLMResponseCache(collection)
+
+    assert cached_chat_completion(client, cache, "gpt-4", MESSAGES, refresh=True) == "Fresh analysis"
+    collection.update_one.assert_called_once()
+
+    assert cached_chat_completion(client, cache, "gpt-4", MESSAGES, use_cache=False) == "Fresh analysis"
+    assert client.chat.completions.create.call_count == 2
+    collection.update_one.assert_called_once()
+
+
+def test_tool_calls_are_answered_before_caching_the_answer():
+    """
+    Test that tool calls are run locally, their results sent back, and only the final answer cached.
+    """
+    tool_call = Mock(id="call-1")
+    tool_call.function.name = "lookup_reference_prices"
+    tool_call.function.arguments = '{"codes": ["71046"]}'
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [
+        Mock(choices=[Mock(message=Mock(content=None, tool_calls=[tool_call]))]),
+        Mock(choices=[Mock(message=Mock(content="Chest x-ray is above p90.", tool_calls=None))]),
+    ]
+    handler = Mock(return_value='{"prices": []}')
+    cache = LLMResponseCache(make_collection())
+
+    content = cached_chat_completion(
+        client, cache, "gpt-4", MESSAGES,
+        tools=[{"type": "function"}],
+        tool_handlers={"lookup_reference_prices": handler},
+    )
+
+    assert content == "Chest x-ray is above p90."
+    handler.assert_called_once_with('{"codes": ["71046"]}')
+    follow_up = client.chat.completions.create.call_args_list[1][1]["messages"]
+    assert follow_up[-1] == {"role": "tool", "tool_call_id": "call-1", "content": '{"prices": []}'}
+    assert cache.get(make_cache_key("gpt-4", MESSAGES, tools=[{"type": "function"}])) == content
+
+
+def test_streamed_tool_calls_are_answered_and_usage_summed():
+    """
+    Test that tool calls streamed in fragments are run locally before the
+    answer is streamed, and the reported usage of both requests is summed.
+    """
+    first, second = Mock(index=0, id="call-1"), Mock(index=0, id=None)
+    first.function.name, first.function.arguments = "lookup_reference_prices", '{"codes": '
+    second.function.name, second.function.arguments = None, '["71046"]}'
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [
+        [
+            Mock(choices=[Mock(delta=Mock(content=None, tool_calls=[first]))], usage=None),
+            Mock(choices=[Mock(delta=Mock(content=None, tool_calls=[second]))], usage=None),
+            Mock(choices=[], usage=Mock(prompt_tokens=100, completion_tokens=10)),
+        ],
+        [
+            Mock(choices=[Mock(delta=Mock(content="Above ", tool_calls=None))], usage=None),
+            Mock(choices=[Mock(delta=Mock(content="p90.", tool_calls=None))], usage=None),
+            Mock(choices=[], usage=Mock(prompt_tokens=150, completion_tokens=3)),
+        ],
+    ]
+    handler = Mock(return_value='{"prices": []}')
+    usage = {}
+
+    pieces = list(stream_chat_completion(
+        client, "gpt-4", MESSAGES,
+        tool_handlers={"lookup_reference_prices": handler},
+        usage=usage,
+        tools=[{"type": "function"}],
+    ))
+
+    assert pieces == ["Above ", "p90."]
+    handler.assert_called_once_with('{"codes": ["71046"]}')
+    follow_up = client.chat.completions.create.call_args_list[1][1]
+    assert follow_up["tools"] == [{"type": "function"}]
+    assert follow_up["stream_options"] == {"include_usage": True}
+    assert follow_up["messages"][-2]["tool_calls"][0]["function"]["name"] == "lookup_reference_prices"
+    assert follow_up["messages"][-1] == {"role": "tool", "tool_call_id": "call-1", "content": '{"prices": []}'}
+    assert usage == {"prompt_tokens": 250, "completion_tokens": 13}
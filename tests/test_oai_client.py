@@ -0,0 +1,262 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+
+# oai_client builds an OpenAI client at import time
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+# Add the repository root to the Python path so we can import oai_client
+from bill_content import text_hash
+from llm_cache import make_cache_key
+from price_index import PRICE_LOOKUP_TOOL
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import oai_client
+
+EXTRACTION = {
+    "pages": ["99213 Office visit $125.00"],
+    "methods": ["text"],
+    "seconds": 0.01,
+    "content_hash": "abc123",
+    "cached": False,
+}
+
+
+def stream_chunks(pieces, usage=None):
+    """
+    Build mock streaming chunks yielding the given text pieces, followed by
+    a usage chunk if usage (prompt_tokens, completion_tokens) is given.
+    """
+    chunks = [Mock(choices=[Mock(delta=Mock(content=piece, tool_calls=None))], usage=None) for piece in pieces]
+    if usage is not None:
+        chunks.append(Mock(choices=[], usage=Mock(prompt_tokens=usage[0], completion_tokens=usage[1])))
+    return chunks
+
+
+@pytest.fixture
+def bill(tmp_path):
+    """
+    Create a bill document pointing at a file on disk.
+    """
+    bill_path = tmp_path / "bill.pdf"
+    bill_path.write_bytes(b"%PDF-1.4")
+    return {"id": "bill-1", "path": str(bill_path)}
+
+
+@pytest.fixture
+def mock_environment(bill):
+    """
+    Patch the bill and content collections, text extraction, reference
+    prices, OpenAI client and response cache.
+    """
+    collection = MagicMock()
+    collection.find_one.return_value = bill
+    with patch("oai_client.bills_collection", collection), \
+            patch("oai_client.extract_bill_text", return_value=EXTRACTION), \
+            patch("oai_client.line_items_collection"), \
+            patch("oai_client.content_collection") as content_collection, \
+            patch("oai_client.reference_price_index", return_value=None), \
+            patch("oai_client.get_openai_client") as get_client, \
+            patch("oai_client.response_cache") as mock_cache:
+        mock_client = get_client.return_value
+        mock_cache.get.return_value = None
+        # No checkpoint of an earlier stream
+        content_collection.find_one.return_value = None
+        yield collection, mock_client, mock_cache
+
+
+def test_stream_yields_tokens_and_checkpoints(mock_environment):
+    """
+    Test that the analysis is yielded piece by piece, checkpointed every N
+    tokens, and saved with time-to-first-token statistics at the end.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    mock_client.chat.completions.create.return_value = stream_chunks(["The ", "bill ", "has ", "a ", "duplicate."])
+
+    pieces = list(oai_client.analyze_medical_bill_stream("bill-1", checkpoint_tokens=2, checkpoint_seconds=60))
+
+    assert "".join(pieces) == "The bill has a duplicate."
+    content_writes = [c[0] for c in oai_client.content_collection.update_one.call_args_list]
+    checkpoints = [update["$set"]["text"] for query, update in content_writes if query["_id"] == "checkpoint:bill-1"]
+    assert checkpoints == ["The bill ", "The bill has a "]
+    # Checkpoints never grow the bill document
+    collection.update_one.assert_not_called()
+
+    final_update = collection.update_many.call_args[0][1]
+    assert final_update["$set"]["analysis_ref"]["content_id"] == text_hash("The bill has a duplicate.")
+    stored = [update for query, update in content_writes if query["_id"] == text_hash("The bill has a duplicate.")]
+    assert stored[0]["$setOnInsert"]["text"] == "The bill has a duplicate."
+    oai_client.content_collection.delete_one.assert_called_once_with({"_id": "checkpoint:bill-1"})
+    assert final_update["$set"]["analysis_stats"]["stages"]["analyze"]["time_to_first_token"] is not None
+    assert final_update["$set"]["text_extraction"]["methods"] == ["text"]
+    assert "analysis" in final_update["$unset"]
+    mock_cache.put.assert_called_once()
+
+
+def test_interrupted_stream_is_resumed(mock_environment, bill):
+    """
+    Test that a checkpointed partial analysis is yielded first and the model
+    is asked to continue from it.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    messages, _ = oai_client.prepare_final_messages(["99213 Office visit $125.00"])
+    oai_client.content_collection.find_one.return_value = {"text": "The bill "}
+    mock_client.chat.completions.create.return_value = stream_chunks(["has a duplicate."])
+
+    pieces = list(oai_client.analyze_medical_bill_stream("bill-1"))
+
+    assert pieces == ["The bill ", "has a duplicate."]
+    checkpoint_query = oai_client.content_collection.find_one.call_args_list[0][0][0]
+    assert checkpoint_query == {
+        "_id": "checkpoint:bill-1",
+        "key": oai_client.make_cache_key(oai_client.ANALYSIS_MODEL, messages),
+    }
+    sent_messages = mock_client.chat.completions.create.call_args[1]["messages"]
+    assert sent_messages[-2] == {"role": "assistant", "content": "The bill "}
+    saved_ref = collection.update_many.call_args[0][1]["$set"]["analysis_ref"]
+    assert saved_ref["content_id"] == text_hash("The bill has a duplicate.")
+
+
+def test_overcharge_screen_is_sent_to_the_model_and_saved(mock_environment):
+    """
+    Test that the reference price screen is added to the prompt and stored next to the analysis.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    screen = {
+        "percentile": 90.0,
+        "screened": 1,
+        "priced": 1,
+        "flagged": 1,
+        "excess_cents": 5000,
+        "items": [{
+            "code": "99213",
+            "description": "Office visit",
+            "quantity": 1,
+            "unit_charge_cents": 12500,
+            "median_cents": 7500,
+            "threshold_cents": 10000,
+            "percentile": 100.0,
+            "references": 4,
+            "excess_cents": 5000,
+        }],
+    }
+    mock_client.chat.completions.create.return_value = stream_chunks(["Overcharged."])
+
+    with patch("oai_client.screen_overcharges", return_value=screen):
+        list(oai_client.analyze_medical_bill_stream("bill-1"))
+
+    prompt = mock_client.chat.completions.create.call_args[1]["messages"][-1]["content"]
+    assert "REFERENCE PRICE SCREEN" in prompt
+    assert "99213 Office visit: $125.00 per unit" in prompt
+    # The bill keeps a reference and the counts; the screen goes to the content collection
+    screen_ref = collection.update_many.call_args[0][1]["$set"]["overcharge_screen_ref"]
+    assert screen_ref["flagged"] == 1 and screen_ref["excess_cents"] == 5000
+    assert "items" not in screen_ref
+    stored = [update for query, update in (c[0] for c in oai_client.content_collection.update_one.call_args_list)
+              if query["_id"] == screen_ref["content_id"]]
+    assert stored[0]["$setOnInsert"]["screen"] == screen
+
+
+def test_duplicate_screen_is_sent_to_the_model_and_saved(mock_environment):
+    """
+    Test that duplicate charge groups are added to the prompt and stored next to the analysis.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    item = {"bill_id": "bill-1", "code": "99213", "description": "Office visit", "service_date": "2024-01-15", "amount_cents": 12500}
+    screen = {"checked": 2, "bills": 1, "exact": 1, "near": 0, "groups": [{"kind": "exact", "items": [item, item]}]}
+    mock_client.chat.completions.create.return_value = stream_chunks(["Duplicate."])
+
+    with patch("oai_client.screen_duplicates", return_value=screen):
+        list(oai_client.analyze_medical_bill_stream("bill-1"))
+
+    prompt = mock_client.chat.completions.create.call_args[1]["messages"][-1]["content"]
+    assert "DUPLICATE CHARGE SCREEN" in prompt
+    assert "Exact duplicate: 99213 Office visit on 2024-01-15, billed 2 times" in prompt
+    update = collection.update_many.call_args[0][1]
+    assert update["$set"]["duplicate_screen_ref"]["exact"] == 1
+    assert "duplicate_screen" in update["$unset"]
+
+
+def test_saved_analysis_keeps_the_upload_status(mock_environment):
+    """
+    Test that storing an analysis records analysis_status without leaving the bill status enum.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    mock_client.chat.completions.create.return_value = stream_chunks(["Done."])
+
+    list(oai_client.analyze_medical_bill_stream("bill-1"))
+
+    update = collection.update_many.call_args[0][1]["$set"]
+    assert update["analysis_status"] == "analyzed"
+    assert "status" not in update
+
+
+def test_analysis_is_not_saved_after_the_lease_is_lost(mock_environment):
+    """
+    Test that a queue worker only saves its analysis while it still holds the bill's lease.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    collection.update_one.return_value = Mock(matched_count=0)
+
+    assert not oai_client.save_analysis("bill-1", "Analysis", lease_owner="worker-1")
+    assert collection.update_one.call_args[0][0] == {"id": "bill-1", "lease_owner": "worker-1"}
+    collection.update_many.assert_not_called()
+
+    collection.update_one.return_value = Mock(matched_count=1)
+    assert oai_client.save_analysis("bill-1", "Analysis", lease_owner="worker-1")
+    assert collection.update_many.call_args[0][0] == {"duplicate_of": "bill-1"}
+
+
+def test_stream_and_blocking_analyses_share_cache_keys(mock_environment):
+    """
+    Test that the streamed analysis is looked up under the key the blocking path caches it with.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    mock_cache.get.return_value = "Cached analysis."
+    messages = [{"role": "user", "content": "Analyze"}]
+
+    with patch("oai_client.reference_price_index", return_value=MagicMock()):
+        pieces = list(oai_client.analyze_medical_bill_stream("bill-1"))
+        expected_key = make_cache_key(oai_client.ANALYSIS_MODEL, messages, tools=[PRICE_LOOKUP_TOOL])
+        assert oai_client.analysis_cache_key(messages) == expected_key
+
+    assert pieces == ["Cached analysis."]
+    stream_key = mock_cache.get.call_args[0][0]
+    mock_cache.get.reset_mock()
+    with patch("oai_client.reference_price_index", return_value=MagicMock()):
+        oai_client.analyze_medical_bill("bill-1")
+    assert mock_cache.get.call_args[0][0] == stream_key
+
+
+def test_stream_sends_price_tools_and_records_reported_usage(mock_environment):
+    """
+    Test that the streamed analysis gets the price lookup tools cached
+    under its key and records the token usage the API reports.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    mock_client.chat.completions.create.return_value = stream_chunks(["The bill ", "is fine."], usage=(400, 5))
+
+    with patch("oai_client.reference_price_index", return_value=MagicMock()):
+        pieces = list(oai_client.analyze_medical_bill_stream("bill-1"))
+
+    assert "".join(pieces) == "The bill is fine."
+    assert mock_client.chat.completions.create.call_args[1]["tools"] == [PRICE_LOOKUP_TOOL]
+    stats = collection.update_many.call_args[0][1]["$set"]["analysis_stats"]["stages"]["analyze"]
+    assert (stats["prompt_tokens"], stats["completion_tokens"]) == (400, 5)
+    assert mock_cache.put.call_args[0][0] == mock_cache.get.call_args[0][0]
+
+
+def test_analysis_is_loaded_from_the_content_collection(mock_environment, bill):
+    """
+    Test that a stored analysis is read through its reference, and an inline one from older bills still loads.
+    """
+    collection, mock_client, mock_cache = mock_environment
+    bill["analysis_ref"] = {"content_id": text_hash("Stored analysis."), "bytes": 16}
+    oai_client.content_collection.find_one.return_value = {"text": "Stored analysis."}
+
+    assert oai_client.get_bill_analysis("bill-1") == "Stored analysis."
+    assert collection.find_one.call_args[0][1] == {"_id": 0, "analysis_ref": 1, "analysis": 1}
+    assert oai_client.load_bill_analysis({"analysis": "Inline analysis."}) == "Inline analysis."
@@ -0,0 +1,110 @@
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+# Add the repository root to the Python path so we can import overcharge
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from overcharge import detect_overcharges, format_overcharge_findings, screen_bills, screen_line_items
+from price_index import PriceIndex
+
+
+@pytest.fixture
+def price_index(build_chargemaster):
+    """
+    Build a price index where chest x-rays (71046) cost $100-$500.
+    """
+    return PriceIndex(build_chargemaster({
+        hospital_id: [("1", "CHEST XRAY", "71046", price)]
+        for hospital_id, price in [("106010776", 100), ("106341006", 200), ("106370652", 300), ("106380895", 500)]
+    } | {
+        # An ER visit priced by one hospital only, on several CDM lines
+        "106010999": [("2", "ER VISIT", "99285", 1000), ("3", "ER VISIT", "99285", 1200), ("4", "ER VISIT", "99285", 1500)],
+    }))
+
+
+def test_detect_overcharges_flags_items_above_the_percentile(price_index):
+    """
+    Test that only known codes priced above the threshold percentile are flagged.
+    """
+    detection = detect_overcharges(
+        price_index,
+        np.array(["71046", "71046", "99999"]),
+        np.array([90000, 20000, 90000]),
+        np.array([2, 1, 1]),
+        percentile=90,
+    )
+
+    assert detection["flagged"].tolist() == [True, False, False]
+    assert detection["median_cents"].tolist() == [25000, 25000, 0]
+    assert detection["threshold_cents"].tolist() == [44000, 44000, 0]
+    assert detection["excess_cents"].tolist() == [130000, 0, 0]
+    assert detection["percentiles"][0] == 100.0
+    assert np.isnan(detection["percentiles"][2])
+
+
+def test_codes_priced_by_one_hospital_are_not_judged(price_index):
+    """
+    Test that a single hospital's prices are not used as a reference distribution.
+    """
+    detection = detect_overcharges(price_index, np.array(["99285", "71046"]), np.array([500000, 90000]))
+
+    assert detection["flagged"].tolist() == [False, True]
+    assert detection["references"].tolist() == [0, 4]
+    assert np.isnan(detection["percentiles"][0])
+
+    relaxed = detect_overcharges(price_index, np.array(["99285"]), np.array([500000]), min_hospitals=1)
+    assert relaxed["flagged"].tolist() == [True]
+
+
+def test_screen_line_items_summarizes_and_formats_findings(price_index):
+    """
+    Test that a bill's screen lists flagged items for storage and for the prompt.
+    """
+    line_items = {
+        "codes": ["71046", "J1885"],
+        "descriptions": ["CHEST XRAY 2 VIEWS", "KETOROLAC"],
+        "quantities": [1, 2],
+        "unit_charge_cents": [125000, 4500],
+    }
+
+    screen = screen_line_items(price_index, line_items, percentile=90)
+
+    assert (screen["screened"], screen["priced"], screen["flagged"]) == (2, 1, 1)
+    assert screen["items"][0]["code"] == "71046"
+    assert screen["excess_cents"] == 100000
+    text = format_overcharge_findings(screen)
+    assert "71046 CHEST XRAY 2 VIEWS: $1,250.00 per unit" in text
+    assert "Total charged above the median: $1,000.00" in text
+    assert format_overcharge_findings(None) is None
+
+
+def test_screen_bills_writes_one_screen_per_bill(price_index):
+    """
+    Test that stored line items of several bills are screened together and written in bulk.
+    """
+    line_items_collection = MagicMock()
+    line_items_collection.find.return_value = [
+        {"bill_id": "bill-1", "count": 1, "codes": ["71046"], "descriptions": ["XRAY"],
+         "quantities": [1], "unit_charge_cents": [90000]},
+        {"bill_id": "bill-2", "count": 1, "codes": ["71046"], "descriptions": ["XRAY"],
+         "quantities": [1], "unit_charge_cents": [15000]},
+    ]
+    bills_collection = MagicMock()
+    content_collection = MagicMock()
+
+    screens = screen_bills(price_index, ["bill-1", "bill-2"], line_items_collection, bills_collection, content_collection)
+
+    assert screens["bill-1"]["flagged"] == 1
+    assert screens["bill-2"]["flagged"] == 0
+    updates = bills_collection.bulk_write.call_args[0][0]
+    assert [update._filter for update in updates] == [
+        {"$or": [{"id": "bill-1"}, {"duplicate_of": "bill-1"}]},
+        {"$or": [{"id": "bill-2"}, {"duplicate_of": "bill-2"}]},
+    ]
+    # Bills keep a reference and counts, the screens go to the content collection
+    assert updates[0]._doc["$set"]["overcharge_screen_ref"]["flagged"] == 1
+    assert content_collection.update_one.call_count == 2
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+# Add the repository root to the Python path so we can import page_cache
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from page_cache import PageCache
+from page_render import render_pages
+
+
+def test_page_cache_round_trip(tmp_path):
+    """
+    Test that stored page bytes are returned on the next lookup and misses return None.
+    """
+    cache = PageCache(cache_dir=tmp_path, max_bytes=1024 * 1024)
+    key = cache.make_key("abc123", 1, 150, "JPEG-q70-gray-1600")
+
+    assert cache.get(key) is None
+    cache.put(key, b"encoded page")
+    assert cache.get(key) == b"encoded page"
+
+    # Writes are atomic renames, so no temporary files remain
+    assert not list(tmp_path.glob("*/.tmp-*"))
+
+
+def test_page_cache_evicts_least_recently_used(tmp_path):
+    """
+    Test that the least recently used entries are evicted once the byte budget is exceeded.
+    """
+    cache = PageCache(cache_dir=tmp_path, max_bytes=250)
+    keys = [cache.make_key("abc123", page, 150, "JPEG") for page in range(1, 4)]
+
+    cache.put(keys[0], b"a" * 100)
+    cache.put(keys[1], b"b" * 100)
+    # Make page 2 the least recently used entry
+    past = time.time() - 60
+    os.utime(cache._entry_path(keys[1]), (past, past))
+    cache.put(keys[2], b"c" * 100)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == b"a" * 100
+    assert cache.get(keys[2]) == b"c" * 100
+
+
+def test_render_pages_reads_from_cache(tmp_path):
+    """
+    Test that re-rendering a bill serves pages from the cache instead of running poppler again.
+    """
+    cache = PageCache(cache_dir=tmp_path, max_bytes=1024 * 1024)
+
+    with patch("pdf2image.pdfinfo_from_path", return_value={"Pages": 2}), \
+            patch("pdf2image.convert_from_path", return_value=[Image.new("L", (100, 100))]) as mock_convert:
+        first = render_pages(Path("bill.pdf"), content_hash="abc123", cache=cache)
+        second = render_pages(Path("bill.pdf"), content_hash="abc123", cache=cache)
+
+    assert mock_convert.call_count == 2
+    assert [page["cached"] for page in first] == [False, False]
+    assert [page["cached"] for page in second] == [True, True]
+    assert [page["image"] for page in second] == [page["image"] for page in first]
@@ -0,0 +1,47 @@
+import sys
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+# Add the repository root to the Python path so we can import page_render
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from page_render import encode_page_image, render_pages, render_stats
+
+
+def test_encode_page_image_downscales_and_converts_to_grayscale():
+    """
+    Test that a large color page is downscaled to the target size and encoded
+    as a grayscale JPEG.
+    """
+    page = Image.new("RGB", (2550, 3300), color=(255, 255, 255))
+
+    encoded = encode_page_image(page, max_dimension=1000, image_format="JPEG", quality=60, grayscale=True)
+
+    with Image.open(BytesIO(encoded)) as image:
+        assert image.format == "JPEG"
+        assert image.mode == "L"
+        assert max(image.size) == 1000
+
+
+def test_render_pages_renders_every_page_up_to_the_cap():
+    """
+    Test that every page up to max_pages is rendered, in order, with per-page stats.
+    """
+    def fake_convert(file_path, dpi, first_page, last_page, grayscale):
+        return [Image.new("L", (850, 1100), color=first_page * 20)]
+
+    with patch("pdf2image.pdfinfo_from_path", return_value={"Pages": 5}), \
+            patch("pdf2image.convert_from_path", side_effect=fake_convert):
+        pages = render_pages(Path("bill.pdf"), max_pages=3, threads=2, use_cache=False)
+
+    assert [page["page"] for page in pages] == [1, 2, 3]
+    assert all(page["bytes"] == len(page["image"]) for page in pages)
+
+    stats = render_stats(pages)
+    assert stats["pages"] == 3
+    assert stats["total_bytes"] == sum(page["bytes"] for page in pages)
+    assert [page["page"] for page in stats["per_page"]] == [1, 2, 3]
+    assert "image" not in stats["per_page"][0]
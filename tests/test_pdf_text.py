@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add the repository root to the Python path so we can import pdf_text
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pdf_text import extract_pdf_pages, extraction_summary
+
+TEXT_PAGE = "99213 Office visit established patient 01/02/2024 $125.00"
+
+
+def test_only_empty_pages_are_sent_to_ocr():
+    """
+    Test that pages with a text layer are kept and only image-only pages are OCR'd.
+    """
+    ocr_page = MagicMock(return_value="OCR text for scanned page")
+
+    with patch("pdf_text.extract_text_layer", return_value=[TEXT_PAGE, "  ", TEXT_PAGE]):
+        result = extract_pdf_pages(Path("bill.pdf"), ocr_page=ocr_page, content_hash="abc123")
+
+    ocr_page.assert_called_once_with(Path("bill.pdf"), 2)
+    assert result["pages"] == [TEXT_PAGE, "OCR text for scanned page", TEXT_PAGE]
+    assert result["methods"] == ["text", "ocr", "text"]
+    assert extraction_summary(result)["ocr_pages"] == [2]
+
+
+def test_cached_text_skips_extraction():
+    """
+    Test that a previously extracted file is served from the content hash cache.
+    """
+    collection = MagicMock()
+    collection.find_one.return_value = {"pages": [TEXT_PAGE], "methods": ["text"]}
+
+    with patch("pdf_text.extract_text_layer") as mock_extract:
+        result = extract_pdf_pages(Path("bill.pdf"), cache_collection=collection, content_hash="abc123")
+
+    mock_extract.assert_not_called()
+    assert result["cached"] is True
+    assert result["pages"] == [TEXT_PAGE]
+
+
+def test_failed_ocr_is_not_cached():
+    """
+    Test that an extraction with a failed OCR page is not cached, so it is retried later.
+    """
+    collection = MagicMock()
+    collection.find_one.return_value = None
+    ocr_page = MagicMock(side_effect=Exception("Vision API unavailable"))
+
+    with patch("pdf_text.extract_text_layer", return_value=[""]):
+        result = extract_pdf_pages(Path("bill.pdf"), ocr_page=ocr_page, cache_collection=collection, content_hash="abc123")
+
+    assert result["methods"] == ["empty"]
+    collection.update_one.assert_not_called()
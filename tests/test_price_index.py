@@ -0,0 +1,88 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the repository root to the Python path so we can import price_index
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from price_index import PriceIndex, lookup_reference_prices, price_lookup_tool_handlers
+
+
+@pytest.fixture
+def price_index(build_chargemaster):
+    """
+    Build a price index over three small hospital chargemasters.
+    """
+    return PriceIndex(build_chargemaster({
+        "106010776": [("A1", "CHEST XRAY 2V", "71046", 100), ("A2", "ER VISIT 5", "99285", 2000)],
+        "106341006": [("B1", "XR CHEST", "71046", 200), ("B2", "XR CHEST PORTABLE", "71046", 300)],
+        "106370652": [("C1", "RADIOLOGIC EXAM CHEST", "71046", 500)],
+    }))
+
+
+def test_lookup_by_code_and_hospital(price_index):
+    """
+    Test that a hospital's price is found by CPT code or by its own charge code.
+    """
+    assert price_index.lookup("71046", "106341006")["price_cents"] == 20000
+    assert price_index.lookup("71046", "106341006")["max_cents"] == 30000
+    assert price_index.lookup("A2", "106010776")["price_cents"] == 200000
+    assert price_index.lookup("99285", "106341006") is None
+    assert price_index.lookup("71046", "999999999") is None
+
+
+def test_percentiles_and_percentile_ranks(price_index):
+    """
+    Test the precomputed percentiles and batched percentile ranks per code.
+    """
+    percentiles = price_index.code_percentiles("71046")
+    assert percentiles["count"] == 3
+    assert percentiles["rows"] == 4
+    assert percentiles["p50_cents"] == 20000
+    assert percentiles["p10_cents"] == 12000
+    # The hospital listing the code twice contributes one (median) price
+    assert price_index.prices_for_code("71046").tolist() == [10000, 20000, 50000]
+
+    ranks = price_index.percentile_ranks(np.array(["71046", "71046", "99285", "00000"]), np.array([25000, 90000, 2000, 100]))
+    assert ranks[1:3].tolist() == [100.0, 0.0]
+    assert round(ranks[0], 1) == 66.7
+    assert np.isnan(ranks[3])
+    assert round(price_index.percentile_rank("71046", 10000), 1) == 33.3
+
+
+def test_lookup_tool_reports_dollars(price_index):
+    """
+    Test that the tool handler returns reference prices in dollars as JSON.
+    """
+    result = lookup_reference_prices(price_index, ["71046", "nope"], hospital_id="106370652")
+    assert result["prices"][0]["p50"] == 200.0
+    assert result["prices"][0]["hospitals"] == 3
+    assert result["prices"][0]["hospital_price"] == 500.0
+    assert result["prices"][1] == {"code": "NOPE", "found": False}
+
+    handler = price_lookup_tool_handlers(price_index)["lookup_reference_prices"]
+    assert json.loads(handler('{"codes": ["99285"]}'))["prices"][0]["p90"] == 2000.0
+
+
+def test_hospital_with_several_workbooks_counts_once(build_chargemaster):
+    """
+    Test that prices are grouped by hospital, not by workbook, so a hospital
+    publishing its CDM and a Common 25 list contributes one price per code.
+    """
+    index = PriceIndex(build_chargemaster({
+        "106010776": [("A1", "CHEST XRAY 2V", "71046", 100)],
+        "106010776_COMMON25": [("25-1", "CHEST X-RAY", "71046", 300)],
+        "106341006": [("B1", "XR CHEST", "71046", 200)],
+    }))
+
+    percentiles = index.code_percentiles("71046")
+    assert percentiles["count"] == 2
+    assert percentiles["rows"] == 3
+    # The lower median of the hospital's rows across both workbooks
+    assert index.prices_for_code("71046").tolist() == [10000, 20000]
+    assert index.lookup("71046", "106010776")["max_cents"] == 30000
+    assert index.lookup("25-1", "106010776")["price_cents"] == 30000
+    assert lookup_reference_prices(index, ["71046"])["prices"][0]["hospitals"] == 2
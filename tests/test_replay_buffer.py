@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+
+# Add the rl directory to the Python path so we can import replay_buffer
+sys.path.insert(0, str(Path(__file__).parent.parent / "rl"))
+
+from replay_buffer import INDEX_FILE, ReplayBuffer, format_rescore_report, rescore
+
+
+def test_records_are_read_back_by_position_and_in_order(tmp_path):
+    """
+    Test that records spread over several segments are read through the index and streamed in order.
+    """
+    buffer = ReplayBuffer(tmp_path, segment_bytes=200)
+    for episode in range(10):
+        assert buffer.append({"bill_id": f"bill-{episode}", "reward": episode / 10}) == episode
+
+    assert len(list(tmp_path.glob("segment-*.jsonl"))) > 1
+    assert buffer.read(7)["bill_id"] == "bill-7"
+    assert [record["bill_id"] for record in buffer] == [f"bill-{episode}" for episode in range(10)]
+
+    reopened = ReplayBuffer(tmp_path, segment_bytes=200)
+    assert len(reopened) == 10
+    reopened.append({"bill_id": "bill-10"})
+    assert reopened.read(10)["bill_id"] == "bill-10"
+
+
+def test_interrupted_append_is_dropped_on_open(tmp_path):
+    """
+    Test that a record written without its index entry, and a torn index entry, are discarded.
+    """
+    buffer = ReplayBuffer(tmp_path)
+    buffer.append({"bill_id": "bill-0"})
+    with open(tmp_path / "segment-000000.jsonl", "ab") as f:
+        f.write(b'{"bill_id": "bill-1", "rew')
+    with open(tmp_path / INDEX_FILE, "ab") as f:
+        f.write(b"\x00\x01")
+
+    reopened = ReplayBuffer(tmp_path)
+    reopened.append({"bill_id": "bill-1"})
+
+    assert [record["bill_id"] for record in reopened] == ["bill-0", "bill-1"]
+
+
+def test_rescore_reports_both_distributions(tmp_path):
+    """
+    Test that re-scoring reports the recorded and new reward distributions side by side.
+    """
+    buffer = ReplayBuffer(tmp_path)
+    for reward in (0.2, 0.4, 0.6, -1.0):
+        buffer.append({"analysis": "text", "reward": reward})
+
+    report = rescore(buffer, lambda records: [max(0.0, record["reward"]) + 0.1 for record in records], batch_size=3)
+
+    assert report["recorded"]["count"] == report["rescored"]["count"] == 4
+    assert report["recorded"]["min"] == -1.0
+    assert report["rescored"]["min"] == 0.1
+    assert report["changed"] == 4
+    assert sum(report["rescored"]["histogram"]) == 4
+    assert "recorded" in format_rescore_report(report)
@@ -6,23 +6,27 @@ import uuid
 import sys
 from unittest.mock import Mock, patch, MagicMock
 
-# Mock streamlit and its dependencies before importing streamlit_app
-sys.modules['streamlit'] = MagicMock()
-
 # Add the api directory to the Python path so we can import streamlit_app
 sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
 
-from streamlit_app import save_uploaded_bill
+from streamlit_app import get_bill_status, save_uploaded_bill
+from bill_jobs import run_summary_job, submit_summary_job
+from uploads import UploadTooLargeError
 
 
 @pytest.fixture
 def mock_mongo_collection():
     """
     Mock the MongoDB collection to avoid requiring a real MongoDB connection during tests.
+    Background summary jobs are not started, so no worker outlives its test.
     """
-    with patch('streamlit_app.bills_collection') as mock_collection:
+    with patch('streamlit_app.bills_collection') as mock_collection, \
+            patch('streamlit_app.content_collection'), \
+            patch('streamlit_app.submit_summary_job'):
         # Configure the mock to have an insert_one method that returns a Mock result
         mock_collection.insert_one = MagicMock(return_value=Mock(inserted_id='mock_id'))
+        # No previously uploaded bill with the same content
+        mock_collection.find_one = MagicMock(return_value=None)
         yield mock_collection
 
 
@@ -198,3 +202,204 @@ def test_file_content_integrity(temp_bills_dir, mock_mongo_collection):
     with open(file2_path, "rb") as f:
         assert f.read() == content2
 
+
+
+def test_upload_queues_background_summary(temp_bills_dir, mock_pdf_file, mock_mongo_collection):
+    """
+    Test that the upload returns before summarization and hands the bill
+    to the background worker pool.
+    """
+    with patch('streamlit_app.submit_summary_job') as mock_submit:
+        response = save_uploaded_bill(mock_pdf_file, temp_bills_dir)
+
+    assert response["status"] == "pending"
+    assert response["summary"] is None
+    mock_submit.assert_called_once()
+    assert mock_submit.call_args[0][0] == response["id"]
+    assert mock_submit.call_args[0][1] == temp_bills_dir / f"{response['id']}.pdf"
+
+
+def test_summary_job_marks_bill_completed():
+    """
+    Test that a successful summary job moves the bill through processing to completed.
+    """
+    collection = MagicMock()
+    run_summary_job("bill-1", Path("bill.pdf"), collection, lambda path: {"summary": "Summary text"})
+
+    statuses = [c[0][1]["$set"]["status"] for c in collection.update_many.call_args_list]
+    assert statuses == ["processing", "completed"]
+    assert collection.update_many.call_args[0][1]["$set"]["summary"] == "Summary text"
+
+
+def test_summary_job_marks_bill_failed():
+    """
+    Test that a summary job records the error and marks the bill failed.
+    """
+    def failing_summarize(path):
+        raise Exception("OpenAI API key not configured")
+
+    collection = MagicMock()
+    run_summary_job("bill-1", Path("bill.pdf"), collection, failing_summarize)
+
+    final_update = collection.update_many.call_args[0][1]["$set"]
+    assert final_update["status"] == "failed"
+    assert final_update["error"] == "OpenAI API key not configured"
+
+
+def test_duplicate_upload_reuses_stored_file_and_summary(temp_bills_dir, mock_pdf_file, mock_mongo_collection):
+    """
+    Test that re-uploading identical content points the new bill at the stored
+    file and summary without writing a new file or queueing another summary.
+    """
+    canonical = {
+        "id": "canonical-id",
+        "path": "./bills/canonical-id.pdf",
+        "status": "completed",
+        "summary": "Existing summary",
+    }
+    mock_mongo_collection.find_one = MagicMock(return_value=canonical)
+
+    with patch('streamlit_app.submit_summary_job') as mock_submit:
+        response = save_uploaded_bill(mock_pdf_file, temp_bills_dir)
+
+    assert response["status"] == "completed"
+    assert response["summary"] == "Existing summary"
+    mock_submit.assert_not_called()
+    assert list(temp_bills_dir.iterdir()) == []
+
+    document = mock_mongo_collection.insert_one.call_args[0][0]
+    assert document["id"] == response["id"]
+    assert document["duplicate_of"] == "canonical-id"
+    assert document["path"] == "./bills/canonical-id.pdf"
+    assert "content_hash" not in document
+
+
+def test_duplicate_of_processing_bill_picks_up_summary_finished_during_insert(temp_bills_dir, mock_pdf_file, mock_mongo_collection):
+    """
+    Test that a re-upload of a bill whose summary finishes while the duplicate
+    is being inserted copies the finished state instead of waiting forever.
+    """
+    import streamlit_app
+
+    canonical = {"id": "canonical-id", "path": "./bills/canonical-id.pdf", "status": "processing"}
+    summary_ref = {"content_id": "summary-hash", "bytes": 16}
+    finished = {**canonical, "status": "completed", "summary_ref": summary_ref}
+    mock_mongo_collection.find_one = MagicMock(side_effect=[canonical, finished])
+    streamlit_app.content_collection.find_one.return_value = {"text": "Finished summary"}
+
+    response = save_uploaded_bill(mock_pdf_file, temp_bills_dir)
+
+    assert response["status"] == "completed"
+    assert response["summary"] == "Finished summary"
+    update = mock_mongo_collection.update_one.call_args[0]
+    assert update[0] == {"id": response["id"]}
+    assert update[1]["$set"]["status"] == "completed"
+    assert update[1]["$set"]["summary_ref"] == summary_ref
+
+
+def test_new_upload_records_content_hash(temp_bills_dir, mock_pdf_file, mock_mongo_collection):
+    """
+    Test that the first upload of a file stores its SHA-256 content hash.
+    """
+    import hashlib
+    import streamlit_app
+
+    streamlit_app._indexes_ready = False
+    save_uploaded_bill(mock_pdf_file, temp_bills_dir)
+
+    document = mock_mongo_collection.insert_one.call_args[0][0]
+    assert document["content_hash"] == hashlib.sha256(mock_pdf_file).hexdigest()
+    mock_mongo_collection.create_index.assert_called_with("content_hash", unique=True, sparse=True)
+
+
+def test_upload_streams_from_file_object(temp_bills_dir, mock_pdf_file, mock_mongo_collection):
+    """
+    Test that a file-like upload is streamed to disk in chunks and renamed into place.
+    """
+    import io
+
+    response = save_uploaded_bill(io.BytesIO(mock_pdf_file), temp_bills_dir)
+
+    saved_path = temp_bills_dir / f"{response['id']}.pdf"
+    assert saved_path.read_bytes() == mock_pdf_file
+    # No temporary files are left behind after the atomic rename
+    assert list(temp_bills_dir.iterdir()) == [saved_path]
+
+
+def test_upload_over_size_limit_is_rejected(temp_bills_dir, mock_mongo_collection):
+    """
+    Test that uploads larger than the configured maximum are rejected without
+    leaving partial files or MongoDB documents behind.
+    """
+    with pytest.raises(UploadTooLargeError):
+        save_uploaded_bill(b"x" * 2048, temp_bills_dir, max_bytes=1024)
+
+    assert list(temp_bills_dir.iterdir()) == []
+    mock_mongo_collection.insert_one.assert_not_called()
+
+
+def test_full_summary_queue_marks_bill_failed():
+    """
+    Test that a bill rejected by a full queue is marked failed instead of staying pending forever.
+    """
+    collection = MagicMock()
+    with patch('bill_jobs._slots') as mock_slots:
+        mock_slots.acquire.return_value = False
+        assert submit_summary_job("bill-1", Path("bill.pdf"), collection, lambda path: {}) is None
+
+    final_update = collection.update_many.call_args[0][1]["$set"]
+    assert final_update["status"] == "failed"
+    assert "queue is full" in final_update["error"]
+
+
+def test_legacy_analyzed_status_is_reported_as_completed(mock_mongo_collection):
+    """
+    Test that bills stored with the old "analyzed" status are shown as completed so the page stops polling.
+    """
+    mock_mongo_collection.find_one = MagicMock(return_value={"status": "analyzed", "summary": "Summary text"})
+
+    assert get_bill_status("bill-1")["status"] == "completed"
+
+
+def test_bill_status_loads_summary_and_screens_from_content(mock_mongo_collection):
+    """
+    Test that the status check reads the small bill document and loads the
+    summary and screens it references from the content collection.
+    """
+    import streamlit_app
+
+    mock_mongo_collection.find_one = MagicMock(return_value={
+        "status": "completed",
+        "summary_ref": {"content_id": "summary-hash", "bytes": 12},
+        "overcharge_screen_ref": {"content_id": "screen-hash", "bytes": 40, "flagged": 1},
+    })
+    streamlit_app.content_collection.find_one.side_effect = [
+        {"text": "Summary text"},
+        {"screen": {"flagged": 1, "items": []}},
+    ]
+
+    status = get_bill_status("bill-1")
+
+    assert status["summary"] == "Summary text"
+    assert status["overcharge_screen"] == {"flagged": 1, "items": []}
+    assert status["duplicate_screen"] is None
+    projection = mock_mongo_collection.find_one.call_args[0][1]
+    assert projection["summary_ref"] == 1 and "analysis_ref" not in projection
+
+
+def test_uploaded_bill_keeps_references_to_its_summary_and_screens():
+    """
+    Test that the background job stores the summary and screens in the content collection.
+    """
+    import streamlit_app
+
+    screen = {"screened": 2, "priced": 1, "flagged": 1, "excess_cents": 500, "items": [{"code": "99213"}]}
+    with patch("streamlit_app.content_collection") as content_collection, \
+            patch("streamlit_app.screen_bill_file", return_value={"overcharge_screen": screen}), \
+            patch("streamlit_app.summarize_bill_pages", return_value={"summary": "Summary text", "render_stats": {}}):
+        fields = streamlit_app.process_uploaded_bill(Path("bill.pdf"), "bill-1")
+
+    assert set(fields) == {"summary_ref", "render_stats", "overcharge_screen_ref"}
+    assert fields["overcharge_screen_ref"]["flagged"] == 1
+    assert "items" not in fields["overcharge_screen_ref"]
+    assert content_collection.update_one.call_count == 2